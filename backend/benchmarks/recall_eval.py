@@ -0,0 +1,337 @@
+"""
+Offline Recall Evaluation
+Recall accuracy versus latency for retrieve_memories -> rank_memories -> build_context
+
+Replays scripted conversations with facts planted at known turns, then
+asks probe questions whose answers live in those turns. Extraction uses
+the rule-based stub LLM and embeddings come from the local hashing
+provider, so runs are offline and reproducible; nothing calls Groq or HF.
+
+For each probe a memory counts as relevant if it was stored from one of
+the probe's gold turns. Reported per stage:
+
+- retrieval / ranked: recall@1/3/5 and MRR of the first relevant memory
+- context: share of probes whose built context contains a relevant memory
+- latency: p50/p95/mean per stage, plus end-to-end
+
+A scenario file (--scenarios) is a JSON list of:
+    {"name": str, "turns": int,
+     "facts": [{"turn": int, "message": str, "memory": {optional extraction override}}],
+     "filler": [str, ...] (optional),
+     "probes": [{"question": str, "turns": [int, ...]}]}
+
+Usage (from backend/):
+    python -m benchmarks.recall_eval --output recall.json
+    python -m benchmarks.recall_eval --scenarios my_scenarios.json --baseline recall_main.json
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import argparse
+import tempfile
+import statistics
+from typing import Any, Dict, List, Optional
+
+# Keep the import-time default database out of the working directory
+_TMP_DIR = tempfile.mkdtemp(prefix="recall_eval_")
+os.environ.setdefault("MEMORY_DB_PATH", os.path.join(_TMP_DIR, "import_default.json"))
+
+import logging  # noqa: E402
+
+from memory import json_store  # noqa: E402
+from memory.embeddings import build_provider, set_provider  # noqa: E402
+from memory.schema import Memory  # noqa: E402
+from memory.add_memory import store_memory  # noqa: E402
+from memory.retrieve import retrieve_memories  # noqa: E402
+from memory.rank import rank_memories  # noqa: E402
+from llm.context_builder import build_context  # noqa: E402
+from llm.stub_llm import stub_extract_memory  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+K_VALUES = (1, 3, 5)
+
+# ---------------------------------------------------------
+# BUILT-IN SCENARIOS
+# ---------------------------------------------------------
+_SMALL_TALK = [
+    "Tell me a joke", "What is gravity?", "Explain WiFi", "What is 23 * 67?",
+    "Give a random fact", "Write a poem", "Explain machine learning",
+    "What is a black hole?", "Explain blockchain", "How do airplanes fly?",
+]
+
+_DEMO_FACTS = [
+    {"turn": 3, "message": "My preferred call time is after 11 AM."},
+    {"turn": 11, "message": "I am vegetarian and I don't eat eggs."},
+    {"turn": 18, "message": "I live in Surat."},
+    {"turn": 27, "message": "I wake up at 9 AM daily."},
+    {"turn": 35, "message": "I am preparing for GATE exam."},
+    {"turn": 46, "message": "I like dark mode apps."},
+    {"turn": 55, "message": "I am allergic to peanuts."},
+    {"turn": 63, "message": "I prefer short answers."},
+    {"turn": 72, "message": "I usually sleep at 2 AM."},
+    {"turn": 85, "message": "I am working on an AI memory chatbot project."},
+]
+
+_DEMO_PROBES = [
+    {"question": "When should you call me?", "turns": [3]},
+    {"question": "Suggest a breakfast for me.", "turns": [11, 55]},
+    {"question": "Do I have any allergies?", "turns": [55]},
+    {"question": "What am I preparing for?", "turns": [35]},
+    {"question": "What project am I working on?", "turns": [85]},
+    {"question": "When do I sleep?", "turns": [72]},
+    {"question": "Where do I live?", "turns": [18]},
+    {"question": "What time do I wake up?", "turns": [27]},
+]
+
+# Same facts spread over a longer session, with unrelated facts that
+# compete for the same retrieval slots
+_DISTRACTORS = [
+    {"message": "My sister lives in Toronto.",
+     "memory": {"type": "fact", "key": "sister_location", "value": "Sister lives in Toronto", "confidence": 0.9}},
+    {"message": "I call my parents every Sunday.",
+     "memory": {"type": "habit", "key": "family_calls", "value": "Calls parents every Sunday", "confidence": 0.9}},
+    {"message": "My laptop is a ThinkPad.",
+     "memory": {"type": "fact", "key": "laptop", "value": "Uses a ThinkPad laptop", "confidence": 0.85}},
+    {"message": "I had eggs benedict on holiday once.",
+     "memory": {"type": "fact", "key": "holiday_meal", "value": "Once had eggs benedict on holiday", "confidence": 0.6}},
+    {"message": "My cousin is preparing for CAT.",
+     "memory": {"type": "fact", "key": "cousin_exam", "value": "Cousin is preparing for the CAT exam", "confidence": 0.8}},
+    {"message": "I sleep better when it rains.",
+     "memory": {"type": "fact", "key": "sleep_weather", "value": "Sleeps better when it rains", "confidence": 0.7}},
+    {"message": "My team uses Slack for project updates.",
+     "memory": {"type": "fact", "key": "team_tools", "value": "Team uses Slack for project updates", "confidence": 0.8}},
+    {"message": "I visited Mumbai last month.",
+     "memory": {"type": "fact", "key": "recent_trip", "value": "Visited Mumbai last month", "confidence": 0.8}},
+]
+
+
+def builtin_scenarios() -> List[Dict[str, Any]]:
+    long_facts = [{"turn": f["turn"] * 3, "message": f["message"]} for f in _DEMO_FACTS]
+    taken = {f["turn"] for f in long_facts}
+    distractor_turns = [t for t in range(20, 300, 13) if t not in taken]
+    for i, turn in enumerate(distractor_turns):
+        long_facts.append({"turn": turn, **_DISTRACTORS[i % len(_DISTRACTORS)]})
+
+    return [
+        {"name": "demo_100", "turns": 100, "facts": _DEMO_FACTS, "probes": _DEMO_PROBES},
+        {
+            "name": "distractors_300",
+            "turns": 300,
+            "facts": long_facts,
+            "probes": [{"question": p["question"], "turns": [t * 3 for t in p["turns"]]} for p in _DEMO_PROBES],
+        },
+    ]
+
+
+# ---------------------------------------------------------
+# REPLAY
+# ---------------------------------------------------------
+def replay_conversation(scenario: Dict[str, Any], session_id: str, rng: random.Random) -> Dict[int, List[str]]:
+    """
+    Push every turn through extraction and storage
+
+    Returns:
+        {turn: [texts of memories stored from that turn]}
+    """
+    facts = {f["turn"]: f for f in scenario["facts"]}
+    filler = scenario.get("filler") or _SMALL_TALK
+
+    for turn in range(1, scenario["turns"] + 1):
+        fact = facts.get(turn)
+        message = fact["message"] if fact else rng.choice(filler)
+        extracted = fact.get("memory") if fact and fact.get("memory") else stub_extract_memory(message)
+        if not extracted:
+            continue
+        store_memory(Memory(
+            session_id=session_id,
+            type=extracted.get("type", "fact"),
+            key=extracted.get("key", "general"),
+            value=extracted["value"],
+            confidence=float(extracted.get("confidence", 0.7)),
+            source_turn=turn,
+            last_used_turn=turn
+        ))
+
+    stored: Dict[int, List[str]] = {}
+    for mem in json_store.get_memories(session_id, is_active=True):
+        stored.setdefault(mem.get("source_turn"), []).append(mem.get("text", ""))
+    return stored
+
+
+def _first_relevant_rank(memories: List[Dict[str, Any]], gold_turns: set) -> Optional[int]:
+    for rank, mem in enumerate(memories, 1):
+        if mem.get("meta", {}).get("source_turn") in gold_turns:
+            return rank
+    return None
+
+
+def evaluate_probe(session_id: str, probe: Dict[str, Any], current_turn: int,
+                   stored: Dict[int, List[str]]) -> Dict[str, Any]:
+    gold_turns = set(probe["turns"])
+    gold_texts = [text for turn in gold_turns for text in stored.get(turn, [])]
+
+    started = time.perf_counter()
+    retrieved = retrieve_memories(session_id, probe["question"], current_turn=current_turn)
+    retrieve_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    ranked = rank_memories(retrieved, current_turn)
+    rank_ms = (time.perf_counter() - started) * 1000
+
+    started = time.perf_counter()
+    context = build_context(ranked)
+    context_ms = (time.perf_counter() - started) * 1000
+
+    return {
+        "question": probe["question"],
+        "gold_turns": sorted(gold_turns),
+        # A gold fact the extractor never stored can't be recalled; kept
+        # separate so extraction misses don't read as retrieval misses
+        "answerable": bool(gold_texts),
+        "retrieval_rank": _first_relevant_rank(retrieved, gold_turns),
+        "ranked_rank": _first_relevant_rank(ranked, gold_turns),
+        "in_context": any(text and text in context for text in gold_texts),
+        "retrieved_turns": [m.get("meta", {}).get("source_turn") for m in retrieved],
+        "latency_ms": {
+            "retrieve": round(retrieve_ms, 3),
+            "rank": round(rank_ms, 3),
+            "context": round(context_ms, 3),
+            "total": round(retrieve_ms + rank_ms + context_ms, 3),
+        },
+    }
+
+
+# ---------------------------------------------------------
+# METRICS
+# ---------------------------------------------------------
+def recall_metrics(ranks: List[Optional[int]]) -> Dict[str, float]:
+    total = len(ranks) or 1
+    metrics = {f"recall@{k}": round(sum(1 for r in ranks if r and r <= k) / total, 4) for k in K_VALUES}
+    metrics["mrr"] = round(sum(1.0 / r for r in ranks if r) / total, 4)
+    return metrics
+
+
+def latency_summary(values: List[float]) -> Dict[str, Optional[float]]:
+    if not values:
+        return {"p50_ms": None, "p95_ms": None, "mean_ms": None}
+    ordered = sorted(values)
+    return {
+        "p50_ms": round(statistics.median(ordered), 3),
+        "p95_ms": round(ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))], 3),
+        "mean_ms": round(statistics.mean(ordered), 3),
+    }
+
+
+def summarize(probes: List[Dict[str, Any]]) -> Dict[str, Any]:
+    answerable = [p for p in probes if p["answerable"]]
+    return {
+        "probes": len(probes),
+        "answerable": len(answerable),
+        "retrieval": recall_metrics([p["retrieval_rank"] for p in answerable]),
+        "ranked": recall_metrics([p["ranked_rank"] for p in answerable]),
+        "context_hit_rate": round(sum(1 for p in answerable if p["in_context"]) / (len(answerable) or 1), 4),
+        "latency": {
+            stage: latency_summary([p["latency_ms"][stage] for p in probes])
+            for stage in ("retrieve", "rank", "context", "total")
+        },
+    }
+
+
+def run_scenario(scenario: Dict[str, Any], args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    # retrieve_memories occasionally consolidates at random; keep runs repeatable
+    random.seed(args.seed)
+    session_id = f"recall_{scenario['name']}"
+
+    started = time.perf_counter()
+    stored = replay_conversation(scenario, session_id, rng)
+    replay_s = time.perf_counter() - started
+
+    current_turn = scenario["turns"] + 1
+    probes = []
+    for _ in range(args.repeat):
+        for probe in scenario["probes"]:
+            probes.append(evaluate_probe(session_id, probe, current_turn, stored))
+            current_turn += 1
+
+    return {
+        "name": scenario["name"],
+        "turns": scenario["turns"],
+        "stored_memories": sum(len(v) for v in stored.values()),
+        "replay_s": round(replay_s, 3),
+        "summary": summarize(probes),
+        # Per-probe detail only for the first pass; repeats just add timing samples
+        "probes": probes[:len(scenario["probes"])],
+    }
+
+
+def _print_summary(report: Dict[str, Any], baseline: Optional[Dict[str, Any]]) -> None:
+    previous = {s["name"]: s["summary"] for s in (baseline or {}).get("scenarios", [])}
+    for scenario in report["scenarios"]:
+        s = scenario["summary"]
+        line = (
+            f"{scenario['name']:<18} R@1 {s['ranked']['recall@1']:.2f}  R@3 {s['ranked']['recall@3']:.2f}  "
+            f"MRR {s['ranked']['mrr']:.2f}  ctx {s['context_hit_rate']:.2f}  "
+            f"p50 {s['latency']['total']['p50_ms']:.1f}ms  p95 {s['latency']['total']['p95_ms']:.1f}ms"
+        )
+        before = previous.get(scenario["name"])
+        if before:
+            line += (
+                f"   (was MRR {before['ranked']['mrr']:.2f}, ctx {before['context_hit_rate']:.2f}, "
+                f"p50 {before['latency']['total']['p50_ms']:.1f}ms)"
+            )
+        print(line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline recall@k / MRR vs latency evaluation")
+    parser.add_argument("--scenarios", help="JSON file of scenarios (default: built-in demo scenarios)")
+    parser.add_argument("--embedding-provider", default="hashing",
+                        help="Embedding provider; EMBEDDING_CACHE_MODE=replay reuses recorded real vectors")
+    parser.add_argument("--storage", default="memory", choices=["json", "cached", "memory"])
+    parser.add_argument("--repeat", type=int, default=3, help="Probe passes per scenario (latency samples)")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="recall_eval.json")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    parser.add_argument("--verbose", action="store_true", help="Show storage output during replay")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO if args.verbose else logging.WARNING)
+
+    if args.scenarios:
+        with open(args.scenarios, "r", encoding="utf-8") as f:
+            scenarios = json.load(f)
+    else:
+        scenarios = builtin_scenarios()
+
+    set_provider(build_provider(args.embedding_provider))
+    json_store.use_database(os.path.join(_TMP_DIR, "recall.json"), storage=args.storage)
+
+    report = {
+        "config": {
+            "embedding_provider": args.embedding_provider,
+            "storage": args.storage,
+            "repeat": args.repeat,
+            "seed": args.seed,
+        },
+        "scenarios": [run_scenario(scenario, args) for scenario in scenarios],
+    }
+    json_store.get_db().close()
+
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.output}", file=sys.stderr)
+
+    baseline = None
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+    _print_summary(report, baseline)
+
+
+if __name__ == "__main__":
+    main()
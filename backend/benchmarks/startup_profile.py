@@ -0,0 +1,193 @@
+"""
+Startup Profile
+Import-time breakdown and cold-start timings for the API process
+
+Each run starts a fresh interpreter with `-X importtime`, imports main
+and runs the FastAPI startup/shutdown hooks, then reports:
+
+- wall time to import main and to run the startup hooks (median of --runs)
+- self import time grouped by top-level package (fastapi, numpy, memory, ...)
+- the slowest modules by self and by cumulative time, first-party first
+
+The database, turn log and caches point at a temp directory so the
+profile never touches real data.
+
+Usage (from backend/):
+    python -m benchmarks.startup_profile --runs 5 --output startup.json
+    python -m benchmarks.startup_profile --baseline startup_main.json
+"""
+
+import os
+import sys
+import json
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from collections import defaultdict
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIRST_PARTY = ("main", "memory", "llm", "utils", "reflection")
+
+# Runs in the child interpreter; prints timings as JSON on the last line
+_CHILD = """
+import json, time
+started = time.perf_counter()
+import main
+imported = time.perf_counter()
+from starlette.testclient import TestClient
+hooks_started = time.perf_counter()
+with TestClient(main.app):
+    hooks_done = time.perf_counter()
+print(json.dumps({
+    "import_main_s": imported - started,
+    "startup_hooks_s": hooks_done - hooks_started,
+    "modules_loaded": main.MODULES_LOADED,
+}))
+"""
+
+
+# ---------------------------------------------------------
+# MEASUREMENT
+# ---------------------------------------------------------
+def run_once(workdir: str) -> Dict[str, Any]:
+    """One cold interpreter; returns timings and parsed importtime rows"""
+    env = {
+        **os.environ,
+        "PYTHONPATH": BACKEND_DIR,
+        "MEMORY_DB_PATH": os.path.join(workdir, "db.json"),
+        "TURN_LOG_DIR": os.path.join(workdir, "turn_log"),
+        "EXTRACTION_CACHE_PATH": "",
+        "LOG_LEVEL": "WARNING",
+        "WARMUP_ENABLED": "false",
+    }
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", _CHILD],
+        cwd=workdir, env=env, capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"Child interpreter failed:\n{proc.stderr[-2000:]}")
+
+    timings = json.loads(proc.stdout.strip().splitlines()[-1])
+    return {**timings, "imports": parse_importtime(proc.stderr)}
+
+
+def parse_importtime(stderr: str) -> List[Dict[str, Any]]:
+    """Rows of -X importtime output as {module, self_us, cumulative_us}"""
+    rows = []
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            head, cumulative_us, name = line.split("|", 2)
+            self_us = int(head.split(":", 1)[1])
+            cumulative_us = int(cumulative_us)
+        except ValueError:
+            continue
+        rows.append({"module": name.strip(), "self_us": self_us, "cumulative_us": cumulative_us})
+    return rows
+
+
+def summarize(rows: List[Dict[str, Any]], top: int) -> Dict[str, Any]:
+    by_package: Dict[str, int] = defaultdict(int)
+    for row in rows:
+        by_package[row["module"].split(".")[0]] += row["self_us"]
+
+    def first_party(row):
+        return row["module"].split(".")[0] in FIRST_PARTY
+
+    def ms(rows_):
+        return [
+            {"module": r["module"], "self_ms": round(r["self_us"] / 1000, 2),
+             "cumulative_ms": round(r["cumulative_us"] / 1000, 2)}
+            for r in rows_
+        ]
+
+    return {
+        "total_import_ms": round(sum(r["self_us"] for r in rows) / 1000, 1),
+        "by_package_ms": {
+            name: round(us / 1000, 1)
+            for name, us in sorted(by_package.items(), key=lambda item: -item[1])[:top]
+        },
+        "slowest_self": ms(sorted(rows, key=lambda r: -r["self_us"])[:top]),
+        "slowest_cumulative": ms(sorted(rows, key=lambda r: -r["cumulative_us"])[:top]),
+        "first_party_cumulative": ms(sorted(filter(first_party, rows), key=lambda r: -r["cumulative_us"])[:top]),
+    }
+
+
+# ---------------------------------------------------------
+# REPORTING
+# ---------------------------------------------------------
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True, cwd=BACKEND_DIR
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: Dict[str, Any]) -> None:
+    timings = report["timings"]
+    print(f"import main:   {timings['import_main_ms']:.0f} ms (median of {report['runs']})")
+    print(f"startup hooks: {timings['startup_hooks_ms']:.0f} ms")
+    print("\nSelf import time by package:")
+    for name, value in report["imports"]["by_package_ms"].items():
+        print(f"  {name:<28} {value:>8.1f} ms")
+    print("\nFirst-party modules by cumulative time:")
+    for row in report["imports"]["first_party_cumulative"]:
+        print(f"  {row['module']:<40} {row['cumulative_ms']:>8.1f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import-time and cold-start profile of main")
+    parser.add_argument("--runs", type=int, default=3, help="Cold interpreter runs (timings are medians)")
+    parser.add_argument("--top", type=int, default=15, help="Rows per ranking")
+    parser.add_argument("--output", default="startup_profile.json")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    runs = []
+    for i in range(args.runs):
+        with tempfile.TemporaryDirectory(prefix="startup_profile_") as workdir:
+            runs.append(run_once(workdir))
+            print(f"⏱️  run {i + 1}/{args.runs}: import main {runs[-1]['import_main_s'] * 1000:.0f} ms",
+                  file=sys.stderr)
+
+    # Module breakdown from the median run; the first run also pays for cold .pyc/disk caches
+    median_run = sorted(runs, key=lambda r: r["import_main_s"])[len(runs) // 2]
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": args.runs,
+        "modules_loaded": median_run["modules_loaded"],
+        "timings": {
+            "import_main_ms": round(statistics.median(r["import_main_s"] for r in runs) * 1000, 1),
+            "startup_hooks_ms": round(statistics.median(r["startup_hooks_s"] for r in runs) * 1000, 1),
+        },
+        "imports": summarize(median_run["imports"], args.top),
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+
+    print_report(report)
+    print(f"\n✅ Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nvs {args.baseline} (commit {baseline.get('commit')}):")
+        for key, after in report["timings"].items():
+            before = baseline.get("timings", {}).get(key)
+            if before:
+                print(f"  {key:<20} {before:>8.1f} -> {after:>8.1f} ms  x{after / before:.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,319 @@
+"""
+Storage Micro-benchmarks
+Times the json_store operations against synthetic sessions of 1k/10k/100k memories
+
+Each run builds a fresh database per (storage backend, size), fills one
+session with synthetic memories carrying real 384-dim vectors from the
+local hashing embedder, then times:
+
+- add_memory, get_memories, get_memory_by_key, get_memory_stats
+  (reads run with TinyDB's query cache cleared)
+- search_memories_hybrid (read path only, no access bookkeeping)
+- batch_increment_access (the bookkeeping the retrieval path does)
+- consolidate_duplicate_memories (pairwise, so capped by --consolidate-max)
+
+Storage backends are TinyDB storages selected via json_store.use_database:
+"json" (the production default), "cached" (CachingMiddleware) and "memory".
+
+Results are written as JSON; pass --baseline with an earlier result file
+to print per-operation ratios against it.
+
+Usage (from backend/):
+    python -m benchmarks.storage_bench --sizes 1000,10000 --output bench.json
+    python -m benchmarks.storage_bench --baseline bench_main.json --output bench_branch.json
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import argparse
+import platform
+import tempfile
+import statistics
+import subprocess
+from datetime import datetime
+from typing import Any, Callable, Dict, List, Optional
+
+# Keep the import-time default database out of the working directory
+_TMP_DIR = tempfile.mkdtemp(prefix="storage_bench_")
+os.environ.setdefault("MEMORY_DB_PATH", os.path.join(_TMP_DIR, "import_default.json"))
+
+import logging  # noqa: E402
+
+from memory import json_store  # noqa: E402
+from memory.embeddings import EMBEDDING_SPACE_KEY, HashingProvider, set_provider  # noqa: E402
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ("json", "cached", "memory")
+
+# ---------------------------------------------------------
+# SYNTHETIC DATA
+# ---------------------------------------------------------
+_TYPES = ["preference", "fact", "constraint", "goal"]
+_SUBJECTS = [
+    "coffee", "tea", "running", "python", "rust", "jazz", "hiking", "sushi", "chess",
+    "gardening", "cycling", "photography", "baking", "yoga", "sci-fi", "podcasts",
+    "travel", "painting", "swimming", "board games", "vinyl records", "camping",
+]
+_TEMPLATES = {
+    "preference": "The user prefers {subject} {detail} {place} {company}.",
+    "fact": "The user is into {subject} {detail}, usually {place} {company}.",
+    "constraint": "A constraint to respect: no {subject} {detail} {place}.",
+    "goal": "The user wants to get better at {subject} {detail} {company}.",
+}
+_DETAILS = [
+    "in the morning", "on weekends", "after work", "with friends", "every day",
+    "when travelling", "during winter", "at home", "twice a week", "before meetings",
+]
+_PLACES = [
+    "in Lisbon", "near the office", "in the park", "at the lake", "downtown", "in Berlin",
+    "at the gym", "by the coast", "in the mountains", "in Osaka", "at the library", "upstairs",
+]
+_COMPANY = [
+    "with their sister", "alone", "with coworkers", "with the kids", "with an old friend",
+    "with their partner", "with the running club", "with neighbours", "with a mentor", "online",
+]
+
+
+def synthetic_memories(
+    session_id: str,
+    count: int,
+    rng: random.Random,
+    embedder: HashingProvider,
+    duplicate_rate: float = 0.02
+) -> List[Dict]:
+    """
+    Build `count` stored-memory records with embeddings for one session
+
+    Write-time dedup keeps real sessions mostly free of near-duplicates,
+    so only `duplicate_rate` of records repeat an earlier text.
+    """
+    records = []
+    for i in range(count):
+        mem_type = rng.choice(_TYPES)
+        subject = rng.choice(_SUBJECTS)
+        detail = rng.choice(_DETAILS)
+        if records and rng.random() < duplicate_rate:
+            text = rng.choice(records)["text"]
+        else:
+            text = _TEMPLATES[mem_type].format(
+                subject=subject, detail=detail, place=rng.choice(_PLACES), company=rng.choice(_COMPANY)
+            )
+        records.append({
+            "id": str(uuid.uuid4()),
+            "session_id": session_id,
+            "type": mem_type,
+            # ~1 in 4 keys repeat, like updated preferences do
+            "key": f"{subject.replace(' ', '_')}_{i % max(1, (count * 3) // 4)}",
+            "value": f"{subject} {detail}",
+            "text": text,
+            "embedding": None,
+            "pending_embedding": False,
+            "confidence": round(rng.uniform(0.6, 1.0), 2),
+            "importance_score": round(rng.uniform(0.2, 1.0), 2),
+            "source_turn": i + 1,
+            "last_used_turn": i + 1,
+            "access_count": rng.randint(0, 5),
+            "is_active": True,
+            "created_at": datetime.utcnow().isoformat(),
+            "updated_at": "",
+        })
+
+    # One vector per distinct text, shared by the records using it
+    texts = sorted({r["text"] for r in records})
+    vectors = dict(zip(texts, embedder.embed(texts).tolist()))
+    for record in records:
+        record["embedding"] = vectors[record["text"]]
+        record[EMBEDDING_SPACE_KEY] = embedder.space
+    return records
+
+
+# ---------------------------------------------------------
+# TIMING
+# ---------------------------------------------------------
+def _cold() -> None:
+    # TinyDB caches query results until the next write; production reads
+    # mostly follow a write, so time them uncached
+    json_store.get_table().clear_cache()
+
+
+def time_op(fn: Callable[[int], Any], runs: int, before: Optional[Callable[[], None]] = None) -> Dict[str, Any]:
+    """Call fn(i) `runs` times and summarize wall time in ms"""
+    samples = []
+    for i in range(runs):
+        if before:
+            before()
+        started = time.perf_counter()
+        fn(i)
+        samples.append((time.perf_counter() - started) * 1000)
+    return {
+        "runs": runs,
+        "mean_ms": round(statistics.mean(samples), 3),
+        "p50_ms": round(statistics.median(samples), 3),
+        "min_ms": round(min(samples), 3),
+        "max_ms": round(max(samples), 3),
+    }
+
+
+def bench_size(backend: str, size: int, args: argparse.Namespace, embedder: HashingProvider) -> Dict[str, Any]:
+    rng = random.Random(args.seed + size)
+    session_id = f"bench_{size}"
+    path = os.path.join(_TMP_DIR, f"{backend}_{size}.json")
+    if os.path.exists(path):
+        os.remove(path)
+    json_store.use_database(path, storage=backend)
+
+    started = time.perf_counter()
+    records = synthetic_memories(session_id, size, rng, embedder, args.duplicate_rate)
+    generate_s = time.perf_counter() - started
+
+    started = time.perf_counter()
+    json_store.add_memories(records)
+    populate_s = time.perf_counter() - started
+
+    keys = [r["key"] for r in rng.sample(records, min(len(records), args.repeat))]
+    ids = [r["id"] for r in records]
+    queries = [
+        "what does the user like to drink in the morning",
+        "which sports does the user do on weekends",
+        "what should I avoid suggesting",
+        "hobbies the user wants to improve at",
+    ]
+    new_records = synthetic_memories(session_id, args.writes, rng, embedder)
+
+    ops = {
+        "add_memory": time_op(lambda i: json_store.add_memory(new_records[i]), args.writes),
+        "get_memories": time_op(lambda i: json_store.get_memories(session_id), args.repeat, _cold),
+        "get_memories_limit20": time_op(
+            lambda i: json_store.get_memories(session_id, limit=20), args.repeat, _cold
+        ),
+        "get_memory_by_key": time_op(
+            lambda i: json_store.get_memory_by_key(session_id, keys[i % len(keys)]), args.repeat, _cold
+        ),
+        "search_memories_hybrid": time_op(
+            lambda i: json_store.search_memories_hybrid(session_id, queries[i % len(queries)], limit=5),
+            args.repeat, _cold
+        ),
+        "batch_increment_access": time_op(
+            lambda i: json_store.batch_increment_access(rng.sample(ids, 5), current_turn=size + i),
+            args.writes
+        ),
+        "get_memory_stats": time_op(lambda i: json_store.get_memory_stats(session_id), args.repeat, _cold),
+    }
+
+    # Pairwise and it deactivates what it finds, so it runs once and last
+    if size <= args.consolidate_max:
+        ops["consolidate_duplicate_memories"] = time_op(
+            lambda i: json_store.consolidate_duplicate_memories(session_id), 1
+        )
+    else:
+        ops["consolidate_duplicate_memories"] = {"skipped": f"size > --consolidate-max ({args.consolidate_max})"}
+
+    json_store.get_db().close()
+    file_bytes = os.path.getsize(path) if backend != "memory" and os.path.exists(path) else None
+
+    return {
+        "backend": backend,
+        "size": size,
+        "generate_s": round(generate_s, 3),
+        "populate_s": round(populate_s, 3),
+        "file_bytes": file_bytes,
+        "ops": ops,
+    }
+
+
+# ---------------------------------------------------------
+# REPORTING
+# ---------------------------------------------------------
+def _git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any]) -> List[str]:
+    """Lines of 'backend size op: baseline -> current (ratio)' for shared results"""
+    previous = {(r["backend"], r["size"]): r["ops"] for r in baseline.get("results", [])}
+    lines = []
+    for result in current["results"]:
+        base_ops = previous.get((result["backend"], result["size"]))
+        if not base_ops:
+            continue
+        for op, summary in result["ops"].items():
+            before = base_ops.get(op, {}).get("mean_ms")
+            after = summary.get("mean_ms")
+            if before and after is not None:
+                lines.append(
+                    f"{result['backend']:>6} {result['size']:>7} {op:<32} "
+                    f"{before:>10.2f} -> {after:>10.2f} ms  x{after / before:.2f}"
+                )
+    return lines
+
+
+def main():
+    parser = argparse.ArgumentParser(description="json_store micro-benchmarks")
+    parser.add_argument("--sizes", default="1000,10000,100000", help="Comma-separated session sizes")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help=f"Comma-separated subset of {BACKENDS}")
+    parser.add_argument("--repeat", type=int, default=5, help="Runs per read operation")
+    parser.add_argument("--writes", type=int, default=3, help="Runs per write operation")
+    parser.add_argument("--duplicate-rate", type=float, default=0.02, help="Share of records repeating an earlier text")
+    parser.add_argument("--consolidate-max", type=int, default=1000,
+                        help="Largest size to run the O(n^2) consolidation at")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--output", default="storage_bench.json")
+    parser.add_argument("--baseline", help="Earlier result file to compare against")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sizes = [int(s) for s in args.sizes.split(",") if s.strip()]
+    backends = [b.strip() for b in args.backends.split(",") if b.strip()]
+    unknown = set(backends) - set(BACKENDS)
+    if unknown:
+        parser.error(f"Unknown backends: {sorted(unknown)}")
+
+    # Real-shaped vectors without network access
+    embedder = HashingProvider()
+    set_provider(embedder)
+
+    results = []
+    for backend in backends:
+        for size in sizes:
+            print(f"⏱️  {backend} @ {size} memories...", file=sys.stderr)
+            results.append(bench_size(backend, size, args, embedder))
+
+    report = {
+        "commit": _git_commit(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "config": {
+            "sizes": sizes,
+            "repeat": args.repeat,
+            "writes": args.writes,
+            "duplicate_rate": args.duplicate_rate,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2)
+    print(f"✅ Results written to {args.output}", file=sys.stderr)
+
+    if args.baseline:
+        with open(args.baseline, "r", encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nvs {args.baseline} (commit {baseline.get('commit')}):")
+        for line in compare(report, baseline):
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
@@ -43,18 +43,45 @@
 """
 Context Builder Module
 Builds formatted context from ranked memories for LLM consumption
+
+Context size is budgeted in (estimated) tokens rather than characters:
+prompt tokens are what drive Groq latency, time-to-first-token and cost.
+
+Rendered blocks are cached per session and keyed on the session's memory
+version plus the ranked candidate ids, so a conversation whose memories
+and retrieved set haven't changed reuses the exact same context string
+(and therefore the same prompt bytes, which keeps provider-side prompt
+caching effective) turn after turn.
+
+Only formatting and packing are skipped on a hit. Retrieval and ranking
+depend on the query and still run on every request to produce the
+candidate ids the key is built from.
 """
 
-from typing import List, Dict, Any, Optional
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
+import os
+import re
+import threading
 import logging
 
+from llm.tokens import estimate_tokens
+from memory.json_store import get_session_version
+
 logger = logging.getLogger(__name__)
 
 # ============================================
 # CONFIGURATION
 # ============================================
-MAX_CONTEXT_MEMORIES = 10  # Maximum memories to include in context
-MAX_CONTEXT_LENGTH = 2000  # Maximum character length for context
+MAX_CONTEXT_MEMORIES = 10  # Maximum memories to consider for context
+MAX_CONTEXT_TOKENS = int(os.getenv("MAX_CONTEXT_TOKENS", "400"))  # Token budget for the whole block
+REDUNDANCY_THRESHOLD = 0.8  # Word-set Jaccard above which a memory adds nothing new
+CONTEXT_CACHE_SESSIONS = int(os.getenv("CONTEXT_CACHE_SESSIONS", "1024"))  # 0 disables the cache
+
+CONTEXT_HEADER = "IMPORTANT USER FACTS:\n\n"
+CONTEXT_FOOTER = "\nUse these facts naturally when relevant to the conversation."
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
 
 # ============================================
 # CONTEXT FORMATTING
@@ -84,7 +111,7 @@ def format_memory_for_context(memory: Dict[str, Any]) -> Optional[str]:
         
         # Skip low-confidence memories
         if confidence < 0.5:
-            logger.debug(f"Skipping low-confidence memory: {key} ({confidence})")
+            logger.debug("Skipping low-confidence memory: %s (%s)", key, confidence)
             return None
         
         # Format based on memory type
@@ -126,75 +153,218 @@ def deduplicate_memories(formatted_memories: List[str]) -> List[str]:
     
     return unique
 
+def _memory_score(memory: Dict[str, Any], position: int) -> float:
+    """
+    Value of including a memory in the prompt
+    
+    Uses an explicit score when the ranker attached one, otherwise
+    importance and confidence, discounted by rank position.
+    """
+    if isinstance(memory.get("score"), (int, float)):
+        return float(memory["score"])
+    
+    meta = memory.get("meta", {})
+    base = 0.5 * float(meta.get("importance_score", 0.5)) + 0.5 * float(meta.get("confidence", 0.5))
+    return base / (1 + 0.25 * position)
+
+def _is_redundant(words: set, selected: List[set]) -> bool:
+    """True if `words` mostly repeats an already selected memory"""
+    for other in selected:
+        union = words | other
+        if union and len(words & other) / len(union) >= REDUNDANCY_THRESHOLD:
+            return True
+    return False
+
+# ============================================
+# TOKEN-BUDGETED PACKING
+# ============================================
+def pack_context(
+    memories: List[Dict[str, Any]],
+    max_tokens: int = MAX_CONTEXT_TOKENS
+) -> Tuple[str, Dict[str, Any]]:
+    """
+    Greedily pack the most valuable memories into a token budget
+    
+    Candidates are taken in order of score per token, redundant ones
+    (high word overlap with something already packed) are dropped, and
+    the packed lines are emitted in score order.
+    
+    Args:
+        memories: List of ranked memory dictionaries
+        max_tokens: Token budget for the whole context block
+        
+    Returns:
+        (context string, packing stats)
+    """
+    stats = {
+        "considered": 0,
+        "packed": 0,
+        "dropped_redundant": 0,
+        "dropped_budget": 0,
+        "context_tokens": 0,
+    }
+    
+    if not memories or not isinstance(memories, list):
+        return "", stats
+    
+    candidates = []
+    for position, memory in enumerate(memories[:MAX_CONTEXT_MEMORIES]):
+        formatted = format_memory_for_context(memory)
+        if not formatted:
+            continue
+        # "N. " prefix and newline cost ~3 tokens per line
+        tokens = estimate_tokens(formatted) + 3
+        score = _memory_score(memory, position)
+        candidates.append((score / tokens, score, tokens, formatted))
+    stats["considered"] = len(candidates)
+    
+    if not candidates:
+        return "", stats
+    
+    budget = max_tokens - estimate_tokens(CONTEXT_HEADER) - estimate_tokens(CONTEXT_FOOTER)
+    used = 0
+    selected: List[Tuple[float, str]] = []
+    selected_words: List[set] = []
+    
+    for _, score, tokens, formatted in sorted(candidates, key=lambda c: c[0], reverse=True):
+        words = set(_WORD_RE.findall(formatted.lower()))
+        if _is_redundant(words, selected_words):
+            stats["dropped_redundant"] += 1
+            continue
+        if used + tokens > budget:
+            stats["dropped_budget"] += 1
+            continue
+        selected.append((score, formatted))
+        selected_words.append(words)
+        used += tokens
+    
+    if not selected:
+        return "", stats
+    
+    selected.sort(key=lambda s: s[0], reverse=True)
+    lines = "".join(f"{i}. {formatted}\n" for i, (_, formatted) in enumerate(selected, 1))
+    context = CONTEXT_HEADER + lines + CONTEXT_FOOTER
+    
+    stats["packed"] = len(selected)
+    stats["context_tokens"] = estimate_tokens(context)
+    return context, stats
+
 # ============================================
 # MAIN CONTEXT BUILDER
 # ============================================
-def build_context(memories: List[Dict[str, Any]]) -> str:
+def build_context_with_stats(memories: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
     """
-    Build formatted context string from memories
+    Build formatted context string and report its token cost
     
     Args:
         memories: List of ranked memory dictionaries
         
     Returns:
-        Formatted context string for LLM
+        (context string, packing stats including context_tokens)
     """
     try:
-        # Validate input
-        if not memories or not isinstance(memories, list):
-            logger.debug("No memories provided for context")
-            return ""
+        context, stats = pack_context(memories)
         
-        # Format each memory
-        formatted_memories = []
-        for memory in memories[:MAX_CONTEXT_MEMORIES]:
-            formatted = format_memory_for_context(memory)
-            if formatted:
-                formatted_memories.append(formatted)
-        
-        # Deduplicate
-        formatted_memories = deduplicate_memories(formatted_memories)
-        
-        # Check if we have any valid memories
-        if not formatted_memories:
+        if context:
+            logger.info(
+                "Built context with %d/%d memories (~%d tokens, %d redundant, %d over budget)",
+                stats['packed'], stats['considered'], stats['context_tokens'],
+                stats['dropped_redundant'], stats['dropped_budget']
+            )
+        else:
             logger.debug("No valid memories after formatting")
-            return ""
-        
-        # Build context
-        context = "IMPORTANT USER FACTS:\n\n"
         
-        for i, memory in enumerate(formatted_memories, 1):
-            context += f"{i}. {memory}\n"
-        
-        context += "\nUse these facts naturally when relevant to the conversation."
-        
-        # Trim if too long
-        if len(context) > MAX_CONTEXT_LENGTH:
-            logger.warning(f"Context too long ({len(context)} chars), trimming...")
-            # Keep header and trim memories
-            header = "IMPORTANT USER FACTS:\n\n"
-            footer = "\n\nUse these facts naturally when relevant to the conversation."
-            
-            available_length = MAX_CONTEXT_LENGTH - len(header) - len(footer)
-            trimmed_memories = []
-            current_length = 0
-            
-            for i, memory in enumerate(formatted_memories, 1):
-                memory_text = f"{i}. {memory}\n"
-                if current_length + len(memory_text) <= available_length:
-                    trimmed_memories.append(memory_text)
-                    current_length += len(memory_text)
-                else:
-                    break
-            
-            context = header + "".join(trimmed_memories) + footer
-        
-        logger.info(f"Built context with {len(formatted_memories)} memories ({len(context)} chars)")
-        return context
+        return context, stats
         
     except Exception as e:
         logger.error(f"Error building context: {e}", exc_info=True)
-        return ""
+        return "", {"context_tokens": 0}
+
+# ============================================
+# PER-SESSION CONTEXT CACHE
+# ============================================
+# session_id -> (cache key, context, stats); one entry per session, LRU-evicted
+_session_contexts: "OrderedDict[str, Tuple[tuple, str, Dict[str, Any]]]" = OrderedDict()
+_session_contexts_lock = threading.Lock()
+_context_cache_stats = {"hits": 0, "misses": 0}
+
+def _context_cache_key(session_id: str, memories: List[Dict[str, Any]]) -> tuple:
+    """Memory version plus the ranked candidate ids that packing would see"""
+    ids = tuple(m.get("id") for m in (memories or [])[:MAX_CONTEXT_MEMORIES])
+    return (get_session_version(session_id), MAX_CONTEXT_TOKENS, ids)
+
+def build_session_context(session_id: str, memories: List[Dict[str, Any]]) -> Tuple[str, Dict[str, Any]]:
+    """
+    Build context for a session, reusing the last rendered block if valid
+    
+    The cached block is reused while the session's memory version and the
+    ranked candidate set are unchanged; any add/update/clear of the
+    session's memories bumps the version and forces a rebuild. The caller
+    has already retrieved and ranked `memories`; a hit only saves
+    formatting and packing them.
+    
+    Args:
+        session_id: Session the memories belong to
+        memories: List of ranked memory dictionaries
+        
+    Returns:
+        (context string, packing stats with a "cached" flag)
+    """
+    if CONTEXT_CACHE_SESSIONS <= 0:
+        context, stats = build_context_with_stats(memories)
+        return context, {**stats, "cached": False}
+    
+    key = _context_cache_key(session_id, memories)
+    with _session_contexts_lock:
+        entry = _session_contexts.get(session_id)
+        if entry and entry[0] == key:
+            _session_contexts.move_to_end(session_id)
+            _context_cache_stats["hits"] += 1
+            logger.debug("Context cache hit for session %s", session_id)
+            return entry[1], {**entry[2], "cached": True}
+        _context_cache_stats["misses"] += 1
+    
+    context, stats = build_context_with_stats(memories)
+    
+    with _session_contexts_lock:
+        _session_contexts[session_id] = (key, context, stats)
+        _session_contexts.move_to_end(session_id)
+        while len(_session_contexts) > CONTEXT_CACHE_SESSIONS:
+            _session_contexts.popitem(last=False)
+    
+    return context, {**stats, "cached": False}
+
+def invalidate_session_context(session_id: Optional[str] = None) -> None:
+    """Drop the cached block for one session (or all sessions)"""
+    with _session_contexts_lock:
+        if session_id is None:
+            _session_contexts.clear()
+        else:
+            _session_contexts.pop(session_id, None)
+
+def context_cache_stats() -> Dict[str, Any]:
+    """Hit-rate metrics for the per-session context cache"""
+    with _session_contexts_lock:
+        lookups = _context_cache_stats["hits"] + _context_cache_stats["misses"]
+        return {
+            "sessions": len(_session_contexts),
+            "hits": _context_cache_stats["hits"],
+            "misses": _context_cache_stats["misses"],
+            "hit_rate": round(_context_cache_stats["hits"] / lookups, 4) if lookups else 0.0,
+        }
+
+def build_context(memories: List[Dict[str, Any]]) -> str:
+    """
+    Build formatted context string from memories
+    
+    Args:
+        memories: List of ranked memory dictionaries
+        
+    Returns:
+        Formatted context string for LLM
+    """
+    context, _ = build_context_with_stats(memories)
+    return context
 
 # ============================================
 # ADVANCED CONTEXT BUILDING (OPTIONAL)
@@ -0,0 +1,216 @@
+"""
+Extraction Result Cache
+Avoids repeat Groq calls for messages we have already extracted
+
+Users repeat themselves ("I'm vegetarian", "I prefer short answers") and
+demo/stress scripts resend identical messages. Results - including
+"nothing to store" - are cached under (normalized message, prompt
+version, model). PROMPT_VERSION hashes SYSTEM_PROMPT and the model, so
+editing the prompt invalidates every entry automatically, including
+entries in a persisted cache file.
+"""
+
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+CACHE_ENABLED = os.getenv("EXTRACTION_CACHE_ENABLED", "true").lower() == "true"
+CACHE_MAX_ENTRIES = int(os.getenv("EXTRACTION_CACHE_MAX_ENTRIES", "5000"))
+CACHE_TTL_S = float(os.getenv("EXTRACTION_CACHE_TTL_S", str(7 * 24 * 3600)))
+# "Nothing to store" is cheaper to get wrong, but prompts evolve - keep it shorter
+CACHE_NEGATIVE_TTL_S = float(os.getenv("EXTRACTION_CACHE_NEGATIVE_TTL_S", str(24 * 3600)))
+# Optional JSON snapshot; empty string keeps the cache in memory only
+CACHE_PATH = os.getenv("EXTRACTION_CACHE_PATH", "")
+CACHE_SAVE_EVERY = int(os.getenv("EXTRACTION_CACHE_SAVE_EVERY", "50"))
+
+_WHITESPACE_RE = re.compile(r"\s+")
+_TRAILING_PUNCT_RE = re.compile(r"[\s.!]+$")
+
+# ============================================
+# NORMALIZATION
+# ============================================
+def normalize_message(message: str) -> str:
+    """
+    Canonical form used for cache keys
+
+    Case, whitespace, curly apostrophes and trailing full stops or
+    exclamation marks don't change what the extractor returns.
+    """
+    text = (message or "").strip().lower()
+    text = text.replace("’", "'").replace("‘", "'")
+    text = _WHITESPACE_RE.sub(" ", text)
+    return _TRAILING_PUNCT_RE.sub("", text)
+
+# ============================================
+# CACHE
+# ============================================
+class ExtractionCache:
+    """
+    Bounded LRU cache with TTL and hit-rate metrics
+
+    Args:
+        prompt_version: Fingerprint of the extraction prompt and model
+        max_entries: LRU capacity
+        path: Optional JSON snapshot file for persistence across restarts
+    """
+
+    def __init__(
+        self,
+        prompt_version: str,
+        max_entries: int = CACHE_MAX_ENTRIES,
+        ttl: float = CACHE_TTL_S,
+        negative_ttl: float = CACHE_NEGATIVE_TTL_S,
+        path: str = CACHE_PATH
+    ):
+        self.prompt_version = prompt_version
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self.path = path
+        self._entries: "OrderedDict[str, Tuple[float, Optional[Dict[str, Any]]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty_writes = 0
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        # The snapshot is read on first use (or by the startup warm-up),
+        # not at import
+        self._loaded = not self.path
+        self._load_lock = threading.Lock()
+
+    def ensure_loaded(self) -> None:
+        """Load the persisted snapshot once"""
+        if self._loaded:
+            return
+        with self._load_lock:
+            if not self._loaded:
+                self.load()
+                self._loaded = True
+
+    def _key(self, message: str) -> str:
+        raw = f"{self.prompt_version}\x00{normalize_message(message)}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def get(self, message: str) -> Tuple[bool, Optional[Dict[str, Any]]]:
+        """
+        Look up a cached extraction
+
+        Returns:
+            (hit, result) - result may be None on a hit (cached negative)
+        """
+        self.ensure_loaded()
+        key = self._key(message)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return False, None
+
+            expires_at, result = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return False, None
+
+            self._entries.move_to_end(key)
+            self.hits += 1
+            if result is None:
+                self.negative_hits += 1
+            # Callers mutate extraction dicts; never hand out the cached object
+            return True, dict(result) if result else None
+
+    def put(self, message: str, result: Optional[Dict[str, Any]]) -> None:
+        """Cache an extraction result (None = nothing worth storing)"""
+        self.ensure_loaded()
+        ttl = self.ttl if result else self.negative_ttl
+        key = self._key(message)
+        with self._lock:
+            self._entries[key] = (time.time() + ttl, dict(result) if result else None)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+            self._dirty_writes += 1
+            should_save = self.path and self._dirty_writes >= CACHE_SAVE_EVERY
+
+        if should_save:
+            self.save()
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "negative_hits": self.negative_hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+                "prompt_version": self.prompt_version,
+            }
+
+    # ---------- persistence ----------
+    def save(self) -> None:
+        """Write a snapshot of live entries to disk"""
+        if not self.path:
+            return
+        # Never overwrite the snapshot with a cache that has not read it
+        self.ensure_loaded()
+        with self._lock:
+            now = time.time()
+            payload = {
+                "prompt_version": self.prompt_version,
+                "entries": [[k, exp, res] for k, (exp, res) in self._entries.items() if exp >= now],
+            }
+            self._dirty_writes = 0
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning(f"Could not persist extraction cache: {e}")
+
+    def load(self) -> None:
+        """Load a snapshot, discarding it if the prompt version changed"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning(f"Ignoring unreadable extraction cache file: {e}")
+            return
+
+        if payload.get("prompt_version") != self.prompt_version:
+            logger.info("♻️ Extraction prompt changed, discarding persisted extraction cache")
+            return
+
+        now = time.time()
+        with self._lock:
+            for key, expires_at, result in payload.get("entries", [])[-self.max_entries:]:
+                # Entries written since startup are newer than the snapshot
+                if expires_at >= now and key not in self._entries:
+                    self._entries[key] = (expires_at, result)
+        logger.info(f"✅ Loaded {len(self._entries)} cached extractions")
@@ -227,24 +227,26 @@ Extracts long-term user memories from messages using LLM
 import os
 import json
 import re
-from typing import Optional, Dict, Any
+import hashlib
+from typing import Optional, Dict, Any, List
 from dotenv import load_dotenv
-from groq import Groq
 from functools import lru_cache
 import logging
 
+from llm.tokens import estimate_tokens
+from llm.prefilter import allows_extraction, log_outcome
+from llm.extraction_cache import ExtractionCache, CACHE_ENABLED
+from llm.scheduler import scheduler, llm_available, PRIORITY_EXTRACTION
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 # ============================================
 # CONFIGURATION
 # ============================================
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
+if not llm_available():
     logger.warning("⚠️ GROQ_API_KEY not found. Memory extraction will be disabled.")
 
-client = Groq(api_key=api_key) if api_key else None
-
 # Model configuration
 MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
 TEMPERATURE = float(os.getenv("EXTRACTION_TEMPERATURE", "0"))
@@ -373,9 +375,53 @@ Output: {"type": "goal", "key": "current_focus", "value": "The user is preparing
 Remember: If in doubt, return null. Better to miss a memory than store irrelevant information.
 """
 
+# Identifies the extraction behaviour; changes whenever the prompt or model does
+PROMPT_VERSION = hashlib.sha256(f"{MODEL}\n{SYSTEM_PROMPT}".encode("utf-8")).hexdigest()[:12]
+
+# Keyed on PROMPT_VERSION, so prompt or model changes invalidate it
+extraction_cache = ExtractionCache(PROMPT_VERSION) if CACHE_ENABLED else None
+
 # ============================================
 # HELPER FUNCTIONS
 # ============================================
+def validate_extraction(parsed: Any) -> Optional[Dict[str, Any]]:
+    """
+    Validate a parsed extraction object
+    
+    Args:
+        parsed: Decoded JSON value for a single memory
+        
+    Returns:
+        The memory dict if valid, otherwise None
+    """
+    if not isinstance(parsed, dict):
+        return None
+    
+    # Validate required fields
+    required_fields = ["type", "key", "value", "confidence"]
+    if not all(field in parsed for field in required_fields):
+        logger.warning(f"Extracted JSON missing required fields: {parsed}")
+        return None
+    
+    # Validate confidence range ("high", null etc. make the item invalid,
+    # not the whole batch)
+    try:
+        confidence = float(parsed.get("confidence", 0))
+    except (TypeError, ValueError):
+        logger.warning("Invalid confidence value: %r", parsed.get("confidence"))
+        return None
+    if not 0 <= confidence <= 1:
+        logger.warning(f"Invalid confidence value: {confidence}")
+        return None
+    
+    # Validate types
+    valid_types = ["preference", "fact", "constraint", "habit", "goal"]
+    if parsed.get("type") not in valid_types:
+        logger.warning(f"Invalid memory type: {parsed.get('type')}")
+        return None
+    
+    return parsed
+
 def extract_json(text: str) -> Optional[Dict[str, Any]]:
     """
     Extract JSON from LLM response, handling markdown and other formatting
@@ -405,26 +451,7 @@ def extract_json(text: str) -> Optional[Dict[str, Any]]:
     
     try:
         parsed = json.loads(match.group(0))
-        
-        # Validate required fields
-        required_fields = ["type", "key", "value", "confidence"]
-        if not all(field in parsed for field in required_fields):
-            logger.warning(f"Extracted JSON missing required fields: {parsed}")
-            return None
-        
-        # Validate confidence range
-        confidence = float(parsed.get("confidence", 0))
-        if not 0 <= confidence <= 1:
-            logger.warning(f"Invalid confidence value: {confidence}")
-            return None
-        
-        # Validate types
-        valid_types = ["preference", "fact", "constraint", "habit", "goal"]
-        if parsed.get("type") not in valid_types:
-            logger.warning(f"Invalid memory type: {parsed.get('type')}")
-            return None
-        
-        return parsed
+        return validate_extraction(parsed)
         
     except json.JSONDecodeError as e:
         logger.warning(f"JSON parsing failed: {e}")
@@ -467,9 +494,67 @@ def should_skip_extraction(message: str) -> bool:
     
     return False
 
+def _complete(system_prompt: str, user_content: str, max_tokens: int) -> Optional[str]:
+    """
+    Run one extraction chat completion
+    
+    Goes through the shared scheduler at extraction priority, so it
+    never delays interactive generation.
+    
+    Returns:
+        Stripped response text, or None if the response was unusable
+    """
+    response = scheduler.chat_completion(
+        PRIORITY_EXTRACTION,
+        messages=[
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content}
+        ],
+        model=MODEL,
+        temperature=TEMPERATURE,
+        max_tokens=max_tokens,
+    )
+    
+    # Validate response
+    if not response or not hasattr(response, "choices") or len(response.choices) == 0:
+        logger.warning("Invalid LLM response structure")
+        return None
+    
+    msg = response.choices[0].message
+    if not msg or not hasattr(msg, "content"):
+        logger.warning("No content in LLM response")
+        return None
+    
+    text = msg.content
+    return text.strip() if text else None
+
 # ============================================
 # MAIN EXTRACTION FUNCTION
 # ============================================
+def _extract_single(message: str) -> Optional[Dict[str, Any]]:
+    """
+    One single-message LLM extraction, recorded in the outcome log and cache
+    
+    Raises:
+        Scheduler and API errors, for the caller to handle
+    """
+    text = _complete(SYSTEM_PROMPT, message, MAX_TOKENS)
+    if not text:
+        return None
+    
+    # Parse and validate
+    extracted = extract_json(text)
+    log_outcome(message, extracted is not None)
+    if extraction_cache:
+        extraction_cache.put(message, extracted)
+    
+    if extracted:
+        logger.info("✅ Memory extracted: %s (confidence: %s)", extracted['key'], extracted['confidence'])
+    else:
+        logger.debug("No memory extracted from message")
+    
+    return extracted
+
 def extract_memory(message: str) -> Optional[Dict[str, Any]]:
     """
     Extract memory from user message using LLM
@@ -489,69 +574,223 @@ def extract_memory(message: str) -> Optional[Dict[str, Any]]:
         
         # Heuristic pre-filtering
         if should_skip_extraction(message):
-            logger.debug(f"Skipping extraction for: {message[:50]}...")
-            return None
-        
-        # Check API key
-        if not api_key or not client:
-            logger.warning("Memory extraction disabled: No API key")
+            logger.debug("Skipping extraction for: %.50s...", message)
             return None
         
-        # Call LLM
-        logger.debug(f"Extracting memory from: {message[:100]}...")
-        
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": SYSTEM_PROMPT},
-                {"role": "user", "content": message}
-            ],
-            model=MODEL,
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-        )
+        # Repeated messages are answered from the cache (including negatives)
+        if extraction_cache:
+            hit, cached = extraction_cache.get(message)
+            if hit:
+                logger.debug("Extraction cache hit for: %.50s...", message)
+                return cached
         
-        # Validate response
-        if not response or not hasattr(response, "choices") or len(response.choices) == 0:
-            logger.warning("Invalid LLM response structure")
+        # Learned pre-filter (no-op until a model has been trained)
+        if not allows_extraction(message):
+            logger.debug("Pre-filter skipped extraction for: %.50s...", message)
             return None
         
-        msg = response.choices[0].message
-        if not msg or not hasattr(msg, "content"):
-            logger.warning("No content in LLM response")
-            return None
-        
-        text = msg.content
-        if not text:
+        # Check API key
+        if not llm_available():
+            logger.warning("Memory extraction disabled: No API key")
             return None
         
-        text = text.strip()
-        
-        # Parse and validate
-        extracted = extract_json(text)
-        
-        if extracted:
-            logger.info(f"✅ Memory extracted: {extracted['key']} (confidence: {extracted['confidence']})")
-        else:
-            logger.debug("No memory extracted from message")
+        # Call LLM
+        logger.debug("Extracting memory from: %.100s...", message)
         
-        return extracted
+        return _extract_single(message)
         
     except Exception as e:
         logger.error(f"Extractor error: {e}", exc_info=True)
         return None
 
 # ============================================
-# BATCH EXTRACTION (OPTIONAL)
+# BATCH EXTRACTION
 # ============================================
-def extract_memories_batch(messages: list[str]) -> list[Optional[Dict[str, Any]]]:
+BATCH_MAX_MESSAGES = int(os.getenv("EXTRACTION_BATCH_SIZE", "10"))
+BATCH_INPUT_TOKEN_BUDGET = int(os.getenv("EXTRACTION_BATCH_INPUT_TOKENS", "1500"))
+BATCH_OUTPUT_TOKENS_PER_MESSAGE = 60
+# Groq/Llama output cap for one batched completion
+BATCH_MAX_OUTPUT_TOKENS = 1024
+
+BATCH_INSTRUCTIONS = """
+
+## BATCH MODE
+
+You will receive a JSON array of user messages, each with an "id".
+Apply the rules above to EACH message independently.
+
+Return ONLY a JSON array with exactly one entry per input message, in the same order:
+[{"id": 0, "memory": {"type": "...", "key": "...", "value": "...", "confidence": 0.9}}, {"id": 1, "memory": null}]
+
+Use "memory": null for messages with nothing worth storing.
+"""
+
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + BATCH_INSTRUCTIONS
+
+
+def chunk_by_token_budget(
+    messages: List[str],
+    max_messages: int = BATCH_MAX_MESSAGES,
+    max_tokens: int = BATCH_INPUT_TOKEN_BUDGET
+) -> List[List[int]]:
+    """
+    Group message indices into batches that fit the prompt budget
+    
+    A single message larger than the budget still gets its own batch.
+    
+    Args:
+        messages: Candidate messages
+        max_messages: Maximum messages per batch
+        max_tokens: Approximate input token budget per batch
+        
+    Returns:
+        List of index lists into `messages`
+    """
+    batches: List[List[int]] = []
+    current: List[int] = []
+    current_tokens = 0
+    
+    for i, message in enumerate(messages):
+        # JSON wrapper ({"id": n, "message": "..."}) costs ~8 tokens
+        cost = estimate_tokens(message) + 8
+        if current and (len(current) >= max_messages or current_tokens + cost > max_tokens):
+            batches.append(current)
+            current, current_tokens = [], 0
+        current.append(i)
+        current_tokens += cost
+    
+    if current:
+        batches.append(current)
+    return batches
+
+
+def parse_batch_response(text: str, expected: int) -> Optional[List[Optional[Dict[str, Any]]]]:
+    """
+    Parse a batched extraction response
+    
+    Args:
+        text: Raw LLM response
+        expected: Number of messages in the batch
+        
+    Returns:
+        Per-message results aligned with input order, or None if the
+        response cannot be trusted (caller should fall back)
+    """
+    if not text:
+        return None
+    
+    text = re.sub(r"```json\s*", "", text)
+    text = re.sub(r"```\s*", "", text).strip()
+    
+    match = re.search(r"\[.*\]", text, re.DOTALL)
+    if not match:
+        return None
+    
+    try:
+        items = json.loads(match.group(0))
+    except json.JSONDecodeError as e:
+        logger.warning(f"Batch JSON parsing failed: {e}")
+        return None
+    
+    if not isinstance(items, list):
+        return None
+    
+    results: List[Optional[Dict[str, Any]]] = [None] * expected
+    seen = set()
+    for position, item in enumerate(items):
+        if not isinstance(item, dict):
+            return None
+        idx = item.get("id", position)
+        if not isinstance(idx, int) or not 0 <= idx < expected or idx in seen:
+            return None
+        seen.add(idx)
+        memory = item.get("memory")
+        results[idx] = validate_extraction(memory) if memory else None
+    
+    # A short answer means the model dropped messages - don't guess which
+    if len(seen) != expected:
+        return None
+    
+    return results
+
+
+def _extract_batch(messages: List[str]) -> List[Optional[Dict[str, Any]]]:
+    """
+    Extract a single token-budgeted batch
+    
+    Falls back to per-message calls only when the batched answer cannot
+    be parsed. Call failures (scheduler timeouts, rate limits, transport
+    errors) propagate: retrying them as N single calls would multiply the
+    load during an outage.
+    """
+    if len(messages) == 1:
+        return [_extract_single(messages[0])]
+    
+    payload = json.dumps(
+        [{"id": i, "message": m} for i, m in enumerate(messages)],
+        ensure_ascii=False
+    )
+    max_tokens = min(BATCH_MAX_OUTPUT_TOKENS, BATCH_OUTPUT_TOKENS_PER_MESSAGE * len(messages))
+    
+    results = parse_batch_response(_complete(BATCH_SYSTEM_PROMPT, payload, max_tokens), len(messages))
+    
+    if results is None:
+        logger.warning("Batch extraction unparseable, falling back to %d single calls", len(messages))
+        return [_extract_single(m) for m in messages]
+    
+    for message, extracted in zip(messages, results):
+        log_outcome(message, extracted is not None)
+        if extraction_cache:
+            extraction_cache.put(message, extracted)
+        if extracted:
+            logger.info("✅ Memory extracted: %s (confidence: %s)", extracted['key'], extracted['confidence'])
+    return results
+
+
+def extract_memories_batch(
+    messages: list[str],
+    batch_size: int = BATCH_MAX_MESSAGES
+) -> list[Optional[Dict[str, Any]]]:
     """
     Extract memories from multiple messages
-    Useful for processing conversation history
+    Useful for processing conversation history and deferred backlogs
+    
+    Messages rejected by the heuristic or learned pre-filters never reach
+    the LLM; the rest are packed several per prompt, cutting LLM calls by roughly the
+    batch size.
     
     Args:
         messages: List of user messages
+        batch_size: Maximum messages per LLM call
         
     Returns:
-        List of extracted memories (with None for non-memorable messages)
+        List of extracted memories aligned with `messages`
+        (None for non-memorable messages)
+        
+    Raises:
+        Scheduler and API errors from the LLM calls
     """
-    return [extract_memory(msg) for msg in messages]
+    results: list[Optional[Dict[str, Any]]] = [None] * len(messages)
+    
+    candidates = []
+    for i, msg in enumerate(messages):
+        if not msg or not msg.strip() or should_skip_extraction(msg):
+            continue
+        if extraction_cache:
+            hit, cached = extraction_cache.get(msg.strip())
+            if hit:
+                results[i] = cached
+                continue
+        if allows_extraction(msg):
+            candidates.append(i)
+    
+    if not candidates or not llm_available():
+        return results
+    
+    candidate_texts = [messages[i].strip() for i in candidates]
+    for batch in chunk_by_token_budget(candidate_texts, max_messages=max(1, batch_size)):
+        batch_results = _extract_batch([candidate_texts[j] for j in batch])
+        for j, extracted in zip(batch, batch_results):
+            results[candidates[j]] = extracted
+    
+    return results
@@ -57,37 +57,57 @@ Generates contextual responses using LLM with user memory
 """
 
 import os
-from typing import Optional
+import time
+import queue
+import threading
+import contextvars
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Optional, List, Dict, Any, Tuple
 from dotenv import load_dotenv
-from groq import Groq
 import logging
 
+from llm.tokens import estimate_messages_tokens
+from llm.scheduler import scheduler, llm_available, CancelToken, PRIORITY_INTERACTIVE
+from llm.response_cache import response_cache
+
 load_dotenv()
 logger = logging.getLogger(__name__)
 
 # ============================================
 # CONFIGURATION
 # ============================================
-api_key = os.getenv("GROQ_API_KEY")
-if not api_key:
+if not llm_available():
     logger.warning("⚠️ GROQ_API_KEY not found. Response generation will use fallback.")
 
-client = Groq(api_key=api_key) if api_key else None
-
 # Model configuration
 MODEL = os.getenv("GROQ_MODEL", "llama-3.1-8b-instant")
 TEMPERATURE = float(os.getenv("GENERATION_TEMPERATURE", "0.7"))
 MAX_TOKENS = int(os.getenv("GENERATION_MAX_TOKENS", "500"))
 
+# Hedged requests: if the first attempt shows no token by the deadline, race a second one
+HEDGE_ENABLED = os.getenv("GENERATION_HEDGE_ENABLED", "false").lower() == "true"
+HEDGE_PERCENTILE = float(os.getenv("GENERATION_HEDGE_PERCENTILE", "0.95"))
+HEDGE_DEFAULT_DELAY_MS = float(os.getenv("GENERATION_HEDGE_DEFAULT_DELAY_MS", "1500"))
+HEDGE_MIN_DELAY_MS = float(os.getenv("GENERATION_HEDGE_MIN_DELAY_MS", "200"))
+HEDGE_MAX_DELAY_MS = float(os.getenv("GENERATION_HEDGE_MAX_DELAY_MS", "5000"))
+HEDGE_FALLBACK_MODEL = os.getenv("GENERATION_HEDGE_FALLBACK_MODEL") or MODEL
+HEDGE_ATTEMPT_TIMEOUT_S = float(os.getenv("GENERATION_HEDGE_ATTEMPT_TIMEOUT_S", "30"))
+# At most two attempts per request thread (FastAPI's threadpool defaults to 40)
+HEDGE_WORKERS = int(os.getenv("GENERATION_HEDGE_WORKERS", "80"))
+HEDGE_MIN_SAMPLES = 20  # First-token samples needed before the percentile is trusted
+
 # ============================================
 # SYSTEM PROMPT TEMPLATE
 # ============================================
-SYSTEM_PROMPT_TEMPLATE = """You are a helpful, intelligent personal AI assistant with long-term memory.
+# The static instructions come first and never change between requests, so
+# provider-side prompt caching can reuse them; the per-user memory block is
+# appended last so it only invalidates the tail of the prompt.
+SYSTEM_PROMPT_PREFIX = """You are a helpful, intelligent personal AI assistant with long-term memory.
 
 You have access to important information about the user from previous conversations.
-
-## USER CONTEXT
-{context}
+It is provided in the USER CONTEXT section at the end of these instructions.
 
 ## GUIDELINES
 
@@ -119,6 +139,16 @@ You have access to important information about the user from previous conversati
 Remember: You're having a conversation with someone you know, not a stranger.
 """
 
+CONTEXT_SECTION_TEMPLATE = """
+## USER CONTEXT
+{context}
+"""
+
+SYSTEM_PROMPT_TEMPLATE = SYSTEM_PROMPT_PREFIX + CONTEXT_SECTION_TEMPLATE
+
+# Rendered prompts are reused for identical memory blocks
+PROMPT_CACHE_SIZE = int(os.getenv("SYSTEM_PROMPT_CACHE_SIZE", "512"))
+
 FALLBACK_SYSTEM_PROMPT = """You are a helpful AI assistant.
 Provide clear, accurate, and concise responses to user questions.
 Be friendly, professional, and respectful."""
@@ -146,22 +176,216 @@ def format_context(context: str) -> str:
     # Otherwise, wrap it nicely
     return f"IMPORTANT USER FACTS:\n{context}"
 
+@lru_cache(maxsize=PROMPT_CACHE_SIZE)
+def _render_system_prompt(context: str) -> str:
+    """Render the full system prompt for a (hashable) context string"""
+    if not context or context.strip() == "":
+        formatted_context = "No previous context available. This is a new conversation."
+    else:
+        formatted_context = format_context(context)
+    
+    return SYSTEM_PROMPT_PREFIX + CONTEXT_SECTION_TEMPLATE.format(context=formatted_context)
+
 def build_system_prompt(context: Optional[str]) -> str:
     """
     Build complete system prompt with context
     
+    The static prefix is shared by every request; only the trailing
+    USER CONTEXT section varies.
+    
     Args:
         context: User memory context
         
     Returns:
         Complete system prompt
     """
-    if not context or context.strip() == "":
-        formatted_context = "No previous context available. This is a new conversation."
+    return _render_system_prompt(context or "")
+
+def estimate_prompt_tokens(user_message: str, context: Optional[str] = None) -> int:
+    """
+    Estimate prompt tokens for a generation request
+    
+    Args:
+        user_message: Current user message
+        context: User memory context
+        
+    Returns:
+        Approximate prompt token count (system + user message)
+    """
+    return estimate_messages_tokens([build_system_prompt(context), user_message or ""])
+
+# ============================================
+# HEDGED GENERATION
+# ============================================
+# Time-to-first-token of primary attempts, used to pick the hedge deadline.
+# A primary cancelled before its first token contributes its elapsed time
+# (a lower bound), so slow primaries that lose to a hedge are not dropped
+# from the sample and the deadline does not drift down.
+_ttft_samples: deque = deque(maxlen=200)
+_hedge_lock = threading.Lock()
+_hedge_stats = {
+    "requests": 0,
+    "hedged": 0,
+    "hedge_wins": 0,
+    "primary_wins": 0,
+    "failures": 0,
+}
+# Two attempts per in-flight request at most
+_hedge_pool = ThreadPoolExecutor(max_workers=max(2, HEDGE_WORKERS), thread_name_prefix="hedge")
+
+def _hedge_delay_s() -> float:
+    """Hedge deadline: the configured percentile of recent first-token latency"""
+    with _hedge_lock:
+        samples = sorted(_ttft_samples)
+    if len(samples) < HEDGE_MIN_SAMPLES:
+        delay_ms = HEDGE_DEFAULT_DELAY_MS
     else:
-        formatted_context = format_context(context)
+        delay_ms = samples[min(len(samples) - 1, int(HEDGE_PERCENTILE * len(samples)))] * 1000
+    return min(max(delay_ms, HEDGE_MIN_DELAY_MS), HEDGE_MAX_DELAY_MS) / 1000
+
+def _record_ttft(seconds: float) -> None:
+    with _hedge_lock:
+        _ttft_samples.append(seconds)
+
+def _run_attempt(
+    index: int,
+    model: str,
+    messages: List[Dict[str, str]],
+    first_token: threading.Event,
+    cancel: CancelToken,
+    results: "queue.Queue"
+) -> None:
+    """Stream one attempt to completion unless cancelled; report (index, text, error)"""
+    started = time.monotonic()
+    parts = []
+    chunks = scheduler.stream_chat_completion(
+        PRIORITY_INTERACTIVE,
+        messages=messages,
+        model=model,
+        temperature=TEMPERATURE,
+        max_tokens=MAX_TOKENS,
+        cancel=cancel,
+        timeout=HEDGE_ATTEMPT_TIMEOUT_S
+    )
+    try:
+        for chunk in chunks:
+            if cancel.cancelled:
+                return
+            if not first_token.is_set():
+                first_token.set()
+                if index == 0:
+                    _record_ttft(time.monotonic() - started)
+            if chunk.choices and chunk.choices[0].delta.content:
+                parts.append(chunk.choices[0].delta.content)
+        if cancel.cancelled:
+            return
+        results.put((index, "".join(parts), None))
+    except Exception as e:
+        results.put((index, None, e))
+    finally:
+        # Releases the scheduler slot and drops the connection if cancelled
+        chunks.close()
+
+def _generate_hedged(messages: List[Dict[str, str]]) -> Tuple[Optional[str], Optional[str]]:
+    """
+    Generate with a hedge request for tail latency
+    
+    The primary attempt streams from MODEL. If it has produced no token
+    by the hedge deadline (or fails first), a second attempt goes to
+    HEDGE_FALLBACK_MODEL; whichever finishes first wins. The other is
+    cancelled at once, even before its first token: its stream is shut
+    down and its scheduler slot handed back.
+    
+    Returns:
+        (reply text, model that produced it), or (None, None) if every
+        attempt failed
+    """
+    delay = _hedge_delay_s()
+    results: "queue.Queue" = queue.Queue()
+    first_tokens = [threading.Event(), threading.Event()]
+    cancels = [CancelToken(), CancelToken()]
+    models = [MODEL, HEDGE_FALLBACK_MODEL]
+    
+    def cancel_primary() -> None:
+        if not first_tokens[0].is_set() and not cancels[0].cancelled:
+            # Censored first-token sample: it would have taken at least this long
+            _record_ttft(time.monotonic() - primary_started)
+        cancels[0].cancel()
+    
+    # Attempts run on pool threads; carry the request's trace context along
+    primary_started = time.monotonic()
+    _hedge_pool.submit(
+        contextvars.copy_context().run,
+        _run_attempt, 0, MODEL, messages, first_tokens[0], cancels[0], results
+    )
+    pending = {0}
+    launched = [0]
+    hedge_decided = False
+    deadline = time.monotonic() + delay
+    give_up = time.monotonic() + 2 * HEDGE_ATTEMPT_TIMEOUT_S
+    
+    def launch_hedge() -> None:
+        with _hedge_lock:
+            _hedge_stats["hedged"] += 1
+        logger.info("Hedging generation after %.0fms (model: %s)", delay * 1000, HEDGE_FALLBACK_MODEL)
+        _hedge_pool.submit(
+            contextvars.copy_context().run,
+            _run_attempt, 1, HEDGE_FALLBACK_MODEL, messages, first_tokens[1], cancels[1], results
+        )
+        pending.add(1)
+        launched.append(1)
     
-    return SYSTEM_PROMPT_TEMPLATE.format(context=formatted_context)
+    with _hedge_lock:
+        _hedge_stats["requests"] += 1
+    
+    while pending:
+        now = time.monotonic()
+        timeout = (deadline if not hedge_decided else give_up) - now
+        try:
+            index, text, error = results.get(timeout=max(timeout, 0))
+        except queue.Empty:
+            if hedge_decided:
+                break
+            hedge_decided = True
+            if not first_tokens[0].is_set():
+                launch_hedge()
+            continue
+        
+        pending.discard(index)
+        if text and text.strip():
+            for other in pending:
+                if other == 0:
+                    cancel_primary()
+                else:
+                    cancels[other].cancel()
+            with _hedge_lock:
+                if len(launched) > 1:
+                    _hedge_stats["hedge_wins" if index == 1 else "primary_wins"] += 1
+            return text, models[index]
+        
+        logger.warning("Generation attempt %s failed: %s", index, error or 'empty response')
+        if not hedge_decided:
+            # Primary failed before the deadline - hedge straight away
+            hedge_decided = True
+            launch_hedge()
+    
+    if 0 in pending:
+        cancel_primary()
+    for cancel in cancels:
+        cancel.cancel()
+    with _hedge_lock:
+        _hedge_stats["failures"] += 1
+    return None, None
+
+def hedging_stats() -> Dict[str, Any]:
+    """Hedge rate, hedge win rate and current deadline"""
+    with _hedge_lock:
+        stats = dict(_hedge_stats)
+    stats["enabled"] = HEDGE_ENABLED
+    stats["hedge_rate"] = round(stats["hedged"] / stats["requests"], 4) if stats["requests"] else 0.0
+    stats["hedge_win_rate"] = round(stats["hedge_wins"] / stats["hedged"], 4) if stats["hedged"] else 0.0
+    stats["deadline_ms"] = round(_hedge_delay_s() * 1000, 1)
+    return stats
 
 # ============================================
 # MAIN GENERATION FUNCTION
@@ -186,7 +410,7 @@ def generate_reply(user_message: str, context: Optional[str] = None) -> str:
         user_message = user_message.strip()
         
         # Check API availability
-        if not api_key or not client:
+        if not llm_available():
             logger.warning("LLM not configured, using fallback")
             return (
                 "I'm currently unable to access my language model, "
@@ -194,37 +418,56 @@ def generate_reply(user_message: str, context: Optional[str] = None) -> str:
                 "Please try again in a moment."
             )
         
+        # Repeated question with identical memory context
+        if response_cache:
+            cached = response_cache.get(user_message, context, MODEL, TEMPERATURE)
+            if cached:
+                logger.info("✅ Response cache hit: %d characters", len(cached))
+                return cached
+        
         # Build system prompt
         system_prompt = build_system_prompt(context)
         
-        logger.debug(f"Generating response for: {user_message[:100]}...")
+        logger.debug("Generating response for: %.100s...", user_message)
         if context:
-            logger.debug(f"Using context: {len(context)} characters")
+            logger.debug("Using context: %d characters", len(context))
         
-        # Call LLM
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_message}
-            ],
-            model=MODEL,
-            temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-        )
+        messages = [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_message}
+        ]
         
-        # Validate response
-        if not response or not response.choices or len(response.choices) == 0:
-            logger.error("Invalid LLM response structure")
-            return "I'm having trouble generating a response. Please try again."
-        
-        message = response.choices[0].message.content
+        model = MODEL
+        if HEDGE_ENABLED:
+            message, model = _generate_hedged(messages)
+        else:
+            # Call LLM (interactive priority: admitted ahead of background work)
+            response = scheduler.chat_completion(
+                PRIORITY_INTERACTIVE,
+                messages=messages,
+                model=MODEL,
+                temperature=TEMPERATURE,
+                max_tokens=MAX_TOKENS,
+            )
+            
+            # Validate response
+            if not response or not response.choices or len(response.choices) == 0:
+                logger.error("Invalid LLM response structure")
+                return "I'm having trouble generating a response. Please try again."
+            
+            message = response.choices[0].message.content
         
         if not message or not message.strip():
             logger.error("Empty response from LLM")
             return "I processed your request, but couldn't generate a proper response. Please try again."
         
         reply = message.strip()
-        logger.info(f"✅ Generated response: {len(reply)} characters")
+        logger.info("✅ Generated response: %d characters", len(reply))
+        
+        if response_cache:
+            # Keyed on the model that answered: a hedge fallback reply is not
+            # served to later requests for MODEL
+            response_cache.put(user_message, context, model, TEMPERATURE, reply)
         
         return reply
         
@@ -253,21 +496,21 @@ def generate_reply_stream(user_message: str, context: Optional[str] = None):
         Response chunks as they're generated
     """
     try:
-        if not api_key or not client:
+        if not llm_available():
             yield "I'm currently unable to access my language model."
             return
         
         system_prompt = build_system_prompt(context)
         
-        stream = client.chat.completions.create(
+        stream = scheduler.stream_chat_completion(
+            PRIORITY_INTERACTIVE,
             messages=[
                 {"role": "system", "content": system_prompt},
                 {"role": "user", "content": user_message}
             ],
             model=MODEL,
             temperature=TEMPERATURE,
-            max_tokens=MAX_TOKENS,
-            stream=True
+            max_tokens=MAX_TOKENS
         )
         
         for chunk in stream:
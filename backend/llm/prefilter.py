@@ -0,0 +1,385 @@
+"""
+Learned Extraction Pre-filter
+CPU-only classifier that predicts whether a message will yield a memory
+
+should_skip_extraction() only catches greetings and obvious questions, so
+most small talk still costs a Groq round trip that returns null. This
+module trains a hashed n-gram logistic regression on logged extraction
+outcomes (message -> did the LLM return a memory) and gates the LLM call
+on its predicted probability.
+
+The threshold trades LLM calls saved against memories missed; training
+picks the highest threshold that keeps a target recall on a validation
+split, reports on a separate test split the threshold never saw, and
+PREFILTER_THRESHOLD overrides it at runtime.
+
+Outcome logging stores raw user messages, so it is off unless
+LOG_EXTRACTION_OUTCOMES=true. The log rotates to <path>.1 once it passes
+EXTRACTION_OUTCOME_LOG_MAX_MB, keeping at most two files on disk.
+
+Usage:
+    python -m llm.prefilter train --data extraction_outcomes.jsonl --out prefilter_model.json
+    python -m llm.prefilter evaluate --data extraction_outcomes.jsonl --model prefilter_model.json
+"""
+
+import os
+import re
+import json
+import math
+import random
+import zlib
+import threading
+from datetime import datetime
+from typing import Dict, Any, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+MODEL_PATH = os.getenv("PREFILTER_MODEL_PATH", "./prefilter_model.json")
+OUTCOME_LOG_PATH = os.getenv("EXTRACTION_OUTCOME_LOG", "./extraction_outcomes.jsonl")
+LOG_OUTCOMES = os.getenv("LOG_EXTRACTION_OUTCOMES", "false").lower() == "true"
+OUTCOME_LOG_MAX_BYTES = int(float(os.getenv("EXTRACTION_OUTCOME_LOG_MAX_MB", "10")) * 1024 * 1024)
+THRESHOLD_OVERRIDE = os.getenv("PREFILTER_THRESHOLD")
+# Fraction of rejected messages still sent to the LLM so the outcome log
+# keeps producing labels for the kind of messages the model rejects
+EXPLORE_RATE = float(os.getenv("PREFILTER_EXPLORE_RATE", "0.02"))
+
+N_FEATURES = 2 ** 18
+DEFAULT_TARGET_RECALL = 0.97
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+
+# ============================================
+# FEATURES
+# ============================================
+def _bucket(token: str) -> int:
+    # crc32 is stable across processes, unlike hash()
+    return zlib.crc32(token.encode("utf-8")) % N_FEATURES
+
+
+def featurize(message: str) -> Dict[int, float]:
+    """
+    Hash word unigrams/bigrams and character trigrams into a sparse vector
+
+    Args:
+        message: Raw user message
+
+    Returns:
+        {bucket: value} with L2-normalised values
+    """
+    text = (message or "").lower().strip()
+    words = _WORD_RE.findall(text)
+
+    tokens = [f"w:{w}" for w in words]
+    tokens += [f"b:{a}_{b}" for a, b in zip(words, words[1:])]
+    padded = f" {text} "
+    tokens += [f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2)]
+    # Position cues matter: "i am ..." vs "... am i"
+    if words:
+        tokens.append(f"first:{words[0]}")
+    tokens.append(f"q:{text.endswith('?')}")
+
+    features: Dict[int, float] = {}
+    for token in tokens:
+        b = _bucket(token)
+        features[b] = features.get(b, 0.0) + 1.0
+
+    norm = math.sqrt(sum(v * v for v in features.values())) or 1.0
+    return {b: v / norm for b, v in features.items()}
+
+# ============================================
+# MODEL
+# ============================================
+class PrefilterModel:
+    """Sparse logistic regression over hashed n-gram features"""
+
+    def __init__(
+        self,
+        weights: Optional[Dict[int, float]] = None,
+        bias: float = 0.0,
+        threshold: float = 0.5,
+        meta: Optional[Dict[str, Any]] = None
+    ):
+        self.weights = weights or {}
+        self.bias = bias
+        self.threshold = threshold
+        self.meta = meta or {}
+
+    def predict_proba(self, message: str) -> float:
+        """Probability that the message contains a storable memory"""
+        z = self.bias + sum(self.weights.get(b, 0.0) * v for b, v in featurize(message).items())
+        # Clamp to avoid overflow in exp for extreme scores
+        z = max(-30.0, min(30.0, z))
+        return 1.0 / (1.0 + math.exp(-z))
+
+    def fit(
+        self,
+        samples: List[Tuple[str, int]],
+        epochs: int = 8,
+        learning_rate: float = 0.5,
+        l2: float = 1e-5,
+        seed: int = 13
+    ) -> "PrefilterModel":
+        """
+        Train with plain SGD (datasets are thousands of short messages)
+
+        Args:
+            samples: (message, label) pairs, label 1 if a memory was extracted
+        """
+        rng = random.Random(seed)
+        data = [(featurize(m), y) for m, y in samples]
+
+        # Memories are rare; weight positives so the model doesn't learn "always skip"
+        positives = sum(y for _, y in data) or 1
+        pos_weight = max(1.0, (len(data) - positives) / positives)
+
+        for epoch in range(epochs):
+            rng.shuffle(data)
+            lr = learning_rate / (1 + epoch)
+            for features, y in data:
+                z = self.bias + sum(self.weights.get(b, 0.0) * v for b, v in features.items())
+                z = max(-30.0, min(30.0, z))
+                p = 1.0 / (1.0 + math.exp(-z))
+                grad = (p - y) * (pos_weight if y else 1.0)
+                for b, v in features.items():
+                    w = self.weights.get(b, 0.0)
+                    self.weights[b] = w - lr * (grad * v + l2 * w)
+                self.bias -= lr * grad
+
+        # Drop near-zero weights to keep the model file small
+        self.weights = {b: w for b, w in self.weights.items() if abs(w) > 1e-4}
+        return self
+
+    def save(self, path: str) -> None:
+        """Serialize to JSON"""
+        payload = {
+            "version": 1,
+            "n_features": N_FEATURES,
+            "bias": self.bias,
+            "threshold": self.threshold,
+            "meta": self.meta,
+            "weights": {str(b): round(w, 6) for b, w in self.weights.items()},
+        }
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(payload, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path: str) -> "PrefilterModel":
+        """Deserialize from JSON"""
+        with open(path, "r", encoding="utf-8") as f:
+            payload = json.load(f)
+        if payload.get("n_features") != N_FEATURES:
+            raise ValueError("Pre-filter model was trained with a different feature size")
+        return cls(
+            weights={int(b): w for b, w in payload["weights"].items()},
+            bias=payload["bias"],
+            threshold=payload["threshold"],
+            meta=payload.get("meta", {})
+        )
+
+# ============================================
+# RUNTIME GATE
+# ============================================
+_model: Optional[PrefilterModel] = None
+_model_loaded = False
+_model_lock = threading.Lock()
+_log_lock = threading.Lock()
+
+
+def get_model() -> Optional[PrefilterModel]:
+    """Load the serialized model once; None if no model has been trained"""
+    global _model, _model_loaded
+    if _model_loaded:
+        return _model
+    with _model_lock:
+        if not _model_loaded:
+            if os.path.exists(MODEL_PATH):
+                try:
+                    _model = PrefilterModel.load(MODEL_PATH)
+                    logger.info(f"✅ Extraction pre-filter loaded ({len(_model.weights)} weights)")
+                except Exception as e:
+                    logger.error(f"Could not load pre-filter model: {e}")
+            _model_loaded = True
+    return _model
+
+
+def allows_extraction(message: str) -> bool:
+    """
+    Gate for the extraction LLM call
+
+    Returns:
+        True if the message should be sent to the LLM (always True when
+        no model is available)
+    """
+    model = get_model()
+    if model is None:
+        return True
+
+    threshold = float(THRESHOLD_OVERRIDE) if THRESHOLD_OVERRIDE else model.threshold
+    if model.predict_proba(message) >= threshold:
+        return True
+    return random.random() < EXPLORE_RATE
+
+
+def log_outcome(message: str, extracted: bool) -> None:
+    """Append a labelled training example for the next training run"""
+    if not LOG_OUTCOMES:
+        return
+    line = json.dumps({"m": message, "y": int(bool(extracted))}, ensure_ascii=False) + "\n"
+    try:
+        with _log_lock:
+            with open(OUTCOME_LOG_PATH, "a", encoding="utf-8") as f:
+                f.write(line)
+                size = f.tell()
+            if size >= OUTCOME_LOG_MAX_BYTES:
+                # Replaces the previous rotation, bounding retention to two files
+                os.replace(OUTCOME_LOG_PATH, OUTCOME_LOG_PATH + ".1")
+    except OSError as e:
+        logger.debug("Could not log extraction outcome: %s", e)
+
+# ============================================
+# TRAINING & EVALUATION
+# ============================================
+def load_outcomes(path: str) -> List[Tuple[str, int]]:
+    """Read (message, label) pairs from an outcome log"""
+    samples = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            try:
+                rec = json.loads(line)
+                samples.append((rec["m"], int(rec["y"])))
+            except (json.JSONDecodeError, KeyError, TypeError, ValueError):
+                continue
+    return samples
+
+
+def _confusion(probs: List[float], labels: List[int], threshold: float) -> Dict[str, Any]:
+    tp = sum(1 for p, y in zip(probs, labels) if p >= threshold and y)
+    fp = sum(1 for p, y in zip(probs, labels) if p >= threshold and not y)
+    fn = sum(1 for p, y in zip(probs, labels) if p < threshold and y)
+    total = len(labels)
+    calls = tp + fp
+    return {
+        "threshold": round(threshold, 3),
+        "llm_calls": calls,
+        "llm_calls_saved": total - calls,
+        "llm_calls_saved_pct": round(100.0 * (total - calls) / total, 1) if total else 0.0,
+        "memories_missed": fn,
+        "recall": round(tp / (tp + fn), 4) if tp + fn else 1.0,
+        "precision": round(tp / calls, 4) if calls else 1.0,
+    }
+
+
+def evaluate(model: PrefilterModel, samples: List[Tuple[str, int]]) -> Dict[str, Any]:
+    """
+    Offline report of LLM calls saved versus memories missed
+
+    The baseline is every sample reaching the LLM (the outcome log only
+    contains messages that already passed the regex heuristics).
+    """
+    probs = [model.predict_proba(m) for m, _ in samples]
+    labels = [y for _, y in samples]
+    return {
+        "samples": len(samples),
+        "positives": sum(labels),
+        "at_model_threshold": _confusion(probs, labels, model.threshold),
+        "sweep": [_confusion(probs, labels, t / 20) for t in range(1, 20)],
+    }
+
+
+def choose_threshold(model: PrefilterModel, samples: List[Tuple[str, int]], target_recall: float) -> float:
+    """Highest threshold whose recall on `samples` still meets the target"""
+    probs = sorted((model.predict_proba(m) for m, y in samples if y), reverse=True)
+    if not probs:
+        return 0.5
+    # Keep the top ceil(target * positives) positives above the threshold
+    keep = max(1, math.ceil(target_recall * len(probs)))
+    return max(0.0, probs[keep - 1] - 1e-6)
+
+
+def train(
+    data_path: str,
+    out_path: str,
+    target_recall: float,
+    holdout: float = 0.2,
+    validation: float = 0.2,
+    seed: int = 13
+) -> Dict[str, Any]:
+    """
+    Train, pick a threshold on a validation split, evaluate and save
+
+    Args:
+        holdout: Fraction kept for the test report
+        validation: Fraction used to choose the threshold
+
+    Returns:
+        Evaluation report on the test split (never used for fitting
+        or for the threshold)
+    """
+    samples = load_outcomes(data_path)
+    if len(samples) < 10:
+        raise ValueError(f"Need at least 10 labelled outcomes, found {len(samples)}")
+
+    rng = random.Random(seed)
+    rng.shuffle(samples)
+    n_test = max(1, int(len(samples) * holdout))
+    n_val = max(1, int(len(samples) * validation))
+    if n_test + n_val >= len(samples):
+        raise ValueError(f"holdout + validation leave no training data out of {len(samples)} outcomes")
+    test_set = samples[:n_test]
+    val_set = samples[n_test:n_test + n_val]
+    train_set = samples[n_test + n_val:]
+
+    model = PrefilterModel().fit(train_set, seed=seed)
+    model.threshold = choose_threshold(model, val_set, target_recall)
+    model.meta = {
+        "trained_at": datetime.utcnow().isoformat(),
+        "train_samples": len(train_set),
+        "validation_samples": len(val_set),
+        "test_samples": len(test_set),
+        "target_recall": target_recall,
+    }
+    model.save(out_path)
+
+    report = evaluate(model, test_set)
+    report["model_path"] = out_path
+    return report
+
+
+def main() -> None:
+    # CLI only; keeps argparse off the server's import path
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Train/evaluate the extraction pre-filter")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    train_p = sub.add_parser("train", help="Train a model from an outcome log")
+    train_p.add_argument("--data", default=OUTCOME_LOG_PATH)
+    train_p.add_argument("--out", default=MODEL_PATH)
+    train_p.add_argument("--target-recall", type=float, default=DEFAULT_TARGET_RECALL)
+
+    eval_p = sub.add_parser("evaluate", help="Report calls saved vs memories missed")
+    eval_p.add_argument("--data", default=OUTCOME_LOG_PATH)
+    eval_p.add_argument("--model", default=MODEL_PATH)
+    eval_p.add_argument("--threshold", type=float, help="Evaluate at this threshold instead")
+
+    args = parser.parse_args()
+
+    if args.command == "train":
+        report = train(args.data, args.out, args.target_recall)
+    else:
+        model = PrefilterModel.load(args.model)
+        if args.threshold is not None:
+            model.threshold = args.threshold
+        report = evaluate(model, load_outcomes(args.data))
+
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,229 @@
+"""
+Chat Response Cache
+Reuses generated replies for repeated questions with identical memory context
+
+"Tell me a joke", "Explain WiFi" and the recall questions at the end of
+the demo scripts arrive again and again with the same memory context.
+Replies are cached under (normalized message, context hash, model,
+temperature band). In semantic mode, a query whose embedding is close
+enough to a cached query with the *same* context hash reuses its reply.
+
+Opt-in per deployment (RESPONSE_CACHE_ENABLED=true) and bypassed when
+the generation temperature is above RESPONSE_CACHE_MAX_TEMPERATURE.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+import numpy as np
+import logging
+
+from llm.extraction_cache import normalize_message
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+RESPONSE_CACHE_ENABLED = os.getenv("RESPONSE_CACHE_ENABLED", "false").lower() == "true"
+RESPONSE_CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "2000"))
+RESPONSE_CACHE_TTL_S = float(os.getenv("RESPONSE_CACHE_TTL_S", "3600"))
+# Above this temperature variety is the point - never serve cached replies
+RESPONSE_CACHE_MAX_TEMPERATURE = float(os.getenv("RESPONSE_CACHE_MAX_TEMPERATURE", "0.8"))
+RESPONSE_CACHE_SEMANTIC = os.getenv("RESPONSE_CACHE_SEMANTIC", "false").lower() == "true"
+RESPONSE_CACHE_SIMILARITY = float(os.getenv("RESPONSE_CACHE_SIMILARITY", "0.95"))
+SEMANTIC_BUCKET_SIZE = 64  # Cached queries compared per (context, model, band)
+EMBEDDING_MEMO_SIZE = 256
+
+
+def _temperature_band(temperature: float) -> str:
+    """Temperatures within 0.1 of each other produce interchangeable replies"""
+    return f"{round(temperature, 1):.1f}"
+
+
+def context_hash(context: Optional[str]) -> str:
+    """Stable fingerprint of the rendered memory context"""
+    return hashlib.sha1((context or "").encode("utf-8")).hexdigest()[:16]
+
+# ============================================
+# CACHE
+# ============================================
+class ResponseCache:
+    """
+    Bounded LRU cache of chat replies with TTL and optional semantic lookup
+
+    Args:
+        max_entries: LRU capacity
+        ttl: Seconds a reply stays valid
+        semantic: Enable embedding-similarity lookups
+        similarity: Cosine similarity required for a semantic hit
+    """
+
+    def __init__(
+        self,
+        max_entries: int = RESPONSE_CACHE_MAX_ENTRIES,
+        ttl: float = RESPONSE_CACHE_TTL_S,
+        semantic: bool = RESPONSE_CACHE_SEMANTIC,
+        similarity: float = RESPONSE_CACHE_SIMILARITY
+    ):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.semantic = semantic
+        self.similarity = similarity
+        self._entries: "OrderedDict[str, Tuple[float, str]]" = OrderedDict()
+        # (context hash, model, band) -> [(unit query embedding, exact key)]
+        self._semantic_index: "OrderedDict[Tuple[str, str, str], List[Tuple[np.ndarray, str]]]" = OrderedDict()
+        self._embeddings: "OrderedDict[str, np.ndarray]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.bypassed = 0
+        self.evictions = 0
+
+    @staticmethod
+    def cacheable(temperature: float) -> bool:
+        """High-temperature generations are never cached"""
+        return temperature <= RESPONSE_CACHE_MAX_TEMPERATURE
+
+    @staticmethod
+    def _key(normalized: str, ctx_hash: str, model: str, band: str) -> str:
+        raw = f"{model}\x00{band}\x00{ctx_hash}\x00{normalized}"
+        return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+    def _embed(self, normalized: str) -> Optional[np.ndarray]:
+        """Unit-normalized query embedding, memoized between get and put"""
+        with self._lock:
+            cached = self._embeddings.get(normalized)
+        if cached is not None:
+            return cached
+        try:
+            from memory.hf_embeddings import get_embedding
+            vector = np.asarray(get_embedding(normalized), dtype=np.float32).ravel()
+        except Exception as e:
+            logger.debug("Semantic response cache disabled for this query: %s", e)
+            return None
+        norm = np.linalg.norm(vector)
+        if not norm:
+            return None
+        vector = vector / norm
+        with self._lock:
+            self._embeddings[normalized] = vector
+            while len(self._embeddings) > EMBEDDING_MEMO_SIZE:
+                self._embeddings.popitem(last=False)
+        return vector
+
+    def _live(self, key: str, now: float) -> Optional[str]:
+        """Reply for key if present and unexpired (caller holds the lock)"""
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expires_at, reply = entry
+        if expires_at < now:
+            del self._entries[key]
+            return None
+        self._entries.move_to_end(key)
+        return reply
+
+    def get(self, message: str, context: Optional[str], model: str, temperature: float) -> Optional[str]:
+        """
+        Look up a cached reply
+
+        Returns:
+            Cached reply text, or None on miss/bypass
+        """
+        if not self.cacheable(temperature):
+            with self._lock:
+                self.bypassed += 1
+            return None
+
+        normalized = normalize_message(message)
+        ctx_hash = context_hash(context)
+        band = _temperature_band(temperature)
+        key = self._key(normalized, ctx_hash, model, band)
+        now = time.time()
+
+        with self._lock:
+            reply = self._live(key, now)
+            if reply is not None:
+                self.hits += 1
+                return reply
+
+        if self.semantic:
+            vector = self._embed(normalized)
+            if vector is not None:
+                with self._lock:
+                    best_key, best_sim = None, self.similarity
+                    for cached_vector, cached_key in self._semantic_index.get((ctx_hash, model, band), []):
+                        sim = float(np.dot(vector, cached_vector))
+                        if sim >= best_sim:
+                            best_key, best_sim = cached_key, sim
+                    reply = self._live(best_key, now) if best_key else None
+                    if reply is not None:
+                        self.hits += 1
+                        self.semantic_hits += 1
+                        logger.debug("Semantic response cache hit (similarity %.3f)", best_sim)
+                        return reply
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def put(self, message: str, context: Optional[str], model: str, temperature: float, reply: str) -> None:
+        """Cache a successfully generated reply"""
+        if not reply or not self.cacheable(temperature):
+            return
+
+        normalized = normalize_message(message)
+        ctx_hash = context_hash(context)
+        band = _temperature_band(temperature)
+        key = self._key(normalized, ctx_hash, model, band)
+        vector = self._embed(normalized) if self.semantic else None
+
+        with self._lock:
+            self._entries[key] = (time.time() + self.ttl, reply)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+            if vector is not None:
+                bucket_key = (ctx_hash, model, band)
+                # Drop entries whose reply was evicted or expired, and this key's old vector
+                bucket = [
+                    (v, k) for v, k in self._semantic_index.get(bucket_key, [])
+                    if k in self._entries and k != key
+                ]
+                bucket.append((vector, key))
+                self._semantic_index[bucket_key] = bucket[-SEMANTIC_BUCKET_SIZE:]
+                self._semantic_index.move_to_end(bucket_key)
+                while len(self._semantic_index) > self.max_entries:
+                    self._semantic_index.popitem(last=False)
+
+    def clear(self) -> None:
+        """Drop all entries"""
+        with self._lock:
+            self._entries.clear()
+            self._semantic_index.clear()
+            self._embeddings.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Hit-rate metrics"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "hits": self.hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "bypassed": self.bypassed,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "semantic": self.semantic,
+            }
+
+
+response_cache = ResponseCache() if RESPONSE_CACHE_ENABLED else None
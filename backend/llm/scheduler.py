@@ -0,0 +1,594 @@
+"""
+LLM Call Scheduler
+One shared Groq client with provider rate limits, priorities and bounded concurrency
+
+Generation, extraction and reflection all talk to the same Groq account,
+so they share its requests-per-minute and tokens-per-minute limits. Every
+call goes through this scheduler, which:
+
+1. Admits calls in priority order (interactive > extraction > reflection)
+2. Keeps request and token buckets below the provider's RPM/TPM limits
+   (opt-in via LLM_RPM / LLM_TPM; unset relies on 429 handling alone)
+3. Bounds concurrent calls, holding back slots for interactive traffic
+4. Honours 429 Retry-After by pausing admissions, then retries
+5. Records per-class queue wait and latency
+
+A call that cannot be admitted before its queue timeout fails as soon as
+that is known (e.g. the buckets are empty for longer than the timeout)
+rather than waiting the timeout out; interactive calls only queue briefly.
+"""
+
+import os
+import time
+import heapq
+import socket
+import itertools
+import threading
+from collections import deque
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from dotenv import load_dotenv
+import logging
+
+from llm.tokens import estimate_messages_tokens
+from utils.metrics import LLM_QUEUE_WAIT_SECONDS, LLM_REQUEST_SECONDS
+from utils.tracing import open_span, KIND_CLIENT
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+API_KEY = os.getenv("GROQ_API_KEY")
+BASE_URL = os.getenv("GROQ_BASE_URL") or None
+
+# Provider limits, e.g. 30 / 6000 on the Groq free tier (0 = not enforced locally)
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_RPM", "0"))
+TOKENS_PER_MINUTE = float(os.getenv("LLM_TPM", "0"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+# Slots background classes may never take, so a chat reply is never stuck behind them
+RESERVED_INTERACTIVE_SLOTS = int(os.getenv("LLM_RESERVED_INTERACTIVE_SLOTS", "1"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+DEFAULT_RETRY_AFTER_S = float(os.getenv("LLM_DEFAULT_RETRY_AFTER_S", "2"))
+MAX_RETRY_AFTER_S = float(os.getenv("LLM_MAX_RETRY_AFTER_S", "60"))
+
+# Priority classes - lower value is admitted first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_EXTRACTION = 1
+PRIORITY_REFLECTION = 2
+
+PRIORITY_NAMES = {
+    PRIORITY_INTERACTIVE: "interactive",
+    PRIORITY_EXTRACTION: "extraction",
+    PRIORITY_REFLECTION: "reflection",
+}
+
+# How long a call may wait for admission before giving up
+QUEUE_TIMEOUT_S = {
+    PRIORITY_INTERACTIVE: float(os.getenv("LLM_INTERACTIVE_QUEUE_TIMEOUT_S", "2")),
+    PRIORITY_EXTRACTION: float(os.getenv("LLM_EXTRACTION_QUEUE_TIMEOUT_S", "120")),
+    PRIORITY_REFLECTION: float(os.getenv("LLM_REFLECTION_QUEUE_TIMEOUT_S", "300")),
+}
+
+LATENCY_WINDOW = 500  # Samples kept per class for percentiles
+
+
+class SchedulerTimeout(Exception):
+    """Raised when a call could not be admitted within its queue timeout"""
+
+
+class CallCancelled(Exception):
+    """Raised when a call is cancelled while still queued for admission"""
+
+
+# ============================================
+# CANCELLATION
+# ============================================
+class CancelToken:
+    """
+    Lets another thread abandon a streaming call
+
+    cancel() wakes the call if it is still queued, hands its concurrency
+    slot back at once and shuts down its HTTP stream, so a read blocked
+    on the first token fails now instead of at the read timeout.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._callbacks: List[Callable[[], None]] = []
+        self.cancelled = False
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self.cancelled:
+                return
+            self.cancelled = True
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                logger.debug("Cancel callback failed: %s", e)
+
+    def on_cancel(self, callback: Callable[[], None]) -> None:
+        """Run callback on cancel (right away if already cancelled)"""
+        with self._lock:
+            if not self.cancelled:
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def discard(self, callback: Callable[[], None]) -> None:
+        with self._lock:
+            if callback in self._callbacks:
+                self._callbacks.remove(callback)
+
+
+def _abort_stream(stream: Any) -> None:
+    """
+    Shut down the socket under a streaming response from another thread
+
+    Closing the response does not wake a thread blocked reading it; a
+    socket shutdown does, and the reader then closes the stream itself.
+    """
+    response = getattr(stream, "response", None)
+    network_stream = getattr(response, "extensions", {}).get("network_stream")
+    sock = network_stream.get_extra_info("socket") if network_stream is not None else None
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+
+
+# ============================================
+# TOKEN BUCKET
+# ============================================
+class _TokenBucket:
+    """
+    Non-blocking token bucket refilled continuously at `per_minute / 60` per second
+
+    A limit of 0 disables the bucket.
+    """
+
+    def __init__(self, per_minute: float):
+        self.capacity = max(1.0, per_minute)
+        self.rate = per_minute / 60.0
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount: float, now: float) -> float:
+        """Seconds until `amount` tokens are available (0 if available now)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount or self.rate <= 0:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        if self.rate <= 0:
+            return
+        # May go negative when a reconciled usage exceeds the estimate
+        self.tokens -= min(amount, self.capacity)
+
+    def refund(self, amount: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + amount)
+
+
+# ============================================
+# PER-CLASS METRICS
+# ============================================
+class _ClassStats:
+    def __init__(self, name: str):
+        self.name = name
+        self.requests = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.tokens = 0
+        self.queue_wait = deque(maxlen=LATENCY_WINDOW)
+        self.latency = deque(maxlen=LATENCY_WINDOW)
+
+    def record_wait(self, seconds: float) -> None:
+        self.queue_wait.append(seconds)
+        LLM_QUEUE_WAIT_SECONDS.observe(seconds, priority=self.name)
+
+    def record_latency(self, seconds: float) -> None:
+        self.latency.append(seconds)
+        LLM_REQUEST_SECONDS.observe(seconds, priority=self.name)
+
+    @staticmethod
+    def _percentile(samples: List[float], pct: float) -> float:
+        if not samples:
+            return 0.0
+        ordered = sorted(samples)
+        return ordered[min(len(ordered) - 1, int(pct * len(ordered)))]
+
+    def snapshot(self) -> Dict[str, Any]:
+        latency = list(self.latency)
+        wait = list(self.queue_wait)
+        return {
+            "requests": self.requests,
+            "errors": self.errors,
+            "rate_limited": self.rate_limited,
+            "queue_timeouts": self.timeouts,
+            "cancelled": self.cancelled,
+            "tokens": self.tokens,
+            "latency_ms_p50": round(self._percentile(latency, 0.50) * 1000, 1),
+            "latency_ms_p95": round(self._percentile(latency, 0.95) * 1000, 1),
+            "queue_wait_ms_p50": round(self._percentile(wait, 0.50) * 1000, 1),
+            "queue_wait_ms_p95": round(self._percentile(wait, 0.95) * 1000, 1),
+        }
+
+
+# ============================================
+# SCHEDULER
+# ============================================
+class LLMScheduler:
+    """
+    Priority admission queue in front of a shared Groq client
+
+    Args:
+        rpm: Provider requests-per-minute limit
+        tpm: Provider tokens-per-minute limit
+        max_concurrency: Maximum calls in flight
+        reserved_interactive: Slots only interactive calls may use
+        max_retries: Retries after a 429 response
+    """
+
+    def __init__(
+        self,
+        rpm: float = REQUESTS_PER_MINUTE,
+        tpm: float = TOKENS_PER_MINUTE,
+        max_concurrency: int = MAX_CONCURRENCY,
+        reserved_interactive: int = RESERVED_INTERACTIVE_SLOTS,
+        max_retries: int = MAX_RETRIES
+    ):
+        self.max_concurrency = max(1, max_concurrency)
+        self.reserved_interactive = min(max(0, reserved_interactive), self.max_concurrency - 1)
+        self.max_retries = max(0, max_retries)
+        self._requests = _TokenBucket(rpm)
+        self._tokens = _TokenBucket(tpm)
+        self._cond = threading.Condition()
+        self._waiting: List[tuple] = []  # heap of (priority, seq)
+        self._seq = itertools.count()
+        self._in_flight = 0
+        self._paused_until = 0.0
+        self._client = None
+        self._client_lock = threading.Lock()
+        self._stats = {p: _ClassStats(name) for p, name in PRIORITY_NAMES.items()}
+
+    # ---------- client ----------
+    @property
+    def available(self) -> bool:
+        """True if an API key is configured"""
+        return bool(API_KEY)
+
+    def get_client(self):
+        """Lazily create the shared Groq client"""
+        if self._client is None:
+            with self._client_lock:
+                if self._client is None:
+                    from groq import Groq
+                    # Retries are owned by the scheduler so they respect the shared limits
+                    self._client = Groq(api_key=API_KEY, base_url=BASE_URL, max_retries=0)
+        return self._client
+
+    # ---------- admission ----------
+    def _slot_limit(self, priority: int) -> int:
+        if priority == PRIORITY_INTERACTIVE:
+            return self.max_concurrency
+        return self.max_concurrency - self.reserved_interactive
+
+    def _admission_wait(self, priority: int, tokens: float, now: float) -> Optional[float]:
+        """None if admissible now, else how long to wait before re-checking"""
+        if now < self._paused_until:
+            return self._paused_until - now
+        if self._in_flight >= self._slot_limit(priority):
+            return 1.0  # Woken by notify when a slot frees up
+        wait = max(self._requests.wait_time(1, now), self._tokens.wait_time(tokens, now))
+        return wait if wait > 0 else None
+
+    def _min_admission_wait(self, tokens: float, now: float) -> float:
+        """Lower bound on the wait from the 429 pause and the buckets alone"""
+        return max(
+            self._paused_until - now,
+            self._requests.wait_time(1, now),
+            self._tokens.wait_time(tokens, now),
+        )
+
+    def _acquire(self, priority: int, tokens: float, cancel: Optional[CancelToken] = None) -> float:
+        """Block until admitted; returns seconds spent queued"""
+        started = time.monotonic()
+        deadline = started + QUEUE_TIMEOUT_S.get(priority, 60.0)
+        ticket = (priority, next(self._seq))
+
+        def wake() -> None:
+            with self._cond:
+                self._cond.notify_all()
+
+        if cancel is not None:
+            cancel.on_cancel(wake)
+
+        with self._cond:
+            heapq.heappush(self._waiting, ticket)
+            try:
+                while True:
+                    if cancel is not None and cancel.cancelled:
+                        raise CallCancelled(f"{PRIORITY_NAMES[priority]} LLM call cancelled while queued")
+                    now = time.monotonic()
+                    # Strict priority: only the head of the queue may be admitted
+                    wait = 1.0 if self._waiting[0] != ticket else self._admission_wait(priority, tokens, now)
+                    if wait is None:
+                        break
+                    # Fail fast when the limits alone rule out admission in time
+                    if now >= deadline or now + self._min_admission_wait(tokens, now) > deadline:
+                        self._stats[priority].timeouts += 1
+                        raise SchedulerTimeout(
+                            f"{PRIORITY_NAMES[priority]} LLM call not admitted within "
+                            f"{QUEUE_TIMEOUT_S.get(priority, 60.0):.0f}s"
+                        )
+                    self._cond.wait(timeout=min(wait, deadline - now))
+            finally:
+                self._waiting.remove(ticket)
+                heapq.heapify(self._waiting)
+                # The next waiter may be admissible now
+                self._cond.notify_all()
+                if cancel is not None:
+                    cancel.discard(wake)
+
+            self._requests.consume(1)
+            self._tokens.consume(tokens)
+            self._in_flight += 1
+
+        return time.monotonic() - started
+
+    def _release(self, reserved_tokens: float, used_tokens: Optional[int]) -> None:
+        with self._cond:
+            self._in_flight -= 1
+            if used_tokens is not None:
+                # Reconcile the estimate with the provider-reported usage
+                delta = reserved_tokens - used_tokens
+                if delta > 0:
+                    self._tokens.refund(delta)
+                else:
+                    self._tokens.consume(-delta)
+            self._cond.notify_all()
+
+    def _release_once(self, reserved_tokens: float) -> Callable[[], None]:
+        """Release for one streaming call, safe to call from two threads"""
+        lock = threading.Lock()
+        released = False
+
+        def release() -> None:
+            nonlocal released
+            with lock:
+                if released:
+                    return
+                released = True
+            self._release(reserved_tokens, None)
+
+        return release
+
+    def _pause(self, seconds: float) -> None:
+        with self._cond:
+            self._paused_until = max(self._paused_until, time.monotonic() + seconds)
+            self._cond.notify_all()
+
+    @staticmethod
+    def _retry_after(error: Exception) -> float:
+        """Seconds to back off after a 429, from the Retry-After header if present"""
+        response = getattr(error, "response", None)
+        headers = getattr(response, "headers", None) or {}
+        value = headers.get("retry-after") or headers.get("x-ratelimit-reset-requests")
+        try:
+            seconds = float(str(value).rstrip("s"))
+        except (TypeError, ValueError):
+            seconds = DEFAULT_RETRY_AFTER_S
+        return min(max(seconds, 0.1), MAX_RETRY_AFTER_S)
+
+    # ---------- public API ----------
+    def chat_completion(self, priority: int, messages: List[Dict[str, str]], max_tokens: int, **kwargs):
+        """
+        Run a chat completion through the scheduler
+
+        Args:
+            priority: PRIORITY_INTERACTIVE, PRIORITY_EXTRACTION or PRIORITY_REFLECTION
+            messages: Chat messages
+            max_tokens: Completion token cap (counted against the TPM budget)
+            **kwargs: Passed to client.chat.completions.create (model, temperature, ...)
+
+        Returns:
+            Groq ChatCompletion
+
+        Raises:
+            SchedulerTimeout: If the call could not be admitted in time
+        """
+        from groq import RateLimitError
+
+        client = self.get_client()
+        stats = self._stats[priority]
+        reserved = estimate_messages_tokens(m.get("content", "") for m in messages) + max_tokens
+
+        for attempt in range(self.max_retries + 1):
+            call_span = open_span(
+                "llm.chat_completion", kind=KIND_CLIENT,
+                priority=stats.name, model=kwargs.get("model"), attempt=attempt
+            )
+            error = None
+            try:
+                stats.record_wait(self._acquire(priority, reserved))
+            except BaseException as e:
+                # Not admitted (e.g. SchedulerTimeout): nothing to release, but end the span
+                if call_span is not None:
+                    call_span.end(e)
+                raise
+            started = time.monotonic()
+            used = None
+            try:
+                response = client.chat.completions.create(messages=messages, max_tokens=max_tokens, **kwargs)
+                usage = getattr(response, "usage", None)
+                used = getattr(usage, "total_tokens", None)
+                stats.requests += 1
+                stats.tokens += used or reserved
+                stats.record_latency(time.monotonic() - started)
+                if call_span is not None:
+                    call_span.set_attribute("queue_wait_ms", round(stats.queue_wait[-1] * 1000, 2))
+                    call_span.set_attribute("total_tokens", used)
+                return response
+            except RateLimitError as e:
+                error = e
+                stats.rate_limited += 1
+                backoff = self._retry_after(e)
+                self._pause(backoff)
+                if attempt >= self.max_retries:
+                    stats.errors += 1
+                    raise
+                logger.warning(
+                    f"⚠️ LLM rate limited ({PRIORITY_NAMES[priority]}), "
+                    f"retrying in {backoff:.1f}s ({attempt + 1}/{self.max_retries})"
+                )
+            except Exception as e:
+                error = e
+                stats.errors += 1
+                raise
+            finally:
+                self._release(reserved, used)
+                if call_span is not None:
+                    call_span.end(error)
+
+    def stream_chat_completion(
+        self,
+        priority: int,
+        messages: List[Dict[str, str]],
+        max_tokens: int,
+        cancel: Optional[CancelToken] = None,
+        **kwargs
+    ) -> Iterator[Any]:
+        """
+        Streaming variant of chat_completion
+
+        The concurrency slot is held until the stream is exhausted or closed,
+        or until `cancel` is cancelled; a cancelled call just stops yielding.
+        A 429 is only retried before the first chunk has been yielded.
+
+        Yields:
+            Groq ChatCompletionChunk objects
+        """
+        from groq import RateLimitError
+
+        client = self.get_client()
+        stats = self._stats[priority]
+        reserved = estimate_messages_tokens(m.get("content", "") for m in messages) + max_tokens
+
+        for attempt in range(self.max_retries + 1):
+            call_span = open_span(
+                "llm.stream_chat_completion", kind=KIND_CLIENT,
+                priority=stats.name, model=kwargs.get("model"), attempt=attempt
+            )
+            error = None
+            try:
+                stats.record_wait(self._acquire(priority, reserved, cancel))
+            except CallCancelled:
+                stats.cancelled += 1
+                if call_span is not None:
+                    call_span.set_attribute("cancelled", True)
+                    call_span.end(None)
+                return
+            except BaseException as e:
+                if call_span is not None:
+                    call_span.end(e)
+                raise
+            started = time.monotonic()
+            yielded = False
+            stream = None
+            release = self._release_once(reserved)
+
+            def abort() -> None:
+                # Runs on the cancelling thread
+                release()
+                if stream is not None:
+                    _abort_stream(stream)
+
+            if cancel is not None:
+                cancel.on_cancel(abort)
+            try:
+                stream = client.chat.completions.create(
+                    messages=messages, max_tokens=max_tokens, stream=True, **kwargs
+                )
+                if cancel is not None and cancel.cancelled:
+                    # Cancelled while waiting for response headers
+                    stats.cancelled += 1
+                    return
+                for chunk in stream:
+                    if not yielded and call_span is not None:
+                        call_span.set_attribute("ttft_ms", round((time.monotonic() - started) * 1000, 2))
+                    yielded = True
+                    yield chunk
+                stats.requests += 1
+                stats.tokens += reserved
+                stats.record_latency(time.monotonic() - started)
+                return
+            except RateLimitError as e:
+                error = e
+                stats.rate_limited += 1
+                backoff = self._retry_after(e)
+                self._pause(backoff)
+                if yielded or attempt >= self.max_retries:
+                    stats.errors += 1
+                    raise
+            except GeneratorExit:
+                if call_span is not None:
+                    call_span.set_attribute("cancelled", True)
+                raise
+            except Exception as e:
+                if cancel is not None and cancel.cancelled:
+                    # The read failed because abort() shut the socket down
+                    stats.cancelled += 1
+                    if call_span is not None:
+                        call_span.set_attribute("cancelled", True)
+                    return
+                error = e
+                stats.errors += 1
+                raise
+            finally:
+                if cancel is not None:
+                    cancel.discard(abort)
+                # Closing early (e.g. a cancelled hedge) drops the HTTP connection
+                if stream is not None and hasattr(stream, "close"):
+                    stream.close()
+                release()
+                if call_span is not None:
+                    call_span.end(error)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue, bucket and per-class latency metrics"""
+        with self._cond:
+            now = time.monotonic()
+            self._requests._refill(now)
+            self._tokens._refill(now)
+            return {
+                "in_flight": self._in_flight,
+                "waiting": len(self._waiting),
+                "paused_for_s": round(max(0.0, self._paused_until - now), 2),
+                "request_tokens": round(self._requests.tokens, 2),
+                "tpm_tokens": round(self._tokens.tokens, 1),
+                "classes": {name: self._stats[p].snapshot() for p, name in PRIORITY_NAMES.items()},
+            }
+
+
+# ============================================
+# SHARED INSTANCE
+# ============================================
+scheduler = LLMScheduler()
+
+
+def llm_available() -> bool:
+    """True if LLM calls can be made"""
+    return scheduler.available
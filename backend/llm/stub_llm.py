@@ -0,0 +1,61 @@
+"""
+Local Stub LLM
+Deterministic, offline stand-in for the Groq extraction call
+
+Used by batch jobs and benchmarks so they can run without API keys or
+network access. It recognises the handful of first-person statement
+shapes that show up in the demo conversations and returns the same JSON
+shape as extract_memory().
+"""
+
+import re
+from typing import Optional, Dict, Any
+
+# (pattern, type, key) - first match wins
+STUB_RULES = [
+    (r"\ballergic to (?P<v>[\w\s]+)", "constraint", "allergy"),
+    (r"\bi am (?P<v>vegetarian|vegan)\b", "constraint", "dietary_restriction"),
+    (r"\b(?:i don't|i do not) (?P<v>eat [\w\s]+|drink [\w\s]+)", "constraint", "dietary_restriction"),
+    (r"\bi live in (?P<v>[\w\s]+)", "fact", "location"),
+    (r"\bi work as (?:a |an )?(?P<v>[\w\s]+)", "fact", "occupation"),
+    (r"\bi(?: am|'m) (?:a |an )(?P<v>[\w\s]+?(?:engineer|designer|student|developer|teacher|doctor))\b", "fact", "occupation"),
+    (r"\bi(?: am|'m) preparing for (?P<v>[\w\s]+)", "goal", "current_focus"),
+    (r"\bi(?: am|'m) (?:working on|building) (?P<v>[\w\s]+)", "goal", "current_project"),
+    (r"\bi want to (?P<v>[\w\s]+)", "goal", "aspiration"),
+    (r"\bi (?:wake up|get up) (?:at )?(?P<v>[\w\s:]+)", "habit", "wake_time"),
+    (r"\bi (?:usually )?sleep (?:at )?(?P<v>[\w\s:]+)", "habit", "sleep_time"),
+    (r"\b(?:preferred call time is|call me) (?P<v>[\w\s:]+)", "preference", "call_time"),
+    (r"\bi (?:prefer|like|love) (?P<v>[\w\s]+)", "preference", "general_preference"),
+]
+
+_COMPILED = [(re.compile(p, re.IGNORECASE), t, k) for p, t, k in STUB_RULES]
+
+
+def stub_extract_memory(message: str) -> Optional[Dict[str, Any]]:
+    """
+    Rule-based replacement for extract_memory()
+
+    Args:
+        message: User message
+
+    Returns:
+        Extraction dict in the LLM output format, or None
+    """
+    text = (message or "").strip()
+    if not text or text.endswith("?"):
+        return None
+
+    for pattern, memory_type, key in _COMPILED:
+        match = pattern.search(text)
+        if match:
+            if not match.group("v").strip():
+                continue
+            # Keep the user's own wording so keyword scoring stays meaningful
+            return {
+                "type": memory_type,
+                "key": key,
+                "value": text.rstrip("."),
+                "confidence": 0.9,
+            }
+
+    return None
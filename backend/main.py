@@ -149,25 +149,23 @@ FastAPI Memory Chat Backend
 Main application entry point with chat endpoint and memory pipeline
 """
 
-from fastapi import FastAPI, BackgroundTasks, HTTPException
+from fastapi import FastAPI, BackgroundTasks, HTTPException, Header
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, JSONResponse
 from pydantic import BaseModel, Field, validator
 import logging
 import sys
 import os
+import time
+import hmac
 from typing import Optional, List, Dict, Any
 
 # ============================================
 # LOGGING CONFIGURATION
 # ============================================
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.StreamHandler(sys.stdout),
-        logging.FileHandler('app.log') if os.environ.get('LOG_TO_FILE') else logging.NullHandler()
-    ]
-)
+# Records are formatted and written by a background thread
+from utils.logging_setup import configure_logging, stop_logging, logging_stats
+configure_logging()
 logger = logging.getLogger(__name__)
 
 # ============================================
@@ -200,15 +198,32 @@ app.add_middleware(
 # IMPORT CUSTOM MODULES
 # ============================================
 try:
-    from utils.session import get_turn
+    from utils.session import get_turn, preload_turn
     from llm.extractor import extract_memory
     from memory.schema import Memory
     from memory.add_memory import store_memory_async
     from memory.retrieve import retrieve_memories
     from memory.rank import rank_memories
-    from llm.context_builder import build_context
-    from llm.generator import generate_reply
-    from reflection.generate_reflection import generate_reflections
+    from llm.context_builder import build_session_context, context_cache_stats
+    from llm.generator import generate_reply, estimate_prompt_tokens, hedging_stats
+    from llm.response_cache import response_cache
+    from reflection.jobs import ReflectionScheduler
+    from memory.embedding_backfill import EmbeddingBackfillWorker
+    from llm.extractor import should_skip_extraction, extract_memories_batch, extraction_cache
+    from memory.turn_log import append_turn, record_reply, get_turn_message, close_all as close_turn_log
+    from utils.overload import OverloadGuard, DeferredBacklog, CatchUpWorker
+    from llm.scheduler import scheduler as llm_scheduler
+    from utils.metrics import timed, registry as metrics_registry, render_metrics
+    from utils.metrics import CHAT_REQUEST_SECONDS
+    from utils.tracing import start_trace, current_trace_id, set_attribute, KIND_INTERNAL
+    from utils.tracing import TracingMiddleware, collector as trace_collector
+    from utils.profiling import ProfilingMiddleware, profile_handler, profiling_stats
+    from utils.profiling import load_profile, flush_aggregate, PROFILE_ADMIN_TOKEN
+    from utils.warmup import WarmUp, WARMUP_ENABLED, WARMUP_HOT_SESSIONS
+    from utils.active_sessions import ActiveSessions
+    from memory.json_store import get_table, get_recent_sessions, get_active_memories_by_session
+    from memory.json_store import build_session_index, session_index_stats
+    from memory.embeddings import get_provider
     
     logger.info("✅ All modules imported successfully")
     MODULES_LOADED = True
@@ -217,6 +232,15 @@ except ImportError as e:
     logger.error("Some endpoints may not work properly")
     MODULES_LOADED = False
 
+    def profile_handler(fn):
+        return fn
+
+if MODULES_LOADED:
+    # Trace id per request, returned in X-Trace-Id
+    app.add_middleware(TracingMiddleware)
+    # Opt-in per-request and 1-in-N sampled profiling of /chat
+    app.add_middleware(ProfilingMiddleware)
+
 # ============================================
 # REQUEST/RESPONSE MODELS
 # ============================================
@@ -242,6 +266,7 @@ class ChatResponse(BaseModel):
     reply: str
     used_memory: List[Dict[str, Any]] = []
     turn: Optional[int] = None
+    prompt_tokens: Optional[int] = None
     error: Optional[str] = None
 
 class HealthResponse(BaseModel):
@@ -254,53 +279,249 @@ class HealthResponse(BaseModel):
 # ============================================
 # BACKGROUND TASKS
 # ============================================
-def memory_pipeline(session_id: str, message: str, turn: int) -> None:
+def extract_and_store(session_id: str, message: str, turn: int) -> bool:
     """
-    Background task to extract and store memories
+    Extract a memory from one message and store it
     
     Args:
         session_id: User session identifier
         message: User message
-        turn: Current conversation turn number
-    """
-    try:
-        logger.info(f"Starting memory pipeline for session {session_id}, turn {turn}")
+        turn: Conversation turn the message belongs to
         
-        # Extract memory from message
+    Returns:
+        True if a memory was stored
+    """
+    # Messages the heuristic rejects never reach the LLM, so they must not
+    # pull down the latency estimate used for load shedding
+    if should_skip_extraction(message):
+        return False
+
+    # Extract memory from message
+    started = time.monotonic()
+    with timed("extract"):
         extracted = extract_memory(message)
+    overload_guard.record_latency(time.monotonic() - started)
 
-        # Validate extraction result
-        if not extracted or not isinstance(extracted, dict):
-            logger.debug(f"No memory extracted from message: {message[:50]}...")
-            return
-
-        # Ensure required fields
-        if not extracted.get("value"):
-            logger.warning("Extracted memory missing 'value' field")
-            return
-
-        # Create memory object
-        memory = Memory(
-            session_id=session_id,
-            type=extracted.get("type", "fact"),
-            key=extracted.get("key", "general"),
-            value=extracted.get("value", ""),
-            confidence=float(extracted.get("confidence", 0.7)),
-            source_turn=turn,
-            last_used_turn=turn
-        )
+    return store_extracted(session_id, extracted, turn)
+
+
+def store_extracted(session_id: str, extracted: Optional[Dict[str, Any]], turn: int) -> bool:
+    """
+    Validate an extraction result and store it as a memory
+    
+    Args:
+        session_id: User session identifier
+        extracted: Output of the extractor (may be None)
+        turn: Conversation turn the message belongs to
+        
+    Returns:
+        True if a memory was stored
+    """
+    # Validate extraction result
+    if not extracted or not isinstance(extracted, dict):
+        logger.debug("No memory extracted at turn %s", turn)
+        return False
+
+    # Ensure required fields
+    if not extracted.get("value"):
+        logger.warning("Extracted memory missing 'value' field")
+        return False
+
+    # Create memory object
+    memory = Memory(
+        session_id=session_id,
+        type=extracted.get("type", "fact"),
+        key=extracted.get("key", "general"),
+        value=extracted.get("value", ""),
+        confidence=float(extracted.get("confidence", 0.7)),
+        source_turn=turn,
+        last_used_turn=turn
+    )
+
+    # Store memory (None means a duplicate or a storage error)
+    with timed("store"):
+        memory_id = store_memory_async(memory)
+    if not memory_id:
+        return False
 
-        # Store memory
-        store_memory_async(memory)
-        logger.info(f"Memory stored: {memory.key} = {memory.value[:50]}...")
+    logger.info("Memory stored: %s = %.50s...", memory.key, memory.value)
+    # New material for reflection; the job debounces and coalesces triggers
+    reflection_jobs.note_memories_stored(session_id, 1, turn)
+    return True
 
-        # Generate reflections every 5 turns
-        if turn % 5 == 0:
-            logger.info(f"Generating reflections at turn {turn}")
-            generate_reflections(session_id, turn)
+
+def memory_pipeline(session_id: str, message: str, turn: int, trace_id: Optional[str] = None) -> None:
+    """
+    Background task to extract and store memories
+    
+    Runs with a slot reserved in the overload guard, released on exit.
+    
+    Args:
+        session_id: User session identifier
+        message: User message
+        turn: Current conversation turn number
+        trace_id: Trace id of the /chat request that scheduled it
+    """
+    try:
+        logger.info("Starting memory pipeline for session %s, turn %s", session_id, turn)
+        
+        with start_trace("memory_pipeline", trace_id=trace_id, kind=KIND_INTERNAL, session_id=session_id, turn=turn):
+            extract_and_store(session_id, message, turn)
             
     except Exception as e:
         logger.error(f"Error in memory_pipeline: {e}", exc_info=True)
+    finally:
+        overload_guard.release()
+
+
+def process_deferred_batch(entries: List[Dict[str, Any]]) -> None:
+    """
+    Run extraction for turns that were deferred under overload
+    
+    Args:
+        entries: Deferred backlog entries with session_id and turn
+        
+    Raises:
+        Extraction errors, so the catch-up worker backs off and retries
+        (eventually dead-lettering an entry that keeps failing)
+    """
+    found = []
+    for entry in entries:
+        session_id, turn = entry["session_id"], entry["turn"]
+        message = get_turn_message(session_id, turn)
+        if message is None:
+            logger.warning("Deferred turn %s missing from turn log (%s)", turn, session_id)
+            continue
+        found.append((session_id, turn, message))
+
+    # Pack the whole batch into as few LLM calls as the token budget allows
+    with start_trace("deferred_extraction", kind=KIND_INTERNAL, batch=len(found)):
+        with timed("extract"):
+            results = extract_memories_batch([message for _, _, message in found])
+
+        for (session_id, turn, _), extracted in zip(found, results):
+            try:
+                store_extracted(session_id, extracted, turn)
+            except Exception as e:
+                logger.error(f"Error processing deferred turn: {e}", exc_info=True)
+
+
+if MODULES_LOADED:
+    overload_guard = OverloadGuard()
+    deferred_backlog = DeferredBacklog()
+    catchup_worker = CatchUpWorker(overload_guard, deferred_backlog, process_deferred_batch)
+    # Reflection only runs while the memory pipeline has spare capacity
+    reflection_jobs = ReflectionScheduler(can_run=overload_guard.has_capacity)
+    # Memories are stored first and embedded here, off the pipeline's path
+    embedding_backfill = EmbeddingBackfillWorker()
+
+
+def _cache_lookups():
+    """Hit/miss counts from each cache's own stats (read at scrape time)"""
+    caches = {
+        "extraction": extraction_cache.stats() if extraction_cache else None,
+        "response": response_cache.stats() if response_cache else None,
+        "context": context_cache_stats(),
+    }
+    for name, stats in caches.items():
+        if stats:
+            yield {"cache": name, "result": "hit"}, stats["hits"]
+            yield {"cache": name, "result": "miss"}, stats["misses"]
+
+
+def _llm_calls():
+    for priority, stats in llm_scheduler.stats()["classes"].items():
+        for outcome, key in (("ok", "requests"), ("error", "errors"), ("rate_limited", "rate_limited"),
+                             ("queue_timeout", "queue_timeouts")):
+            yield {"priority": priority, "outcome": outcome}, stats[key]
+
+
+def _queue_depths():
+    guard = overload_guard.stats()
+    scheduler_stats = llm_scheduler.stats()
+    yield {"queue": "memory_pipeline"}, guard["pending"]
+    yield {"queue": "deferred_backlog"}, deferred_backlog.depth()
+    yield {"queue": "llm_waiting"}, scheduler_stats["waiting"]
+    yield {"queue": "llm_in_flight"}, scheduler_stats["in_flight"]
+    yield {"queue": "reflection_jobs"}, reflection_jobs.stats()["pending"]
+
+
+if MODULES_LOADED:
+    metrics_registry.add_collector(
+        "cache_lookups_total", "counter", "Cache lookups by cache and result", _cache_lookups
+    )
+    metrics_registry.add_collector(
+        "llm_calls_total", "counter", "LLM calls by scheduler priority class and outcome", _llm_calls
+    )
+    metrics_registry.add_collector(
+        "background_queue_depth", "gauge", "Items waiting in background queues", _queue_depths
+    )
+
+
+def _warm_llm_client():
+    if llm_scheduler.available:
+        llm_scheduler.get_client()
+        return "groq"
+    return "not configured"
+
+
+def _load_hot_sessions():
+    """Recently active sessions (newest first) with their active memories"""
+    session_ids = active_sessions.recent(WARMUP_HOT_SESSIONS)
+    if not session_ids:
+        # No activity recorded yet (first deploy): use the newest writes
+        session_ids = get_recent_sessions(WARMUP_HOT_SESSIONS)
+    snapshot = get_active_memories_by_session(session_ids)
+    return [(session_id, snapshot[session_id]) for session_id in session_ids]
+
+
+def _warm_session(session_id, snapshot):
+    """Turn counter and embedding index, so the first request finds both ready"""
+    version, memories = snapshot
+    preload_turn(session_id)
+    build_session_index(session_id, memories, version)
+
+
+if MODULES_LOADED:
+    # Everything below is otherwise built by the first request that needs it
+    # Sessions seen on /chat, persisted so the next boot knows whom to warm
+    active_sessions = ActiveSessions()
+
+    warmup = WarmUp()
+    warmup.add_step("database", lambda: {"memories": len(get_table())})
+    warmup.add_step("extraction_cache", lambda: extraction_cache.ensure_loaded() if extraction_cache else None)
+    warmup.add_step("llm_client", _warm_llm_client)
+    warmup.add_step("embedding_provider", lambda: get_provider().name)
+    warmup.warm_sessions(_load_hot_sessions, _warm_session)
+
+
+@app.on_event("startup")
+def start_background_workers() -> None:
+    """Start the deferred-extraction catch-up, reflection and embedding workers"""
+    if MODULES_LOADED:
+        catchup_worker.start()
+        reflection_jobs.start()
+        embedding_backfill.start()
+        active_sessions.load()
+        active_sessions.start()
+        if WARMUP_ENABLED:
+            # Returns immediately; runs while uvicorn binds the port
+            warmup.start()
+
+
+@app.on_event("shutdown")
+def stop_background_workers() -> None:
+    """Stop background workers"""
+    if MODULES_LOADED:
+        catchup_worker.stop()
+        reflection_jobs.stop()
+        embedding_backfill.stop()
+        active_sessions.stop()
+        close_turn_log()
+        if extraction_cache:
+            extraction_cache.save()
+        flush_aggregate()
+    stop_logging()
 
 # ============================================
 # ENDPOINTS
@@ -320,6 +541,7 @@ def health() -> HealthResponse:
     )
 
 @app.post("/chat", response_model=ChatResponse)
+@profile_handler
 def chat(req: ChatRequest, bg: BackgroundTasks) -> ChatResponse:
     """
     Main chat endpoint with memory retrieval and storage
@@ -331,9 +553,11 @@ def chat(req: ChatRequest, bg: BackgroundTasks) -> ChatResponse:
     Returns:
         ChatResponse with reply and used memories
     """
+    started = time.perf_counter()
+    outcome = "error"
     try:
-        logger.info(f"Chat request from session: {req.session_id}")
-        logger.debug(f"Message: {req.message[:100]}...")
+        logger.info("Chat request from session: %s", req.session_id)
+        logger.debug("Message: %.100s...", req.message)
         
         # Check if modules are loaded
         if not MODULES_LOADED:
@@ -344,32 +568,51 @@ def chat(req: ChatRequest, bg: BackgroundTasks) -> ChatResponse:
         
         # Get turn number
         turn = get_turn(req.session_id)
-        logger.debug(f"Current turn: {turn}")
+        active_sessions.touch(req.session_id)
+        set_attribute("session_id", req.session_id)
+        set_attribute("turn", turn)
+        logger.debug("Current turn: %s", turn)
+
+        # Persist the raw message before anything can drop it
+        append_turn(req.session_id, turn, req.message)
 
         # ---------- RETRIEVE MEMORIES ----------
         memories = retrieve_memories(req.session_id, req.message)
-        logger.info(f"Retrieved {len(memories)} memories")
+        logger.info("Retrieved %d memories", len(memories))
 
         # ---------- RANK MEMORIES ----------
-        ranked_memories = rank_memories(memories, turn)
-        logger.debug(f"Ranked {len(ranked_memories)} memories")
+        with timed("rank"):
+            ranked_memories = rank_memories(memories, turn)
+        logger.debug("Ranked %d memories", len(ranked_memories))
 
         # ---------- BUILD CONTEXT ----------
-        context = build_context(ranked_memories)
-        if context:
-            logger.debug(f"Context built: {len(context)} characters")
+        with timed("context"):
+            context, context_stats = build_session_context(req.session_id, ranked_memories)
+        prompt_tokens = estimate_prompt_tokens(req.message, context)
+        logger.info(
+            "Prompt: ~%d tokens (%d from memory context%s)",
+            prompt_tokens, context_stats.get('context_tokens', 0), ', cached' if context_stats.get('cached') else ''
+        )
 
         # ---------- GENERATE REPLY ----------
-        reply = generate_reply(req.message, context)
-        logger.info(f"Reply generated: {len(reply)} characters")
+        with timed("generate"):
+            reply = generate_reply(req.message, context)
+        logger.info("Reply generated: %d characters", len(reply))
+        record_reply(req.session_id, turn, len(reply))
 
         # ---------- SCHEDULE BACKGROUND MEMORY EXTRACTION ----------
-        bg.add_task(memory_pipeline, req.session_id, req.message, turn)
+        if overload_guard.try_acquire():
+            bg.add_task(memory_pipeline, req.session_id, req.message, turn, current_trace_id())
+        elif not should_skip_extraction(req.message):
+            # Shed load: the turn log keeps the message, catch-up extracts later
+            deferred_backlog.push(req.session_id, turn)
 
+        outcome = "ok"
         return ChatResponse(
             reply=reply,
             used_memory=ranked_memories,
-            turn=turn
+            turn=turn,
+            prompt_tokens=prompt_tokens
         )
         
     except HTTPException:
@@ -383,6 +626,103 @@ def chat(req: ChatRequest, bg: BackgroundTasks) -> ChatResponse:
             used_memory=[],
             error=str(e) if os.environ.get("DEBUG") else None
         )
+    finally:
+        if MODULES_LOADED:
+            CHAT_REQUEST_SECONDS.observe(time.perf_counter() - started, outcome=outcome)
+
+@app.get("/pipeline/status")
+def pipeline_status():
+    """
+    Background memory pipeline load and deferred backlog depth
+    """
+    if not MODULES_LOADED:
+        raise HTTPException(status_code=503, detail="Server modules not loaded properly")
+
+    return {
+        "guard": overload_guard.stats(),
+        "deferred_backlog": deferred_backlog.depth(),
+        "caught_up": catchup_worker.drained,
+        "dead_lettered": catchup_worker.dead_lettered,
+        "extraction_cache": extraction_cache.stats() if extraction_cache else None,
+        "context_cache": context_cache_stats(),
+        "llm_scheduler": llm_scheduler.stats(),
+        "generation_hedging": hedging_stats(),
+        "response_cache": response_cache.stats() if response_cache else None,
+        "reflection_jobs": reflection_jobs.stats(),
+        "embedding_backfill": embedding_backfill.stats(),
+        "tracing": trace_collector.stats(),
+        "profiling": profiling_stats(),
+        "logging": logging_stats(),
+        "warmup": warmup.stats(),
+        "session_index": session_index_stats(),
+        "active_sessions": active_sessions.stats()
+    }
+
+@app.get("/ready")
+def ready():
+    """
+    Readiness probe: 503 until the startup warm-up has finished
+
+    Liveness stays on "/"; point the load balancer's readiness check here
+    so traffic waits for hot sessions to be preloaded.
+    """
+    if not MODULES_LOADED:
+        return JSONResponse(status_code=503, content={"ready": False, "reason": "modules not loaded"})
+
+    status = warmup.stats()
+    return JSONResponse(status_code=200 if status["ready"] else 503, content=status)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics() -> PlainTextResponse:
+    """
+    Per-stage latency histograms and counters in Prometheus text format
+    """
+    if not MODULES_LOADED:
+        raise HTTPException(status_code=503, detail="Server modules not loaded properly")
+
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+@app.get("/debug/traces")
+def debug_traces(limit: int = 20):
+    """
+    Slowest retained traces (requests and background jobs), slowest first
+    """
+    if not MODULES_LOADED:
+        raise HTTPException(status_code=503, detail="Server modules not loaded properly")
+
+    return {**trace_collector.stats(), "traces": trace_collector.slowest(limit)}
+
+
+@app.get("/debug/traces/{trace_id}")
+def debug_trace(trace_id: str):
+    """
+    A request trace together with its background job traces, if retained
+    """
+    if not MODULES_LOADED:
+        raise HTTPException(status_code=503, detail="Server modules not loaded properly")
+
+    traces = trace_collector.get(trace_id)
+    if not traces:
+        raise HTTPException(status_code=404, detail="Trace not retained (only the slowest are kept)")
+    return {"trace_id": trace_id, "traces": traces}
+
+
+@app.get("/debug/profiles/{profile_id}", response_class=PlainTextResponse)
+def debug_profile(profile_id: str, x_profile_token: Optional[str] = Header(None)) -> PlainTextResponse:
+    """
+    A persisted on-demand profile (pstats text or collapsed stacks)
+
+    Requires the same X-Profile-Token as the profiled request.
+    """
+    if not MODULES_LOADED:
+        raise HTTPException(status_code=503, detail="Server modules not loaded properly")
+    if not PROFILE_ADMIN_TOKEN or not x_profile_token or not hmac.compare_digest(x_profile_token, PROFILE_ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Profiling not enabled or bad token")
+
+    profile = load_profile(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return PlainTextResponse(profile["content"], headers={"X-Profile-Format": profile["format"]})
 
 # ============================================
 # OPTIONAL: MEMORY MANAGEMENT ENDPOINTS
@@ -174,20 +174,32 @@
 Memory storage with HuggingFace API embeddings
 Uses semantic similarity for duplicate detection
 """
+import os
 import uuid
+import logging
 from datetime import datetime
 
+import numpy as np
+
 from memory.json_store import (
     add_memory, 
+    add_memories,
+    get_memories,
     get_memory_by_key, 
     update_memory,
     search_memories_semantic
 )
 from memory.hf_embeddings import get_embedding, batch_cosine_similarity
+from memory.embeddings import EMBEDDING_SPACE_KEY, embedding_space, comparable_embedding
+
+logger = logging.getLogger(__name__)
 
 
 SIM_THRESHOLD = 0.90  # Cosine similarity threshold for duplicates
 
+# Background writes persist first and leave embedding to the backfill worker
+DEFER_EMBEDDING = os.getenv("DEFER_EMBEDDING", "true").lower() == "true"
+
 
 # ---------------------------------------------------------
 # MEMORY SENTENCE BUILDER
@@ -222,6 +234,7 @@ def is_duplicate(memory_text, session_id):
     """
     try:
         # Get embedding for new memory
+        space = embedding_space()
         new_embedding = get_embedding(memory_text)
         
         # Search for similar memories
@@ -232,7 +245,7 @@ def is_duplicate(memory_text, session_id):
         
         # Check similarities
         for mem in similar:
-            if 'embedding' not in mem or not mem['embedding']:
+            if not comparable_embedding(mem, space):
                 continue
             
             similarity = batch_cosine_similarity(
@@ -241,11 +254,11 @@ def is_duplicate(memory_text, session_id):
             )[0]
             
             if similarity > SIM_THRESHOLD:
-                print(f"⚠️ Duplicate found (similarity={similarity:.2f}), skipping")
+                logger.info("⚠️ Duplicate found (similarity=%.2f), skipping", similarity)
                 return True
         
     except Exception as e:
-        print(f"Duplicate check error: {e}")
+        logger.warning("Duplicate check error: %s", e)
         # If API fails, do basic text matching fallback
         similar = search_memories_semantic(session_id, memory_text, limit=3)
         memory_lower = memory_text.lower()
@@ -253,12 +266,22 @@ def is_duplicate(memory_text, session_id):
         for mem in similar:
             existing_text = mem.get('text', '').lower()
             if memory_lower == existing_text:
-                print(f"⚠️ Exact text match found, skipping")
+                logger.info("⚠️ Exact text match found, skipping")
                 return True
     
     return False
 
 
+def is_exact_duplicate(memory_text, session_id):
+    """Cheap duplicate check with no embedding call (store-first path)"""
+    memory_lower = memory_text.lower()
+    for mem in get_memories(session_id, is_active=True):
+        if mem.get('text', '').lower() == memory_lower:
+            logger.info("⚠️ Exact text match found, skipping")
+            return True
+    return False
+
+
 # ---------------------------------------------------------
 # DEACTIVATE OLD MEMORY (UPDATE LOGIC)
 # ---------------------------------------------------------
@@ -278,19 +301,29 @@ def deactivate_old_memory(session_id, key):
                 'updated_at': datetime.utcnow().isoformat()
             }
         )
-        print(f"♻️ Memory updated → old deactivated: {mem['key']}")
+        logger.info("♻️ Memory updated → old deactivated: %s", mem['key'])
 
 
 # ---------------------------------------------------------
 # CORE STORAGE LOGIC
 # ---------------------------------------------------------
-def store_memory(memory):
-    """Store a memory in the database with HuggingFace embedding"""
+def store_memory(memory, defer_embedding=False):
+    """
+    Store a memory in the database with HuggingFace embedding
+    
+    With defer_embedding the memory is written immediately as
+    pending_embedding and the backfill worker embeds it (and runs the
+    semantic duplicate check) later, keeping the HF round trip off the
+    caller's path.
+    """
     
     memory_text = build_memory_sentence(memory)
     
     # -------- DUPLICATE CHECK --------
-    if is_duplicate(memory_text, memory.session_id):
+    if defer_embedding:
+        if is_exact_duplicate(memory_text, memory.session_id):
+            return None
+    elif is_duplicate(memory_text, memory.session_id):
         return None
     
     # -------- UPDATE OLD MEMORY --------
@@ -300,12 +333,14 @@ def store_memory(memory):
         deactivate_old_memory(memory.session_id, memory.key)
     
     # -------- GENERATE EMBEDDING VIA HF API --------
-    try:
-        embedding = get_embedding(memory_text)
-        embedding_list = embedding.tolist() if hasattr(embedding, 'tolist') else list(embedding)
-    except Exception as e:
-        print(f"Warning: Could not generate embedding: {e}")
-        embedding_list = None
+    embedding_list = None
+    space = embedding_space()
+    if not defer_embedding:
+        try:
+            embedding = get_embedding(memory_text)
+            embedding_list = embedding.tolist() if hasattr(embedding, 'tolist') else list(embedding)
+        except Exception as e:
+            logger.warning("Could not generate embedding: %s", e)
     
     # -------- STORE NEW MEMORY --------
     memory_id = str(uuid.uuid4())
@@ -318,6 +353,8 @@ def store_memory(memory):
         "value": memory.value,
         "text": memory_text,
         "embedding": embedding_list,  # Store embedding for future searches
+        EMBEDDING_SPACE_KEY: space if embedding_list is not None else None,
+        "pending_embedding": embedding_list is None,  # Picked up by the backfill worker
         "confidence": float(memory.confidence),
         "source_turn": int(memory.source_turn),
         "last_used_turn": int(memory.last_used_turn),
@@ -328,17 +365,145 @@ def store_memory(memory):
     
     add_memory(memory_data)
     
-    print(f"✅ Memory stored: {memory_text}")
+    logger.info("✅ Memory stored: %s", memory_text)
     
     return memory_id
 
 
+# ---------------------------------------------------------
+# BATCH STORAGE
+# ---------------------------------------------------------
+def _unit_rows(vectors):
+    """Row-normalize a 2-D array (zero rows stay zero)"""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _build_record(memory, memory_text, embedding_list, space):
+    return {
+        "id": str(uuid.uuid4()),
+        "session_id": memory.session_id,
+        "type": memory.type,
+        "key": memory.key,
+        "value": memory.value,
+        "text": memory_text,
+        "embedding": embedding_list,
+        EMBEDDING_SPACE_KEY: space if embedding_list is not None else None,
+        "pending_embedding": embedding_list is None,
+        "confidence": float(memory.confidence),
+        "importance_score": memory.importance_score,
+        "source_turn": int(memory.source_turn),
+        "last_used_turn": int(memory.last_used_turn),
+        "is_active": True,
+        "created_at": datetime.utcnow().isoformat(),
+        "updated_at": ""
+    }
+
+
+def _store_session_batch(session_id, items):
+    """
+    Dedupe and store (index, memory, text) items of one session
+
+    Returns:
+        {input index: memory_id} for the memories written
+    """
+    existing = get_memories(session_id, is_active=True)
+
+    # -------- ONE EMBEDDING REQUEST FOR THE WHOLE BATCH --------
+    space = embedding_space()
+    try:
+        new_matrix = _unit_rows(get_embedding([text for _, _, text in items]))
+    except Exception as e:
+        logger.warning("Could not generate batch embeddings: %s", e)
+        new_matrix = None
+
+    # -------- DUPLICATES AGAINST THE SESSION (ONE MATRIX PRODUCT) --------
+    is_dup = [False] * len(items)
+    if new_matrix is not None:
+        stored = [m for m in existing if comparable_embedding(m, space)]
+        dims = {len(m["embedding"]) for m in stored}
+        if stored and dims == {new_matrix.shape[1]}:
+            sims = new_matrix @ _unit_rows([m["embedding"] for m in stored]).T
+            is_dup = list(sims.max(axis=1) > SIM_THRESHOLD)
+
+        # -------- DUPLICATES WITHIN THE BATCH --------
+        pairwise = new_matrix @ new_matrix.T
+        accepted = []
+        for i in range(len(items)):
+            if is_dup[i]:
+                continue
+            if any(pairwise[i, j] > SIM_THRESHOLD for j in accepted):
+                is_dup[i] = True
+                continue
+            accepted.append(i)
+    else:
+        # No embeddings: fall back to exact text matching
+        seen = {m.get("text", "").lower() for m in existing}
+        for i, (_, _, text) in enumerate(items):
+            if text.lower() in seen:
+                is_dup[i] = True
+            seen.add(text.lower())
+
+    records, written = [], {}
+    for i, (index, memory, text) in enumerate(items):
+        if is_dup[i]:
+            logger.info("⚠️ Duplicate found in batch, skipping: %s", text)
+            continue
+        embedding_list = new_matrix[i].tolist() if new_matrix is not None else None
+        record = _build_record(memory, text, embedding_list, space)
+        records.append(record)
+        written[index] = record["id"]
+
+    if not records:
+        return written
+
+    # -------- SUPERSEDED KEYS --------
+    keys = {r["key"] for r in records}
+    superseded = [m["id"] for m in existing if m.get("key") in keys]
+
+    # -------- ONE BATCH WRITE (RETIRE + INSERT) --------
+    add_memories(records, deactivate_ids=superseded)
+    logger.info("✅ Batch stored: %d memories, %d superseded (%s)", len(records), len(superseded), session_id)
+    return written
+
+
+def store_memories_batch(memories):
+    """
+    Store many memories with one embedding request and one batch write per session
+
+    Same rules as store_memory: near-duplicates (of stored memories or of
+    each other) are skipped and older memories with the same key are
+    deactivated. Within the batch the last memory for a key wins.
+
+    Returns:
+        List of memory IDs aligned with `memories` (None where skipped)
+    """
+    ids = [None] * len(memories)
+
+    # Group by session, keeping only the last memory per (session, key)
+    sessions = {}
+    for index, memory in enumerate(memories):
+        sessions.setdefault(memory.session_id, {})[memory.key] = index
+
+    for session_id, latest in sessions.items():
+        items = [
+            (index, memories[index], build_memory_sentence(memories[index]))
+            for index in sorted(latest.values())
+        ]
+        for index, memory_id in _store_session_batch(session_id, items).items():
+            ids[index] = memory_id
+
+    return ids
+
+
 # ---------------------------------------------------------
 # ASYNC WRAPPER (used by BackgroundTasks)
 # ---------------------------------------------------------
 def store_memory_async(memory):
-    """Async wrapper for background tasks"""
+    """Async wrapper for background tasks (returns the memory ID, or None)"""
     try:
-        store_memory(memory)
+        return store_memory(memory, defer_embedding=DEFER_EMBEDDING)
     except Exception as e:
-        print(f"Memory async storage error: {e}")
\ No newline at end of file
+        logger.error("Memory async storage error: %s", e)
\ No newline at end of file
@@ -0,0 +1,146 @@
+"""
+Embedding Backfill Worker
+Embeds memories that were stored without an embedding
+
+The background pipeline stores memories first (pending_embedding) so a
+slow or failing HuggingFace API never holds it up. This worker picks up
+every active memory without an embedding - pending writes as well as
+older writes whose embedding request failed, or memories embedded by a
+different provider than the configured one - embeds them in batches
+with one request each, and attaches the vectors in one DB write.
+
+Because store-first writes only get an exact-text duplicate check, the
+semantic duplicate check happens here: a newly embedded memory that is
+a near-duplicate of an already embedded one in its session is retired.
+"""
+
+import os
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+import logging
+
+from memory.json_store import get_memories, get_memories_missing_embeddings, set_embeddings
+from memory.hf_embeddings import get_embedding
+from memory.embeddings import embedding_space, comparable_embedding
+from memory.add_memory import SIM_THRESHOLD
+from utils.tracing import start_trace, KIND_INTERNAL
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+BACKFILL_BATCH_SIZE = int(os.getenv("EMBEDDING_BACKFILL_BATCH_SIZE", "32"))
+BACKFILL_INTERVAL_S = float(os.getenv("EMBEDDING_BACKFILL_INTERVAL_S", "2"))
+# Back off while the embedding API keeps failing
+BACKFILL_MAX_BACKOFF_S = float(os.getenv("EMBEDDING_BACKFILL_MAX_BACKOFF_S", "60"))
+
+
+def _unit(vectors: Any) -> np.ndarray:
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[None, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+def _late_duplicates(batch: List[Dict[str, Any]], vectors: np.ndarray, space: str) -> List[str]:
+    """IDs in `batch` that near-duplicate an embedded memory of the same session"""
+    duplicates = []
+    by_session: Dict[str, List[int]] = {}
+    for i, mem in enumerate(batch):
+        by_session.setdefault(mem.get("session_id"), []).append(i)
+
+    for session_id, rows in by_session.items():
+        stored = [m for m in get_memories(session_id, is_active=True) if comparable_embedding(m, space)]
+        stored = [m for m in stored if len(m["embedding"]) == vectors.shape[1]]
+        accepted = _unit([m["embedding"] for m in stored]) if stored else None
+
+        for i in rows:
+            vector = vectors[i:i + 1]
+            if accepted is not None and float((accepted @ vector.T).max()) > SIM_THRESHOLD:
+                duplicates.append(batch[i]["id"])
+                continue
+            # Later rows in the batch are compared against earlier survivors too
+            accepted = vector if accepted is None else np.vstack([accepted, vector])
+
+    return duplicates
+
+
+def backfill_once(batch_size: int = BACKFILL_BATCH_SIZE) -> int:
+    """
+    Embed one batch of memories missing embeddings
+
+    Returns:
+        Number of memories embedded (0 if there was nothing to do)
+
+    Raises:
+        Exception: If the embedding request fails
+    """
+    batch = get_memories_missing_embeddings(limit=batch_size)
+    if not batch:
+        return 0
+
+    with start_trace("embedding_backfill", kind=KIND_INTERNAL, batch=len(batch)):
+        space = embedding_space()
+        vectors = _unit(get_embedding([m.get("text") or m.get("value", "") for m in batch]))
+        duplicates = _late_duplicates(batch, vectors, space)
+
+        updated = set_embeddings(
+            {m["id"]: vectors[i].tolist() for i, m in enumerate(batch)},
+            deactivate_ids=duplicates,
+            space=space
+        )
+    logger.info(f"✅ Backfilled {updated} embeddings ({len(duplicates)} late duplicates retired)")
+    return updated
+
+
+class EmbeddingBackfillWorker:
+    """
+    Background thread that keeps draining memories missing embeddings
+
+    Args:
+        batch_size: Memories per embedding request
+        interval: Idle poll interval in seconds
+    """
+
+    def __init__(self, batch_size: int = BACKFILL_BATCH_SIZE, interval: float = BACKFILL_INTERVAL_S):
+        self.batch_size = batch_size
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.embedded = 0
+        self.failures = 0
+
+    def start(self) -> None:
+        """Start the worker thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="embedding-backfill", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Signal the worker to exit after its current batch"""
+        self._stop.set()
+
+    def _run(self) -> None:
+        backoff = self.interval
+        while not self._stop.is_set():
+            try:
+                embedded = backfill_once(self.batch_size)
+                self.embedded += embedded
+                backoff = self.interval
+                if embedded:
+                    continue  # Keep draining back-to-back
+            except Exception as e:
+                self.failures += 1
+                backoff = min(backoff * 2, BACKFILL_MAX_BACKOFF_S)
+                logger.warning(f"Embedding backfill failed, retrying in {backoff:.0f}s: {e}")
+            self._stop.wait(backoff)
+
+    def stats(self) -> Dict[str, Any]:
+        """Counters for /pipeline/status"""
+        return {"embedded": self.embedded, "failures": self.failures}
@@ -0,0 +1,288 @@
+"""
+Embedding Providers
+Pluggable backends behind memory.hf_embeddings.get_embedding
+
+- hf:      HuggingFace Inference API (all-MiniLM-L6-v2, needs HF_TOKEN + network)
+- hashing: Local deterministic feature-hashed character n-grams, 384 dims,
+           no model download - for air-gapped CI, benchmarks and tests
+
+Any provider can be wrapped in a recorder/replayer that stores vectors on
+disk keyed by (provider, text): "record" calls through on a miss and
+appends the vector, "replay" serves only from the file and fails on a
+miss, so a benchmark recorded once against the real API reruns
+reproducibly offline.
+
+Vectors from different providers are not comparable even when their
+dimensions match (hf and hashing are both 384-dim), so each stored
+embedding is tagged with the provider's space (EMBEDDING_SPACE_KEY).
+Readers use comparable_embedding() to ignore vectors from another
+space, and the backfill worker re-embeds them.
+
+Select with EMBEDDING_PROVIDER=hf|hashing and EMBEDDING_CACHE_MODE=off|record|replay.
+"""
+
+import os
+import abc
+import json
+import hashlib
+import threading
+from typing import Any, Dict, List, Optional
+import numpy as np
+from dotenv import load_dotenv
+import logging
+
+from utils.tracing import span, KIND_CLIENT
+
+load_dotenv()
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+EMBEDDING_PROVIDER = os.getenv("EMBEDDING_PROVIDER", "hf").lower()
+EMBEDDING_DIM = 384  # all-MiniLM-L6-v2 output size; the hashing provider matches it
+EMBEDDING_CACHE_MODE = os.getenv("EMBEDDING_CACHE_MODE", "off").lower()
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "./embedding_cache.jsonl")
+
+HF_API_TOKEN = os.getenv("HF_TOKEN")
+HF_API_URL = os.getenv(
+    "HF_API_URL",
+    "https://api-inference.huggingface.co/pipeline/feature-extraction/sentence-transformers/all-MiniLM-L6-v2"
+)
+HF_TIMEOUT_S = float(os.getenv("HF_TIMEOUT_S", "30"))
+
+# Memory field naming the space of its embedding; untagged vectors
+# predate it, when the HF API was the only provider
+EMBEDDING_SPACE_KEY = "embedding_model"
+LEGACY_EMBEDDING_SPACE = "hf"
+
+
+# ============================================
+# PROVIDER INTERFACE
+# ============================================
+class EmbeddingProvider(abc.ABC):
+    """Turns a list of texts into an (n, dim) float array"""
+
+    name = "base"
+    dim = EMBEDDING_DIM
+
+    @property
+    def space(self) -> str:
+        """Vector space of the output; only vectors of the same space compare"""
+        return self.name
+
+    @abc.abstractmethod
+    def embed(self, texts: List[str]) -> np.ndarray:
+        ...
+
+
+# ============================================
+# HUGGINGFACE INFERENCE API
+# ============================================
+class HFApiProvider(EmbeddingProvider):
+    """sentence-transformers/all-MiniLM-L6-v2 via the HF Inference API"""
+
+    name = "hf"
+
+    def __init__(self, api_url: str = HF_API_URL, token: Optional[str] = HF_API_TOKEN):
+        self.api_url = api_url
+        self.token = token
+        # requests is only needed by this provider; keep it off the import path
+        import requests
+        self.session = requests.Session()
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        if not self.token:
+            raise ValueError("HF_TOKEN not set in environment variables")
+
+        with span("hf.feature_extraction", kind=KIND_CLIENT, texts=len(texts)) as current:
+            response = self.session.post(
+                self.api_url,
+                headers={"Authorization": f"Bearer {self.token}"},
+                json={"inputs": texts, "options": {"wait_for_model": True}},
+                timeout=HF_TIMEOUT_S
+            )
+            if current is not None:
+                current.set_attribute("http.status_code", response.status_code)
+
+        if response.status_code != 200:
+            raise Exception(f"HuggingFace API error: {response.status_code} - {response.text}")
+
+        return np.array(response.json())
+
+
+# ============================================
+# LOCAL DETERMINISTIC HASHING
+# ============================================
+class HashingProvider(EmbeddingProvider):
+    """
+    Feature-hashed character n-grams projected to a fixed dimension
+
+    Each lowercased text is padded with spaces, every character n-gram
+    (n = 3..5) of its UTF-8 bytes is hashed with a polynomial rolling
+    hash computed over numpy slices, and hashed into a signed bucket.
+    Rows are L2-normalized. Identical across processes and machines
+    (no Python hash randomization), and texts sharing words or word
+    pieces land close together - enough for retrieval plumbing tests.
+    """
+
+    name = "hashing"
+    _MULTIPLIER = np.uint64(1099511628211)  # FNV-1a 64-bit prime
+    _OFFSET = np.uint64(14695981039346656037)
+
+    def __init__(self, dim: int = EMBEDDING_DIM, ngram_range: tuple = (3, 5)):
+        self.dim = dim
+        self.ngram_range = ngram_range
+
+    def _embed_one(self, text: str) -> np.ndarray:
+        data = f" {' '.join((text or '').lower().split())} ".encode("utf-8")
+        codes = np.frombuffer(data, dtype=np.uint8).astype(np.uint64)
+        vector = np.zeros(self.dim, dtype=np.float64)
+
+        with np.errstate(over="ignore"):  # uint64 wrap-around is the hash
+            for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+                count = len(codes) - n + 1
+                if count <= 0:
+                    continue
+                hashes = np.full(count, self._OFFSET, dtype=np.uint64)
+                for k in range(n):
+                    hashes = (hashes ^ codes[k:k + count]) * self._MULTIPLIER
+                # Mix in n so the same bytes at different lengths don't collide
+                hashes = (hashes ^ np.uint64(n)) * self._MULTIPLIER
+                buckets = (hashes % np.uint64(self.dim)).astype(np.int64)
+                signs = np.where((hashes >> np.uint64(63)) == 0, 1.0, -1.0)
+                vector += np.bincount(buckets, weights=signs, minlength=self.dim)
+
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        return np.vstack([self._embed_one(t) for t in texts]) if texts else np.zeros((0, self.dim))
+
+
+# ============================================
+# RECORD / REPLAY
+# ============================================
+class RecordReplayProvider(EmbeddingProvider):
+    """
+    Disk cache of another provider's vectors
+
+    Args:
+        inner: Provider used on cache misses (record mode)
+        path: JSONL file of {"k": key, "v": vector}
+        mode: "record" (call through and append) or "replay" (cache only)
+    """
+
+    def __init__(self, inner: EmbeddingProvider, path: str = EMBEDDING_CACHE_PATH, mode: str = "record"):
+        if mode not in ("record", "replay"):
+            raise ValueError(f"Unknown embedding cache mode: {mode}")
+        self.inner = inner
+        self.path = path
+        self.mode = mode
+        self.name = f"{mode}:{inner.name}"
+        self.dim = inner.dim
+        self._vectors: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+        self._load()
+
+    @property
+    def space(self) -> str:
+        return self.inner.space
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha1(f"{self.inner.name}\x00{text}".encode("utf-8")).hexdigest()
+
+    def _load(self) -> None:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        entry = json.loads(line)
+                        self._vectors[entry["k"]] = entry["v"]
+        except FileNotFoundError:
+            if self.mode == "replay":
+                logger.warning(f"Embedding replay file not found: {self.path}")
+        logger.info(f"Loaded {len(self._vectors)} recorded embeddings from {self.path}")
+
+    def embed(self, texts: List[str]) -> np.ndarray:
+        keys = [self._key(t) for t in texts]
+        with self._lock:
+            missing = sorted({i for i, k in enumerate(keys) if k not in self._vectors})
+
+        if missing:
+            if self.mode == "replay":
+                raise KeyError(f"{len(missing)} texts not in embedding recording {self.path}")
+            fresh = self.inner.embed([texts[i] for i in missing])
+            with self._lock, open(self.path, "a", encoding="utf-8") as f:
+                for i, vector in zip(missing, fresh):
+                    values = [float(x) for x in vector]
+                    self._vectors[keys[i]] = values
+                    f.write(json.dumps({"k": keys[i], "v": values}) + "\n")
+
+        with self._lock:
+            return np.array([self._vectors[k] for k in keys])
+
+
+# ============================================
+# PROVIDER SELECTION
+# ============================================
+_PROVIDERS = {
+    "hf": HFApiProvider,
+    "hashing": HashingProvider,
+}
+
+_provider: Optional[EmbeddingProvider] = None
+_provider_lock = threading.Lock()
+
+
+def build_provider(name: str = EMBEDDING_PROVIDER, cache_mode: str = EMBEDDING_CACHE_MODE) -> EmbeddingProvider:
+    """Construct a provider, optionally wrapped in record/replay"""
+    if name not in _PROVIDERS:
+        raise ValueError(f"Unknown EMBEDDING_PROVIDER '{name}' (expected one of {sorted(_PROVIDERS)})")
+    provider = _PROVIDERS[name]()
+    if cache_mode and cache_mode != "off":
+        provider = RecordReplayProvider(provider, mode=cache_mode)
+    return provider
+
+
+def get_provider() -> EmbeddingProvider:
+    """Process-wide provider, built from the environment on first use"""
+    global _provider
+    if _provider is None:
+        with _provider_lock:
+            if _provider is None:
+                _provider = build_provider()
+                logger.info(f"Embedding provider: {_provider.name}")
+    return _provider
+
+
+def set_provider(provider: EmbeddingProvider) -> None:
+    """Swap the process-wide provider (benchmarks, tests)"""
+    global _provider
+    with _provider_lock:
+        _provider = provider
+
+
+def embedding_space() -> str:
+    """Space of the vectors the process-wide provider produces"""
+    return get_provider().space
+
+
+def comparable_embedding(memory: Dict[str, Any], space: Optional[str] = None) -> Optional[List[float]]:
+    """
+    A stored memory's embedding, if it can be compared with fresh ones
+
+    Args:
+        memory: Stored memory record
+        space: Space to compare in (defaults to embedding_space())
+
+    Returns:
+        The vector, or None if the memory has none or it is from another space
+    """
+    vector = memory.get("embedding")
+    if not vector:
+        return None
+    if memory.get(EMBEDDING_SPACE_KEY, LEGACY_EMBEDDING_SPACE) != (space or embedding_space()):
+        return None
+    return vector
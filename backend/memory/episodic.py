@@ -25,10 +25,14 @@
 #     store_memory_async(memory)
 
 #     print("📦 Episodic summary stored")
+import logging
+
 from memory.retrieve import retrieve_memories
 from memory.add_memory import store_memory_async
 from memory.schema import Memory
 
+logger = logging.getLogger(__name__)
+
 
 def summarize_episode(session_id, turn):
 
@@ -51,4 +55,4 @@ def summarize_episode(session_id, turn):
 
     store_memory_async(memory)
 
-    print("📦 Episodic summary stored")
\ No newline at end of file
+    logger.info("📦 Episodic summary stored")
\ No newline at end of file
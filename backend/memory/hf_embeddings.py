@@ -1,25 +1,17 @@
 """
-HuggingFace Inference API for embeddings
-No local models - all processing done by HF servers
+Embedding entry point and similarity helpers
+Vectors come from the configured provider (see memory.embeddings):
+the HuggingFace Inference API by default, or a local deterministic one
 """
-import requests
-import os
-from dotenv import load_dotenv
 import numpy as np
 
-load_dotenv()
-
-# HuggingFace API configuration
-HF_API_TOKEN = os.getenv("HF_TOKEN")
-HF_API_URL = "https://api-inference.huggingface.co/pipeline/feature-extraction/sentence-transformers/all-MiniLM-L6-v2"
-
-# Cache for API requests
-HEADERS = {"Authorization": f"Bearer {HF_API_TOKEN}"}
+from memory.embeddings import get_provider
+from utils.metrics import timed
 
 
 def get_embedding(text):
     """
-    Get embedding for text using HuggingFace Inference API
+    Get embedding for text from the configured embedding provider
     
     Args:
         text: String or list of strings to embed
@@ -27,31 +19,16 @@ def get_embedding(text):
     Returns:
         numpy array of embeddings
     """
-    if not HF_API_TOKEN:
-        raise ValueError("HF_TOKEN not set in environment variables")
-    
     # Ensure text is a list
     if isinstance(text, str):
         texts = [text]
         single = True
     else:
-        texts = text
+        texts = list(text)
         single = False
     
-    # Call HuggingFace API
-    response = requests.post(
-        HF_API_URL,
-        headers=HEADERS,
-        json={"inputs": texts, "options": {"wait_for_model": True}}
-    )
-    
-    if response.status_code != 200:
-        raise Exception(f"HuggingFace API error: {response.status_code} - {response.text}")
-    
-    embeddings = response.json()
-    
-    # Convert to numpy array
-    embeddings = np.array(embeddings)
+    with timed("embed"):
+        embeddings = np.asarray(get_provider().embed(texts))
     
     # Return single embedding if single input
     if single:
@@ -174,10 +174,15 @@ IMPROVEMENTS:
 """
 
 from tinydb import TinyDB, Query
-from tinydb.operations import increment, set as tdb_set
+from tinydb.storages import JSONStorage, MemoryStorage
+from tinydb.middlewares import CachingMiddleware
 import os
-from typing import List, Dict, Any, Optional
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional, Tuple
 from memory.hf_embeddings import get_embedding, batch_cosine_similarity
+from memory.embeddings import EMBEDDING_SPACE_KEY, embedding_space, comparable_embedding
+from utils.tracing import traced
 import numpy as np
 from datetime import datetime
 import logging
@@ -188,17 +193,235 @@ logger = logging.getLogger(__name__)
 # DATABASE INITIALIZATION
 # ============================================
 DB_PATH = os.getenv("MEMORY_DB_PATH", "./memory_store.json")
-db = TinyDB(DB_PATH)
-memory_table = db.table('memories')
+
+# Opened on first use, so importing the store does no file I/O
+_db: Optional[TinyDB] = None
+_memory_table = None
+_db_lock = threading.Lock()
+# Serializes writes: TinyDB's read-modify-write of the storage is not thread-safe
+_write_lock = threading.Lock()
 
 # Create indices for faster queries
 # Note: TinyDB doesn't have real indices, but we optimize queries
 Memory = Query()
 
+
+def use_database(path: Optional[str] = None, storage: str = "json") -> None:
+    """
+    Point the store at a different TinyDB database (benchmarks, tests)
+    
+    Args:
+        path: JSON file path (ignored for in-memory storage)
+        storage: "json" (file, rewritten per write), "cached" (file behind
+                 TinyDB's CachingMiddleware, flushed on close) or "memory"
+    """
+    global DB_PATH, _db, _memory_table
+    
+    if storage == "json":
+        new_db = TinyDB(path or DB_PATH)
+    elif storage == "cached":
+        new_db = TinyDB(path or DB_PATH, storage=CachingMiddleware(JSONStorage))
+    elif storage == "memory":
+        new_db = TinyDB(storage=MemoryStorage)
+    else:
+        raise ValueError(f"Unknown storage backend: {storage}")
+    
+    with _db_lock:
+        old_db = _db
+        DB_PATH = path or DB_PATH
+        _memory_table = new_db.table('memories')
+        _db = new_db
+    if old_db is not None:
+        old_db.close()
+    with _versions_lock:
+        _session_versions.clear()
+    clear_session_indexes()
+
+
+def get_db() -> TinyDB:
+    """The TinyDB database, opening DB_PATH on first call"""
+    global _db, _memory_table
+    if _db is None:
+        with _db_lock:
+            if _db is None:
+                new_db = TinyDB(DB_PATH)
+                _memory_table = new_db.table('memories')
+                _db = new_db
+                logger.info("📂 Opened memory database %s", DB_PATH)
+    return _db
+
+
+def get_table():
+    """The memories table (opens the database on first call)"""
+    if _memory_table is None:
+        get_db()
+    return _memory_table
+
+# ============================================
+# SESSION CHANGE TRACKING
+# ============================================
+# Bumped whenever a session's memory content changes, so caches derived
+# from it (rendered context, indexes) know when to rebuild. Access-count
+# bookkeeping does not change content and does not bump the version.
+_session_versions: Dict[str, int] = {}
+_versions_lock = threading.Lock()
+
+
+def _bump_session_version(session_id: Optional[str]) -> None:
+    if not session_id:
+        return
+    with _versions_lock:
+        _session_versions[session_id] = _session_versions.get(session_id, 0) + 1
+
+
+def get_session_version(session_id: str) -> int:
+    """Monotonic counter of content changes for a session"""
+    with _versions_lock:
+        return _session_versions.get(session_id, 0)
+
+# ============================================
+# SESSION EMBEDDING INDEX
+# ============================================
+# Unit-normalized float32 embedding matrix per session, so hybrid search
+# is one matrix-vector product instead of decoding every stored vector
+# on every query. Tagged with the session version and embedding space;
+# LRU-evicted by rows.
+SESSION_INDEX_MAX_ROWS = int(os.getenv("SESSION_INDEX_MAX_ROWS", "50000"))
+
+
+class SessionIndex:
+    __slots__ = ("version", "rows", "matrix", "space")
+
+    def __init__(self, version: int, rows: Dict[str, int], matrix: np.ndarray, space: str):
+        self.version = version
+        self.rows = rows      # memory id -> matrix row
+        self.matrix = matrix
+        self.space = space
+
+
+_session_indexes: "OrderedDict[str, SessionIndex]" = OrderedDict()
+_session_index_rows = 0
+_session_index_lock = threading.Lock()
+_session_index_stats = {"hits": 0, "builds": 0, "evictions": 0}
+
+
+def build_session_index(
+    session_id: str,
+    memories: List[Dict],
+    version: int,
+    space: Optional[str] = None
+) -> Optional[SessionIndex]:
+    """
+    Build and cache the embedding index for a session
+    
+    Args:
+        session_id: User session
+        memories: The session's active memories
+        version: get_session_version() read before `memories` was loaded,
+                 so a concurrent write leaves the entry stale, not wrong
+        space: Embedding space to index (defaults to embedding_space())
+    
+    Returns:
+        The index, or None if no memory has an embedding in that space yet
+    """
+    global _session_index_rows
+    space = space or embedding_space()
+    embedded = [m for m in memories if comparable_embedding(m, space)]
+    if not embedded:
+        return None
+    
+    matrix = np.asarray([m['embedding'] for m in embedded], dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    matrix /= norms
+    index = SessionIndex(version, {m['id']: i for i, m in enumerate(embedded)}, matrix, space)
+    
+    if SESSION_INDEX_MAX_ROWS <= 0:
+        return index
+    with _session_index_lock:
+        _session_index_stats["builds"] += 1
+        previous = _session_indexes.pop(session_id, None)
+        if previous is not None:
+            _session_index_rows -= len(previous.rows)
+        _session_indexes[session_id] = index
+        _session_index_rows += len(index.rows)
+        while _session_index_rows > SESSION_INDEX_MAX_ROWS and len(_session_indexes) > 1:
+            _, evicted = _session_indexes.popitem(last=False)
+            _session_index_rows -= len(evicted.rows)
+            _session_index_stats["evictions"] += 1
+    return index
+
+
+def get_session_index(session_id: str, version: int, space: Optional[str] = None) -> Optional[SessionIndex]:
+    """Cached index for a session if it matches `version` and `space`"""
+    space = space or embedding_space()
+    with _session_index_lock:
+        index = _session_indexes.get(session_id)
+        if index is None or index.version != version or index.space != space:
+            return None
+        _session_indexes.move_to_end(session_id)
+        _session_index_stats["hits"] += 1
+        return index
+
+
+def clear_session_indexes() -> None:
+    global _session_index_rows
+    with _session_index_lock:
+        _session_indexes.clear()
+        _session_index_rows = 0
+
+
+def session_index_stats() -> Dict[str, Any]:
+    with _session_index_lock:
+        return {
+            **_session_index_stats,
+            "sessions": len(_session_indexes),
+            "rows": _session_index_rows,
+            "max_rows": SESSION_INDEX_MAX_ROWS,
+        }
+
+
+def _semantic_scores(
+    session_id: str,
+    version: int,
+    memories: List[Dict],
+    query_embedding: np.ndarray,
+    build: bool,
+    space: str
+) -> Dict[str, float]:
+    """Cosine similarity of the query to each memory embedded in `space`, by memory id"""
+    index = get_session_index(session_id, version, space)
+    if index is None and build:
+        try:
+            index = build_session_index(session_id, memories, version, space)
+        except ValueError as e:
+            # Mixed embedding dimensions; score memory by memory instead
+            logger.warning("Could not index session %s: %s", session_id, e)
+    
+    query = np.asarray(query_embedding, dtype=np.float32)
+    query_norm = np.linalg.norm(query)
+    sims = index.matrix @ (query / query_norm) if index is not None and query_norm else None
+    
+    scores = {}
+    for mem in memories:
+        if not comparable_embedding(mem, space):
+            continue
+        row = index.rows.get(mem['id']) if sims is not None else None
+        if row is not None:
+            scores[mem['id']] = float(sims[row])
+            continue
+        # Not in the index (inactive memories when searching them too)
+        try:
+            scores[mem['id']] = batch_cosine_similarity(query_embedding, [mem['embedding']])[0]
+        except Exception as e:
+            logger.debug("Embedding comparison error: %s", e)
+    return scores
+
 # ============================================
 # CORE CRUD OPERATIONS
 # ============================================
 
+@traced("tinydb.add_memory")
 def add_memory(memory_data: Dict[str, Any]) -> str:
     """
     Add a memory to the database with automatic indexing
@@ -219,12 +442,60 @@ def add_memory(memory_data: Dict[str, Any]) -> str:
     if 'importance_score' not in memory_data:
         memory_data['importance_score'] = 0.5
     
-    doc_id = memory_table.insert(memory_data)
-    logger.info(f"✅ Memory added: {memory_data.get('key')} (doc_id: {doc_id})")
+    with _write_lock:
+        doc_id = get_table().insert(memory_data)
+    _bump_session_version(memory_data.get('session_id'))
+    logger.info("✅ Memory added: %s (doc_id: %s)", memory_data.get('key'), doc_id)
     
     return memory_data['id']
 
 
+@traced("tinydb.add_memories")
+def add_memories(
+    memories: List[Dict[str, Any]],
+    deactivate_ids: Optional[List[str]] = None
+) -> List[str]:
+    """
+    Add many memories (and retire superseded ones) in at most two DB writes
+
+    TinyDB rewrites the whole JSON file on every operation, so bulk jobs
+    must not call add_memory/update_memory in a loop.
+
+    Args:
+        memories: Complete memory dictionaries to insert
+        deactivate_ids: IDs of existing memories to mark inactive
+
+    Returns:
+        Memory IDs of the inserted memories
+    """
+    now = datetime.utcnow().isoformat()
+    for memory_data in memories:
+        memory_data.setdefault('created_at', now)
+        memory_data.setdefault('access_count', 0)
+        memory_data.setdefault('importance_score', 0.5)
+
+    retire = set(deactivate_ids or [])
+    touched_sessions = {m.get('session_id') for m in memories}
+
+    def retire_doc(doc: Dict[str, Any]) -> None:
+        doc['is_active'] = False
+        doc['updated_at'] = now
+        touched_sessions.add(doc.get('session_id'))
+
+    # One update for all retirements, one insert for the whole batch
+    with _write_lock:
+        if retire:
+            get_table().update(retire_doc, Memory.id.one_of(retire))
+        if memories:
+            get_table().insert_multiple(dict(m) for m in memories)
+    for session_id in touched_sessions:
+        _bump_session_version(session_id)
+    logger.info("✅ %d memories added, %d deactivated", len(memories), len(retire))
+
+    return [m['id'] for m in memories]
+
+
+@traced("tinydb.get_memories")
 def get_memories(session_id: str, is_active: bool = True, limit: int = None) -> List[Dict]:
     """
     Get all memories for a session with optional filtering
@@ -235,7 +506,7 @@ def get_memories(session_id: str, is_active: bool = True, limit: int = None) ->
     if is_active:
         query &= (Memory.is_active == True)
     
-    results = memory_table.search(query)
+    results = get_table().search(query)
     
     if limit:
         # Sort by importance and recency before limiting
@@ -252,6 +523,7 @@ def get_memories(session_id: str, is_active: bool = True, limit: int = None) ->
     return results
 
 
+@traced("tinydb.get_memory_by_key")
 def get_memory_by_key(session_id: str, key: str, is_active: bool = True) -> List[Dict]:
     """Get specific memory by key"""
     query = (
@@ -261,15 +533,17 @@ def get_memory_by_key(session_id: str, key: str, is_active: bool = True) -> List
     if is_active:
         query &= (Memory.is_active == True)
     
-    return memory_table.search(query)
+    return get_table().search(query)
 
 
+@traced("tinydb.get_memory_by_id")
 def get_memory_by_id(memory_id: str) -> Optional[Dict]:
     """Get specific memory by ID"""
-    results = memory_table.search(Memory.id == memory_id)
+    results = get_table().search(Memory.id == memory_id)
     return results[0] if results else None
 
 
+@traced("tinydb.update_memory")
 def update_memory(memory_id: str, updates: Dict[str, Any]) -> bool:
     """
     Update a memory by ID
@@ -277,14 +551,22 @@ def update_memory(memory_id: str, updates: Dict[str, Any]) -> bool:
     IMPROVEMENT: Returns success status and adds updated_at timestamp
     """
     updates['updated_at'] = datetime.utcnow().isoformat()
+    touched_sessions = set()
     
-    result = memory_table.update(updates, Memory.id == memory_id)
+    def apply(doc: Dict[str, Any]) -> None:
+        doc.update(updates)
+        touched_sessions.add(doc.get('session_id'))
+    
+    with _write_lock:
+        result = get_table().update(apply, Memory.id == memory_id)
     success = len(result) > 0
+    for session_id in touched_sessions:
+        _bump_session_version(session_id)
     
     if success:
-        logger.info(f"✅ Memory updated: {memory_id}")
+        logger.info("✅ Memory updated: %s", memory_id)
     else:
-        logger.warning(f"⚠️ Memory not found: {memory_id}")
+        logger.warning("⚠️ Memory not found: %s", memory_id)
     
     return success
 
@@ -295,15 +577,17 @@ def increment_access_count(memory_id: str, current_turn: int) -> None:
     
     IMPROVEMENT: Critical for tracking memory importance over 1000+ turns
     """
-    memory_table.update(
-        {
-            'access_count': increment(1),
-            'last_used_turn': current_turn
-        },
-        Memory.id == memory_id
-    )
+    def apply(doc: Dict[str, Any]) -> None:
+        # tinydb.operations.increment is a transform, not a field value:
+        # it has to be passed on its own, so apply both changes by hand
+        doc['access_count'] = doc.get('access_count', 0) + 1
+        doc['last_used_turn'] = current_turn
+    
+    with _write_lock:
+        get_table().update(apply, Memory.id == memory_id)
 
 
+@traced("tinydb.batch_increment_access")
 def batch_increment_access(memory_ids: List[str], current_turn: int) -> None:
     """
     Batch update access counts for better performance
@@ -314,10 +598,79 @@ def batch_increment_access(memory_ids: List[str], current_turn: int) -> None:
         increment_access_count(mem_id, current_turn)
 
 
+# ============================================
+# EMBEDDING BACKFILL SUPPORT
+# ============================================
+
+@traced("tinydb.get_memories_missing_embeddings")
+def get_memories_missing_embeddings(limit: int = 64) -> List[Dict]:
+    """
+    Active memories without an embedding in the current space
+    
+    Covers store-first writes (pending_embedding), memories whose
+    embedding request failed at write time, and memories embedded by
+    another provider than the configured one.
+    """
+    space = embedding_space()
+    results = [
+        m for m in get_table().search(Memory.is_active == True)
+        if not comparable_embedding(m, space)
+    ]
+    # Oldest first, so a backlog drains in write order
+    results.sort(key=lambda m: m.get('created_at', ''))
+    return results[:limit]
+
+
+@traced("tinydb.set_embeddings")
+def set_embeddings(
+    embeddings: Dict[str, List[float]],
+    deactivate_ids: Optional[List[str]] = None,
+    space: Optional[str] = None
+) -> int:
+    """
+    Attach embeddings to stored memories in a single DB write
+    
+    Args:
+        embeddings: {memory_id: embedding vector}
+        deactivate_ids: IDs to retire at the same time (late-detected duplicates)
+        space: Space the vectors are in (defaults to embedding_space())
+        
+    Returns:
+        Number of memories updated
+    """
+    space = space or embedding_space()
+    now = datetime.utcnow().isoformat()
+    retire = set(deactivate_ids or [])
+    touched_sessions = set()
+    updated = [0]
+    
+    def apply(doc: Dict[str, Any]) -> None:
+        memory_id = doc.get('id')
+        if memory_id in embeddings:
+            doc['embedding'] = embeddings[memory_id]
+            doc[EMBEDDING_SPACE_KEY] = space
+            doc['pending_embedding'] = False
+            updated[0] += 1
+        if memory_id in retire:
+            doc['is_active'] = False
+            doc['updated_at'] = now
+        touched_sessions.add(doc.get('session_id'))
+    
+    targets = set(embeddings) | retire
+    if targets:
+        with _write_lock:
+            get_table().update(apply, Memory.id.one_of(targets))
+    for session_id in touched_sessions:
+        _bump_session_version(session_id)
+    
+    return updated[0]
+
+
 # ============================================
 # ADVANCED SEARCH - HYBRID APPROACH
 # ============================================
 
+@traced("tinydb.search_memories_hybrid")
 def search_memories_hybrid(
     session_id: str,
     query_text: str,
@@ -345,11 +698,15 @@ def search_memories_hybrid(
         Ranked and scored memories
     """
     
+    # Read before the memories, so a concurrent write can only make an index stale
+    version = get_session_version(session_id)
+    
     # Get all candidate memories
     all_memories = get_memories(session_id, is_active)
     
     if not all_memories:
         return []
+    unfiltered = all_memories
     
     # Apply confidence filter
     all_memories = [m for m in all_memories if m.get('confidence', 0) >= min_confidence]
@@ -363,6 +720,7 @@ def search_memories_hybrid(
         return _rank_by_importance_recency(all_memories, current_turn, limit)
     
     # Get query embedding
+    space = embedding_space()
     try:
         query_embedding = get_embedding(query_text)
     except Exception as e:
@@ -370,25 +728,27 @@ def search_memories_hybrid(
         # Fallback to keyword search
         return search_memories_keyword(session_id, query_text, is_active, limit)
     
+    # The index covers the session's active memories; build it from the
+    # unfiltered list so confidence/type filters don't produce partial ones
+    semantic = _semantic_scores(session_id, version, unfiltered, query_embedding, build=is_active, space=space)
+    
     # Score each memory using hybrid approach
     scored_memories = []
     
     for mem in all_memories:
         score = 0.0
         
+        keyword_score = _calculate_keyword_score(query_text, mem)
+        
         # 1. SEMANTIC SIMILARITY (40% weight)
-        if 'embedding' in mem and mem['embedding']:
-            try:
-                semantic_sim = batch_cosine_similarity(
-                    query_embedding,
-                    [mem['embedding']]
-                )[0]
-                score += semantic_sim * 0.4
-            except Exception as e:
-                logger.debug(f"Embedding comparison error: {e}")
+        if comparable_embedding(mem, space):
+            score += semantic.get(mem['id'], 0.0) * 0.4
+        else:
+            # Not embedded (in this space) yet, pending backfill: keyword match stands in
+            # so fresh memories are not buried until the backfill runs
+            score += keyword_score * 0.4
         
         # 2. KEYWORD MATCH (25% weight)
-        keyword_score = _calculate_keyword_score(query_text, mem)
         score += keyword_score * 0.25
         
         # 3. IMPORTANCE (15% weight)
@@ -557,6 +917,7 @@ def search_memories_keyword(
 # MEMORY CONSOLIDATION (PREVENTS BLOAT)
 # ============================================
 
+@traced("tinydb.consolidate_duplicate_memories")
 def consolidate_duplicate_memories(session_id: str, similarity_threshold: float = 0.95) -> int:
     """
     IMPROVEMENT: Consolidate very similar memories to prevent database bloat
@@ -572,19 +933,20 @@ def consolidate_duplicate_memories(session_id: str, similarity_threshold: float
     
     consolidated = 0
     processed = set()
+    space = embedding_space()
     
     for i, mem1 in enumerate(all_memories):
         if mem1['id'] in processed:
             continue
         
-        if 'embedding' not in mem1 or not mem1['embedding']:
+        if not comparable_embedding(mem1, space):
             continue
         
         for mem2 in all_memories[i+1:]:
             if mem2['id'] in processed:
                 continue
             
-            if 'embedding' not in mem2 or not mem2['embedding']:
+            if not comparable_embedding(mem2, space):
                 continue
             
             # Check similarity
@@ -610,7 +972,7 @@ def consolidate_duplicate_memories(session_id: str, similarity_threshold: float
                         break
             
             except Exception as e:
-                logger.debug(f"Similarity check error: {e}")
+                logger.debug("Similarity check error: %s", e)
     
     if consolidated > 0:
         logger.info(f"♻️ Consolidated {consolidated} duplicate memories")
@@ -644,10 +1006,47 @@ def get_memory_stats(session_id: str) -> Dict[str, Any]:
     }
 
 
+@traced("tinydb.get_recent_sessions")
+def get_recent_sessions(limit: int = 20) -> List[str]:
+    """
+    Sessions with the most recently written memories, newest first
+    
+    Args:
+        limit: Maximum number of session IDs
+    """
+    latest: Dict[str, str] = {}
+    for doc in get_table().all():
+        session_id = doc.get('session_id')
+        if not session_id:
+            continue
+        stamp = max(doc.get('created_at') or '', doc.get('updated_at') or '')
+        if session_id not in latest or stamp > latest[session_id]:
+            latest[session_id] = stamp
+    return sorted(latest, key=latest.get, reverse=True)[:limit]
+
+
+@traced("tinydb.get_active_memories_by_session")
+def get_active_memories_by_session(session_ids: List[str]) -> Dict[str, Tuple[int, List[Dict]]]:
+    """
+    Active memories of several sessions in one table scan
+    
+    Returns:
+        {session_id: (session version read before the scan, memories)}
+    """
+    versions = {session_id: get_session_version(session_id) for session_id in session_ids}
+    grouped: Dict[str, List[Dict]] = {session_id: [] for session_id in session_ids}
+    for doc in get_table().search(Memory.session_id.one_of(session_ids) & (Memory.is_active == True)):
+        grouped[doc['session_id']].append(doc)
+    return {session_id: (versions[session_id], grouped[session_id]) for session_id in session_ids}
+
+
+@traced("tinydb.clear_session")
 def clear_session(session_id: str) -> int:
     """Clear all memories for a session"""
-    count = len(memory_table.remove(Memory.session_id == session_id))
-    logger.info(f"🗑️ Cleared {count} memories for session {session_id}")
+    with _write_lock:
+        count = len(get_table().remove(Memory.session_id == session_id))
+    _bump_session_version(session_id)
+    logger.info("🗑️ Cleared %d memories for session %s", count, session_id)
     return count
 
 
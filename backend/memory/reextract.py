@@ -0,0 +1,310 @@
+"""
+Bulk Historical Re-extraction
+Regenerates memories from the raw turn log after prompt/model changes
+
+When SYSTEM_PROMPT or GROQ_MODEL changes, memories extracted earlier are
+never revisited. This job streams every logged user message back through
+the batched extractor with a bounded worker pool and a request rate
+limit, then writes each chunk with one embedding request and one batch write.
+
+Progress is checkpointed per session after every chunk, so an interrupted
+run resumes where it stopped. A failed extraction call stops its session
+at the last turn before it (the rest of the session is retried on the next
+run and counted as failed in the report); other sessions carry on. The checkpoint records the extractor's
+PROMPT_VERSION; after a prompt or model change it is ignored and the run
+starts over. Pass --stub-llm to run fully offline.
+
+Usage:
+    python -m memory.reextract --workers 4 --rps 2
+    python -m memory.reextract --sessions user_a user_b --stub-llm
+"""
+
+import os
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from itertools import islice
+from typing import Callable, Dict, Any, List, Optional, Iterable
+import logging
+
+from memory import turn_log
+from memory.schema import Memory
+from memory.add_memory import store_memories_batch
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+DEFAULT_WORKERS = int(os.getenv("REEXTRACT_WORKERS", "4"))
+DEFAULT_RPS = float(os.getenv("REEXTRACT_RPS", "2"))
+DEFAULT_CHUNK_SIZE = int(os.getenv("REEXTRACT_CHUNK_SIZE", "32"))
+DEFAULT_CHECKPOINT = os.getenv("REEXTRACT_CHECKPOINT", "./reextract_checkpoint.json")
+DEFAULT_BATCH_SIZE = int(os.getenv("EXTRACTION_BATCH_SIZE", "10"))
+
+# Takes a list of messages, returns per-message extraction results
+BatchExtractFn = Callable[[List[str]], List[Optional[Dict[str, Any]]]]
+
+# ============================================
+# RATE LIMITING
+# ============================================
+class RateLimiter:
+    """Blocking token bucket shared by all workers"""
+
+    def __init__(self, rate_per_sec: float, burst: int = 1):
+        self.rate = rate_per_sec
+        self.capacity = max(1, burst)
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        """Block until one request may be issued"""
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+# ============================================
+# CHECKPOINTING
+# ============================================
+def load_checkpoint(path: str, version: str) -> Dict[str, int]:
+    """
+    Load {session_id: last_processed_turn}
+
+    Args:
+        path: Checkpoint file
+        version: Extractor version of this run; progress recorded under
+            another version is discarded
+
+    Returns:
+        Per-session progress, empty when starting over
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            checkpoint = json.load(f)
+    except (FileNotFoundError, json.JSONDecodeError):
+        return {}
+
+    if checkpoint.get("version") != version:
+        logger.info(
+            "Ignoring checkpoint %s from extractor version %s (now %s); starting over",
+            path, checkpoint.get("version"), version
+        )
+        return {}
+    return checkpoint.get("sessions", {})
+
+
+def save_checkpoint(path: str, sessions: Dict[str, int], version: str) -> None:
+    """Atomically persist progress"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": version, "sessions": sessions, "updated_at": datetime.now(timezone.utc).isoformat()}, f)
+    os.replace(tmp_path, path)
+
+# ============================================
+# BULK STORE PATH
+# ============================================
+def _to_memory(session_id: str, turn: int, extracted: Dict[str, Any]) -> Optional[Memory]:
+    """Validate an extraction result as a Memory"""
+    try:
+        return Memory(
+            session_id=session_id,
+            type=extracted.get("type", "fact"),
+            key=extracted.get("key", "general"),
+            value=extracted.get("value", ""),
+            confidence=float(extracted.get("confidence", 0.7)),
+            source_turn=turn,
+            last_used_turn=turn
+        )
+    except Exception as e:
+        logger.warning(f"Discarding invalid extraction at turn {turn}: {e}")
+        return None
+
+
+def store_chunk(session_id: str, memories: List[Memory]) -> int:
+    """
+    Persist one chunk: one embedding request, one batch write
+
+    Later turns supersede earlier ones with the same key, both within the
+    chunk and against memories already stored for the session; near
+    duplicates are skipped.
+
+    Returns:
+        Number of memories written
+    """
+    if not memories:
+        return 0
+    return sum(1 for memory_id in store_memories_batch(memories) if memory_id)
+
+# ============================================
+# RE-EXTRACTION JOB
+# ============================================
+def _chunks(items: Iterable[Dict[str, Any]], size: int) -> Iterable[List[Dict[str, Any]]]:
+    iterator = iter(items)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def reextract(
+    sessions: Optional[List[str]] = None,
+    extract_fn: Optional[BatchExtractFn] = None,
+    workers: int = DEFAULT_WORKERS,
+    rps: float = DEFAULT_RPS,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    checkpoint_path: str = DEFAULT_CHECKPOINT,
+    version: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Re-run extraction over stored conversation history
+
+    Args:
+        sessions: Session IDs to process (default: every session in the turn log)
+        extract_fn: Batch extraction function (default: llm.extractor.extract_memories_batch)
+        workers: Maximum concurrent extraction calls
+        rps: Maximum extraction calls per second (0 = unlimited)
+        chunk_size: Turns per store chunk / checkpoint
+        batch_size: Messages handed to extract_fn per call
+        checkpoint_path: File recording per-session progress
+        version: Extractor version stored with the checkpoint
+            (default: llm.extractor.PROMPT_VERSION)
+
+    Returns:
+        Throughput report; failed_turns counts the turns of failed chunks,
+        which a later run picks up again
+    """
+    if extract_fn is None:
+        from llm.extractor import extract_memories_batch
+        extract_fn = extract_memories_batch
+    if version is None:
+        from llm.extractor import PROMPT_VERSION
+        version = PROMPT_VERSION
+
+    sessions = sessions or turn_log.list_sessions()
+    progress = load_checkpoint(checkpoint_path, version)
+    limiter = RateLimiter(rps, burst=workers)
+
+    def run_batch(batch: List[Dict[str, Any]]) -> Optional[List[Optional[Dict[str, Any]]]]:
+        """Per-message results, or None if the extraction call failed"""
+        limiter.acquire()
+        try:
+            return extract_fn([record["message"] or "" for record in batch])
+        except Exception as e:
+            logger.error(f"Extraction failed for turns {batch[0]['turn']}-{batch[-1]['turn']}: {e}")
+            return None
+
+    report = {
+        "sessions": 0, "turns": 0, "extractions": 0, "memories_stored": 0,
+        "failed_turns": 0, "failed_sessions": [],
+    }
+    started = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=max(1, workers)) as pool:
+        for session_id in sessions:
+            done_turn = int(progress.get(session_id, 0))
+            turns = turn_log.iter_turns(session_id, start_turn=done_turn + 1)
+
+            for chunk in _chunks(turns, chunk_size):
+                # pool.map preserves order and never has more than `workers` calls in flight
+                batches = [chunk[i:i + batch_size] for i in range(0, len(chunk), batch_size)]
+                batch_results = list(pool.map(run_batch, batches))
+
+                # Only the turns before the first failed batch count as done;
+                # the checkpoint must not move past turns that were never extracted
+                failed_at = next((i for i, results in enumerate(batch_results) if results is None), None)
+                if failed_at is not None:
+                    batches, batch_results = batches[:failed_at], batch_results[:failed_at]
+                done = [record for batch in batches for record in batch]
+                results = [r for results in batch_results for r in results]
+
+                memories = []
+                for turn_record, extracted in zip(done, results):
+                    if extracted and isinstance(extracted, dict) and extracted.get("value"):
+                        memory = _to_memory(session_id, turn_record["turn"], extracted)
+                        if memory:
+                            memories.append(memory)
+
+                stored = store_chunk(session_id, memories)
+
+                if done:
+                    progress[session_id] = done[-1]["turn"]
+                    save_checkpoint(checkpoint_path, progress, version)
+
+                report["turns"] += len(done)
+                report["extractions"] += len(memories)
+                report["memories_stored"] += stored
+
+                if failed_at is not None:
+                    report["failed_turns"] += len(chunk) - len(done)
+                    report["failed_sessions"].append(session_id)
+                    logger.error(
+                        f"Re-extraction {session_id} stopped after turn {progress.get(session_id, 0)}; "
+                        f"rerun to resume from there"
+                    )
+                    break
+
+                elapsed = time.monotonic() - started
+                logger.info(
+                    f"Re-extraction {session_id}: up to turn {chunk[-1]['turn']} "
+                    f"({report['turns'] / max(elapsed, 1e-9):.1f} turns/s)"
+                )
+            else:
+                report["sessions"] += 1
+
+    elapsed = time.monotonic() - started
+    report["elapsed_s"] = round(elapsed, 3)
+    report["turns_per_s"] = round(report["turns"] / elapsed, 2) if elapsed > 0 else 0.0
+    return report
+
+# ============================================
+# CLI
+# ============================================
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Re-extract memories from the raw turn log")
+    parser.add_argument("--sessions", nargs="*", help="Session IDs (default: all logged sessions)")
+    parser.add_argument("--workers", type=int, default=DEFAULT_WORKERS, help="Concurrent extraction calls")
+    parser.add_argument("--rps", type=float, default=DEFAULT_RPS, help="Max extraction calls per second (0 = unlimited)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Turns per write/checkpoint")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE, help="Messages per extraction call")
+    parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Checkpoint file path")
+    parser.add_argument("--stub-llm", action="store_true", help="Use the offline rule-based extractor")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+
+    extract_fn, version = None, None
+    if args.stub_llm:
+        from llm.stub_llm import stub_extract_memory
+        extract_fn = lambda messages: [stub_extract_memory(m) for m in messages]
+        version = "stub"
+
+    report = reextract(
+        sessions=args.sessions,
+        extract_fn=extract_fn,
+        workers=args.workers,
+        rps=args.rps,
+        chunk_size=args.chunk_size,
+        batch_size=max(1, args.batch_size),
+        checkpoint_path=args.checkpoint,
+        version=version
+    )
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -95,6 +95,7 @@ from memory.json_store import (
     get_memories,
     consolidate_duplicate_memories
 )
+from utils.metrics import timed
 from typing import List, Dict, Any, Optional
 import logging
 import re
@@ -216,33 +217,35 @@ def retrieve_memories(
             k = min(k + 3, MAX_MEMORIES_PER_RETRIEVAL)
         
         # Stage 3: Hybrid Search
-        memories = search_memories_hybrid(
-            session_id=session_id,
-            query_text=query,
-            current_turn=current_turn,
-            is_active=True,
-            limit=k * 2,  # Get more, then filter
-            min_confidence=min_confidence,
-            memory_types=memory_types
-        )
+        with timed("search"):
+            memories = search_memories_hybrid(
+                session_id=session_id,
+                query_text=query,
+                current_turn=current_turn,
+                is_active=True,
+                limit=k * 2,  # Get more, then filter
+                min_confidence=min_confidence,
+                memory_types=memory_types
+            )
         
         if not memories:
-            logger.info(f"No memories found for query: {query[:50]}...")
+            logger.info("No memories found for query: %.50s...", query)
             return []
         
-        # Stage 4: Post-process
-        memories = _post_process_memories(memories, query_analysis, current_turn)
-        
-        # Stage 5: Get related memories if available
-        memories = _expand_with_related(memories, session_id, current_turn, k)
-        
-        # Limit to k
-        memories = memories[:k]
-        
-        # Stage 6: Format results
-        formatted_memories = _format_memories(memories)
+        with timed("post_process"):
+            # Stage 4: Post-process
+            memories = _post_process_memories(memories, query_analysis, current_turn)
+            
+            # Stage 5: Get related memories if available
+            memories = _expand_with_related(memories, session_id, current_turn, k)
+            
+            # Limit to k
+            memories = memories[:k]
+            
+            # Stage 6: Format results
+            formatted_memories = _format_memories(memories)
         
-        logger.info(f"Retrieved {len(formatted_memories)} memories for query")
+        logger.info("Retrieved %d memories for query", len(formatted_memories))
         
         # Periodic consolidation (every 100 retrievals, random check)
         import random
@@ -0,0 +1,421 @@
+"""
+Raw Conversation Turn Log
+Durable, append-only record of user messages per session
+
+Extracted memories are lossy: if extraction is skipped or deferred the
+original message would otherwise be gone. Every /chat turn is appended
+here so background jobs, replays and recent-turn context can always go
+back to the source text without keeping history in RAM.
+
+ON-DISK FORMAT (per session):
+- <session>.jsonl  one compact JSON record per turn
+                   {"t": turn, "ts": unix_time, "m": message[, "r": reply_length]}
+- <session>.idx    fixed-width binary index, one (turn, byte_offset) pair per
+                   record, used for O(log n) range reads and tail reads
+- <session>.replies fixed-width binary (turn, reply_length) pairs, written
+                   once the reply is generated
+
+Messages are appended when the request arrives, so concurrent requests in
+one session can land out of turn order. All files stay append-only; the
+index is sorted by turn when it is loaded, and reads go through it rather
+than assuming the data file is ordered.
+
+The parsed index of recently read sessions is cached in memory (LRU,
+TURN_LOG_INDEX_CACHE_SESSIONS) and kept current by appends, so point and
+range reads bisect instead of re-reading the .idx file.
+"""
+
+import os
+import json
+import struct
+import heapq
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from collections import OrderedDict
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+import logging
+
+from utils.tracing import traced
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+TURN_LOG_DIR = os.getenv("TURN_LOG_DIR", "./turn_log")
+TURN_LOG_FSYNC = os.getenv("TURN_LOG_FSYNC", "false").lower() == "true"
+MAX_OPEN_SESSIONS = int(os.getenv("TURN_LOG_MAX_OPEN", "64"))
+INDEX_CACHE_SESSIONS = int(os.getenv("TURN_LOG_INDEX_CACHE_SESSIONS", "256"))
+
+_INDEX_ENTRY = struct.Struct("<IQ")  # turn (uint32), byte offset (uint64)
+_REPLY_ENTRY = struct.Struct("<II")  # turn (uint32), reply length (uint32)
+
+_lock = threading.Lock()
+# session_id -> (data file, index file, replies file), kept open for cheap hot-path appends
+_handles: "OrderedDict[str, Tuple[Any, Any, Any]]" = OrderedDict()
+
+
+class _SessionIndex:
+    """Turn-sorted index columns and reply lengths of one session"""
+
+    __slots__ = ("turns", "offsets", "end", "replies")
+
+    def __init__(self, turns: List[int], offsets: List[int], replies: Dict[int, int]):
+        self.turns = turns
+        self.offsets = offsets
+        self.end = max(offsets) if offsets else None  # offset of the last indexed record
+        self.replies = replies
+
+    def add(self, turn: int, offset: int) -> None:
+        # Appends arrive in turn order unless requests raced, so this is
+        # almost always an insert at the end
+        i = bisect_right(self.turns, turn)
+        self.turns.insert(i, turn)
+        self.offsets.insert(i, offset)
+        self.end = offset if self.end is None else max(self.end, offset)
+
+
+# session_id -> parsed index, guarded by _lock
+_indexes: "OrderedDict[str, _SessionIndex]" = OrderedDict()
+
+# ============================================
+# HELPERS
+# ============================================
+def _session_path(session_id: str) -> str:
+    """Path of the log file for a session"""
+    return os.path.join(TURN_LOG_DIR, f"{session_id}.jsonl")
+
+
+def _index_path(session_id: str) -> str:
+    """Path of the binary offset index for a session"""
+    return os.path.join(TURN_LOG_DIR, f"{session_id}.idx")
+
+
+def _replies_path(session_id: str) -> str:
+    """Path of the binary reply length side file for a session"""
+    return os.path.join(TURN_LOG_DIR, f"{session_id}.replies")
+
+
+def _get_handles(session_id: str) -> Tuple[Any, Any, Any]:
+    """Open (or reuse) append handles for a session (caller holds the lock)"""
+    handles = _handles.get(session_id)
+    if handles:
+        _handles.move_to_end(session_id)
+        return handles
+
+    os.makedirs(TURN_LOG_DIR, exist_ok=True)
+    handles = (
+        open(_session_path(session_id), "ab"),
+        open(_index_path(session_id), "ab"),
+        open(_replies_path(session_id), "ab"),
+    )
+    _handles[session_id] = handles
+
+    # Bound the number of open file descriptors
+    while len(_handles) > MAX_OPEN_SESSIONS:
+        _, evicted = _handles.popitem(last=False)
+        for f in evicted:
+            f.close()
+
+    return handles
+
+
+def _decode(raw: bytes) -> Optional[Dict[str, Any]]:
+    """Decode one stored line into a turn record"""
+    try:
+        rec = json.loads(raw)
+    except (json.JSONDecodeError, UnicodeDecodeError):
+        return None
+    return {
+        "turn": rec.get("t", rec.get("turn")),
+        "ts": rec.get("ts"),
+        "message": rec.get("m", rec.get("message")),
+        "reply_length": rec.get("r"),
+    }
+
+
+def _read_entries(path: str, entry: struct.Struct) -> List[Tuple[int, int]]:
+    """Fixed-width entries of a binary side file"""
+    try:
+        with open(path, "rb") as f:
+            buf = f.read()
+    except FileNotFoundError:
+        return []
+    # Ignore a torn trailing entry from a crash mid-write
+    usable = len(buf) - len(buf) % entry.size
+    return list(entry.iter_unpack(buf[:usable]))
+
+
+def _get_index(session_id: str) -> _SessionIndex:
+    """
+    Parsed index for a session, loaded on first use (caller holds the lock)
+
+    Loading under the lock keeps an append from slipping in between
+    reading the files and caching the result.
+    """
+    index = _indexes.get(session_id)
+    if index is not None:
+        _indexes.move_to_end(session_id)
+        return index
+
+    # Already sorted unless concurrent requests raced; sort() is linear then
+    entries = sorted(_read_entries(_index_path(session_id), _INDEX_ENTRY))
+    replies = dict(_read_entries(_replies_path(session_id), _REPLY_ENTRY))
+    index = _SessionIndex([turn for turn, _ in entries], [offset for _, offset in entries], replies)
+
+    if INDEX_CACHE_SESSIONS > 0:
+        _indexes[session_id] = index
+        while len(_indexes) > INDEX_CACHE_SESSIONS:
+            _indexes.popitem(last=False)
+    return index
+
+
+def _turn_of(record: Dict[str, Any]) -> int:
+    return record["turn"]
+
+
+def _read_at(f, offset: int) -> Optional[Dict[str, Any]]:
+    """Decode the record starting at a byte offset"""
+    f.seek(offset)
+    raw = f.readline()
+    if not raw.endswith(b"\n"):
+        return None
+    return _decode(raw)
+
+
+def _with_reply(record: Dict[str, Any], replies: Dict[int, int]) -> Dict[str, Any]:
+    reply_length = replies.get(record["turn"])
+    if reply_length is not None:
+        record["reply_length"] = reply_length
+    return record
+
+
+def _unindexed(f, end: Optional[int]) -> List[Dict[str, Any]]:
+    """
+    Records written after the last indexed one
+
+    Only non-empty after a crash between the data and index writes.
+
+    Args:
+        f: Open data file
+        end: Offset of the last indexed record (None if nothing is indexed)
+
+    Returns:
+        Turn records ordered by turn
+    """
+    start = 0
+    if end is not None:
+        f.seek(end)
+        f.readline()
+        start = f.tell()
+
+    f.seek(start)
+    records = []
+    for raw in f:
+        if not raw.endswith(b"\n"):
+            break  # torn last line from a crash mid-write
+        record = _decode(raw)
+        if record is not None:
+            records.append(record)
+    return sorted(records, key=_turn_of)
+
+
+# ============================================
+# WRITE PATH
+# ============================================
+@traced("turn_log.append_turn")
+def append_turn(
+    session_id: str,
+    turn: int,
+    message: str,
+    reply_length: Optional[int] = None
+) -> None:
+    """
+    Append a user message to the session's turn log
+
+    Args:
+        session_id: User session identifier
+        turn: Conversation turn number
+        message: Raw user message
+        reply_length: Length of the assistant reply in characters, if
+            already known (otherwise see record_reply)
+    """
+    record = {"t": int(turn), "ts": round(time.time(), 3), "m": message}
+    if reply_length is not None:
+        record["r"] = int(reply_length)
+    line = json.dumps(record, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+    with _lock:
+        data_f, index_f, _ = _get_handles(session_id)
+        offset = data_f.tell()
+        data_f.write(line)
+        data_f.flush()
+        # Data first, then index: a crash can only lose index entries,
+        # which range reads recover from by scanning forward
+        index_f.write(_INDEX_ENTRY.pack(int(turn), offset))
+        index_f.flush()
+        if TURN_LOG_FSYNC:
+            os.fsync(data_f.fileno())
+            os.fsync(index_f.fileno())
+        index = _indexes.get(session_id)
+        if index is not None:
+            index.add(int(turn), offset)
+
+
+@traced("turn_log.record_reply")
+def record_reply(session_id: str, turn: int, reply_length: int) -> None:
+    """
+    Record the length of the reply to an already logged turn
+
+    Messages are logged before generation, so the reply length is
+    written afterwards to the .replies side file.
+
+    Args:
+        session_id: User session identifier
+        turn: Turn the reply answers
+        reply_length: Length of the assistant reply in characters
+    """
+    with _lock:
+        _, _, replies_f = _get_handles(session_id)
+        replies_f.write(_REPLY_ENTRY.pack(int(turn), int(reply_length)))
+        replies_f.flush()
+        if TURN_LOG_FSYNC:
+            os.fsync(replies_f.fileno())
+        index = _indexes.get(session_id)
+        if index is not None:
+            index.replies[int(turn)] = int(reply_length)
+
+
+def close_all() -> None:
+    """Close every cached file handle (e.g. on shutdown)"""
+    with _lock:
+        for handles in _handles.values():
+            for f in handles:
+                f.close()
+        _handles.clear()
+        _indexes.clear()
+
+# ============================================
+# READ PATH
+# ============================================
+def iter_turns(
+    session_id: str,
+    start_turn: Optional[int] = None,
+    end_turn: Optional[int] = None
+) -> Iterator[Dict[str, Any]]:
+    """
+    Stream logged turns for a session in turn order
+
+    Args:
+        session_id: User session identifier
+        start_turn: First turn to include (inclusive)
+        end_turn: Last turn to include (inclusive)
+
+    Yields:
+        Turn records with turn, ts, message and reply_length
+    """
+    path = _session_path(session_id)
+    if not os.path.exists(path):
+        return
+
+    with _lock:
+        index = _get_index(session_id)
+        lo = bisect_left(index.turns, start_turn) if start_turn is not None else 0
+        hi = bisect_right(index.turns, end_turn) if end_turn is not None else len(index.turns)
+        offsets, end, replies = index.offsets[lo:hi], index.end, index.replies
+
+    with open(path, "rb") as f:
+        tail = [
+            record for record in _unindexed(f, end)
+            if (start_turn is None or record["turn"] >= start_turn)
+            and (end_turn is None or record["turn"] <= end_turn)
+        ]
+
+        def indexed() -> Iterator[Dict[str, Any]]:
+            for offset in offsets:
+                record = _read_at(f, offset)
+                if record is None:
+                    logger.warning("Skipping corrupt turn log line in %s", path)
+                    continue
+                yield record
+
+        for record in heapq.merge(indexed(), tail, key=_turn_of):
+            yield _with_reply(record, replies)
+
+
+def read_range(session_id: str, start_turn: int, end_turn: int) -> List[Dict[str, Any]]:
+    """
+    Read turns in [start_turn, end_turn] using the offset index
+
+    Returns:
+        List of turn records
+    """
+    return list(iter_turns(session_id, start_turn, end_turn))
+
+
+@traced("turn_log.get_turn_message")
+def get_turn_message(session_id: str, turn: int) -> Optional[str]:
+    """
+    Look up the raw message for a specific turn
+
+    Returns:
+        The message text or None if the turn was never logged
+    """
+    for record in iter_turns(session_id, turn, turn):
+        return record.get("message")
+    return None
+
+
+def last_turn(session_id: str) -> int:
+    """
+    Highest turn number logged for a session
+
+    Returns:
+        Turn number, or 0 if the session has no log
+    """
+    with _lock:
+        index = _get_index(session_id)
+        turns, end = index.turns[-1:], index.end
+    try:
+        with open(_session_path(session_id), "rb") as f:
+            tail = _unindexed(f, end)
+    except FileNotFoundError:
+        tail = []
+    return max(turns + [record["turn"] for record in tail], default=0)
+
+
+def recent_turns(session_id: str, n: int = 5) -> List[Dict[str, Any]]:
+    """
+    Read the last n turns of a session without scanning the whole log
+
+    Args:
+        session_id: User session identifier
+        n: Number of turns to return
+
+    Returns:
+        Turn records, oldest first
+    """
+    if n <= 0:
+        return []
+    with _lock:
+        index = _get_index(session_id)
+        offsets, end, replies = index.offsets[-n:], index.end, index.replies
+    try:
+        with open(_session_path(session_id), "rb") as f:
+            tail = _unindexed(f, end)
+            records = [r for r in (_read_at(f, offset) for offset in offsets) if r is not None]
+    except FileNotFoundError:
+        return []
+    return [_with_reply(r, replies) for r in list(heapq.merge(records, tail, key=_turn_of))[-n:]]
+
+
+def list_sessions() -> List[str]:
+    """List session ids that have a turn log"""
+    if not os.path.isdir(TURN_LOG_DIR):
+        return []
+    return sorted(
+        name[:-len(".jsonl")]
+        for name in os.listdir(TURN_LOG_DIR)
+        if name.endswith(".jsonl")
+    )
@@ -122,18 +122,20 @@
 #         print("Reflection generation error:", e)
 #         return []
 import os
+import hashlib
+import logging
 from dotenv import load_dotenv
-from groq import Groq
 
+from llm.scheduler import scheduler, llm_available, PRIORITY_REFLECTION
 from memory.retrieve import retrieve_memories
 from memory.schema import Memory
-from memory.add_memory import store_memory
+from memory.add_memory import store_memories_batch
 from utils.session import get_turn
 
 load_dotenv()
+logger = logging.getLogger(__name__)
 
-api_key = os.getenv("GROQ_API_KEY")
-client = Groq(api_key=api_key)
+REFLECTION_MODEL = os.getenv("REFLECTION_MODEL", "llama-3.1-8b-instant")
 
 
 REFLECTION_PROMPT = """
@@ -172,26 +174,58 @@ def build_memory_block(memories):
     return "\n".join(lines)
 
 
-def generate_reflections(session_id: str, trigger_turn: int):
+def fetch_reflection_memories(session_id: str):
+    """Memories a reflection for this session would be generated from."""
+
+    return retrieve_memories(
+        session_id=session_id,
+        query="user personal information",
+        k=15
+    )
+
+
+def memory_set_hash(memories):
+    """
+    Content hash of the non-reflection memories in a reflection input.
+
+    Reflections themselves are excluded so storing them doesn't make
+    the next run look like it has new material.
+    """
+
+    lines = sorted(
+        f"{m.get('id')}\x00{m.get('text', '')}"
+        for m in memories
+        if (m.get("meta") or {}).get("type") != "reflection"
+    )
+    return hashlib.sha1("\n".join(lines).encode("utf-8")).hexdigest()
+
+
+def generate_reflections(session_id: str, trigger_turn: int, memories=None):
+    """
+    Generate and store reflections for a session.
+
+    Returns the stored reflection IDs (possibly none, e.g. when the model
+    output is unusable or every reflection was a duplicate).
+
+    Raises:
+        Exception: If fetching memories or the LLM call fails, so the
+            caller can retry; errors after a successful call are logged
+    """
 
     # ---------- Safety ----------
-    if not api_key:
+    if not llm_available():
         return []
 
-    try:
-        # ---------- Fetch recent memories ----------
-        memories = retrieve_memories(
-            session_id=session_id,
-            query="user personal information",
-            k=15
-        )
-
-        if not memories:
-            return []
+    # ---------- Fetch recent memories ----------
+    if memories is None:
+        memories = fetch_reflection_memories(session_id)
+
+    if not memories:
+        return []
 
-        memory_block = build_memory_block(memories)
+    memory_block = build_memory_block(memories)
 
-        prompt = f"""
+    prompt = f"""
 User Memories:
 
 {memory_block}
@@ -199,17 +233,19 @@ User Memories:
 Generate reflections.
 """
 
-        # ---------- LLM Call ----------
-        response = client.chat.completions.create(
-            messages=[
-                {"role": "system", "content": REFLECTION_PROMPT},
-                {"role": "user", "content": prompt}
-            ],
-            model="llama-3.1-8b-instant",
-            temperature=0.2,
-            max_tokens=200,
-        )
+    # ---------- LLM Call (lowest priority) ----------
+    response = scheduler.chat_completion(
+        PRIORITY_REFLECTION,
+        messages=[
+            {"role": "system", "content": REFLECTION_PROMPT},
+            {"role": "user", "content": prompt}
+        ],
+        model=REFLECTION_MODEL,
+        temperature=0.2,
+        max_tokens=200,
+    )
 
+    try:
         if not response or not response.choices:
             return []
 
@@ -222,11 +258,8 @@ Generate reflections.
         import json
         reflections = json.loads(content)
 
-        stored_ids = []
-
-        for r in reflections:
-
-            memory = Memory(
+        new_memories = [
+            Memory(
                 session_id=session_id,
                 type="reflection",
                 key="user_insight",
@@ -235,12 +268,14 @@ Generate reflections.
                 source_turn=trigger_turn,
                 last_used_turn=trigger_turn
             )
+            for r in reflections
+        ]
 
-            memory_id = store_memory(memory)
-            stored_ids.append(memory_id)
+        # One embedding request and one batch write for all reflections
+        stored_ids = store_memories_batch(new_memories)
 
-        return stored_ids
+        return [memory_id for memory_id in stored_ids if memory_id]
 
     except Exception as e:
-        print("Reflection generation error:", e)
+        logger.error("Reflection generation error: %s", e)
         return []
\ No newline at end of file
@@ -0,0 +1,232 @@
+"""
+Debounced Reflection Jobs
+Runs reflection per session only when there is new material to reflect on
+
+Reflection used to run inline every 5th turn, whether or not anything had
+been stored since the last run. Each run costs a retrieval, a Groq call
+and three embedded memory writes. Instead:
+
+1. Stored memories are counted per session; a job is only scheduled once
+   REFLECTION_MIN_NEW_MEMORIES have accumulated
+2. Further triggers while a job is pending coalesce into it, and the job
+   waits for REFLECTION_DEBOUNCE_S of quiet before running
+3. Before calling the LLM the job hashes the input memory set and skips
+   if it is unchanged since the session's last reflection
+4. A single low-priority worker runs jobs, and only while the memory
+   pipeline has spare capacity
+5. A run whose LLM call fails (e.g. rate limited) does not mark the memory
+   set as done; it is retried with exponential backoff up to
+   REFLECTION_MAX_RETRIES times. A successful call marks it done even if
+   no reflection was stored (all duplicates), so it is not asked again
+"""
+
+import os
+import time
+import threading
+from dataclasses import dataclass
+from typing import Any, Callable, Dict, Optional
+import logging
+
+from reflection.generate_reflection import (
+    fetch_reflection_memories,
+    memory_set_hash,
+    generate_reflections
+)
+from utils.metrics import timed
+from utils.tracing import start_trace, KIND_INTERNAL
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+REFLECTION_MIN_NEW_MEMORIES = int(os.getenv("REFLECTION_MIN_NEW_MEMORIES", "3"))
+REFLECTION_DEBOUNCE_S = float(os.getenv("REFLECTION_DEBOUNCE_S", "20"))
+# Lower bound between two reflections of the same session
+REFLECTION_MIN_INTERVAL_S = float(os.getenv("REFLECTION_MIN_INTERVAL_S", "120"))
+REFLECTION_MAX_RETRIES = int(os.getenv("REFLECTION_MAX_RETRIES", "3"))
+REFLECTION_RETRY_S = float(os.getenv("REFLECTION_RETRY_S", "60"))
+REFLECTION_POLL_S = 1.0
+
+
+@dataclass
+class _SessionState:
+    new_memories: int = 0
+    latest_turn: int = 0
+    due_at: Optional[float] = None  # Set while a job is pending
+    last_run_at: float = 0.0
+    last_hash: Optional[str] = None
+    failures: int = 0  # Consecutive failed runs
+
+
+class ReflectionScheduler:
+    """
+    Per-session debounced reflection jobs on one background thread
+
+    Args:
+        can_run: Returns False while the server is too busy for reflection
+        reflect: Reflection function (session_id, turn, memories) -> stored IDs;
+            raises if the LLM call failed
+    """
+
+    def __init__(
+        self,
+        can_run: Optional[Callable[[], bool]] = None,
+        reflect: Callable[..., Any] = generate_reflections,
+        min_new_memories: int = REFLECTION_MIN_NEW_MEMORIES,
+        debounce_s: float = REFLECTION_DEBOUNCE_S,
+        min_interval_s: float = REFLECTION_MIN_INTERVAL_S,
+        max_retries: int = REFLECTION_MAX_RETRIES
+    ):
+        self.can_run = can_run or (lambda: True)
+        self.reflect = reflect
+        self.min_new_memories = max(1, min_new_memories)
+        self.debounce_s = debounce_s
+        self.min_interval_s = min_interval_s
+        self.max_retries = max(0, max_retries)
+        self._sessions: Dict[str, _SessionState] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats_counters = {
+            "triggers": 0,
+            "coalesced": 0,
+            "runs": 0,
+            "skipped_unchanged": 0,
+            "errors": 0,
+            "retries": 0,
+        }
+
+    def _count(self, name: str) -> None:
+        with self._lock:
+            self.stats_counters[name] += 1
+
+    # ---------- triggers ----------
+    def note_memories_stored(self, session_id: str, count: int, turn: int) -> None:
+        """
+        Record newly stored memories, scheduling a job once enough accumulate
+
+        Args:
+            session_id: Session the memories belong to
+            count: Number of memories stored
+            turn: Turn they were stored at
+        """
+        if count <= 0:
+            return
+
+        with self._lock:
+            state = self._sessions.setdefault(session_id, _SessionState())
+            state.new_memories += count
+            state.latest_turn = max(state.latest_turn, turn)
+
+            if state.new_memories < self.min_new_memories:
+                return
+
+            self.stats_counters["triggers"] += 1
+            if state.due_at is not None:
+                self.stats_counters["coalesced"] += 1
+            # (Re)arm the debounce timer, never earlier than the per-session interval
+            state.due_at = max(
+                time.monotonic() + self.debounce_s,
+                state.last_run_at + self.min_interval_s
+            )
+
+    # ---------- execution ----------
+    def _next_due(self) -> Optional[str]:
+        now = time.monotonic()
+        with self._lock:
+            due = [
+                (state.due_at, session_id)
+                for session_id, state in self._sessions.items()
+                if state.due_at is not None and state.due_at <= now
+            ]
+        return min(due)[1] if due else None
+
+    def run_job(self, session_id: str) -> bool:
+        """
+        Run one session's pending reflection
+
+        Returns:
+            True if the LLM was called
+        """
+        with self._lock:
+            state = self._sessions.get(session_id)
+            if state is None or state.due_at is None:
+                return False
+            # Claim the pending work; triggers arriving from now on schedule a new job
+            state.due_at = None
+            claimed = state.new_memories
+            state.new_memories = 0
+            turn = state.latest_turn
+            previous_hash = state.last_hash
+
+        try:
+            memories = fetch_reflection_memories(session_id)
+            input_hash = memory_set_hash(memories) if memories else None
+            if not memories or input_hash == previous_hash:
+                self._count("skipped_unchanged")
+                logger.debug("Reflection skipped for %s: memory set unchanged", session_id)
+                return False
+
+            logger.info("Generating reflections for %s at turn %s (%d new memories)", session_id, turn, claimed)
+            with timed("reflect"):
+                stored = self.reflect(session_id, turn, memories=memories)
+
+            # The call succeeded: this memory set is done even if every
+            # reflection was deduplicated away
+            with self._lock:
+                self.stats_counters["runs"] += 1
+                state.last_run_at = time.monotonic()
+                state.last_hash = input_hash
+                state.failures = 0
+            logger.debug("Reflection for %s stored %d memories", session_id, len(stored or []))
+            return True
+
+        except Exception as e:
+            self._count("errors")
+            logger.error(f"Reflection job failed for {session_id}: {e}", exc_info=True)
+            self._retry_later(session_id, state, claimed)
+            return False
+
+    def _retry_later(self, session_id: str, state: _SessionState, claimed: int) -> None:
+        """Hand the claimed work back and re-arm the job with backoff"""
+        with self._lock:
+            state.new_memories += claimed
+            state.failures += 1
+            if state.failures > self.max_retries:
+                logger.warning(
+                    "Reflection for %s failed %d times; waiting for new memories",
+                    session_id, state.failures
+                )
+                state.failures = 0
+                return
+            if state.due_at is None:
+                state.due_at = time.monotonic() + REFLECTION_RETRY_S * 2 ** (state.failures - 1)
+            self.stats_counters["retries"] += 1
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            session_id = self._next_due() if self.can_run() else None
+            if session_id is None:
+                self._stop.wait(REFLECTION_POLL_S)
+                continue
+            with start_trace("reflection_job", kind=KIND_INTERNAL, session_id=session_id):
+                self.run_job(session_id)
+
+    def start(self) -> None:
+        """Start the worker thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="reflection-jobs", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Signal the worker to exit after its current job"""
+        self._stop.set()
+
+    def stats(self) -> Dict[str, Any]:
+        """Job counters and pending sessions"""
+        with self._lock:
+            pending = sum(1 for state in self._sessions.values() if state.due_at is not None)
+        return {**self.stats_counters, "pending": pending}
@@ -0,0 +1,128 @@
+"""
+Active Session Registry
+Remembers which sessions were recently active, across restarts
+
+/chat touches the session on every request (a dict update under a lock).
+A background thread snapshots the registry to ACTIVE_SESSIONS_PATH every
+ACTIVE_SESSIONS_FLUSH_S and on shutdown, so after a deploy the warm-up
+knows whose memories to preload before traffic arrives.
+"""
+
+import os
+import json
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+ACTIVE_SESSIONS_PATH = os.getenv("ACTIVE_SESSIONS_PATH", "./active_sessions.json")
+ACTIVE_SESSIONS_MAX = int(os.getenv("ACTIVE_SESSIONS_MAX", "1000"))
+ACTIVE_SESSIONS_FLUSH_S = float(os.getenv("ACTIVE_SESSIONS_FLUSH_S", "30"))
+ACTIVE_SESSIONS_MAX_AGE_S = float(os.getenv("ACTIVE_SESSIONS_MAX_AGE_S", str(7 * 24 * 3600)))
+
+
+class ActiveSessions:
+    """
+    Most-recently-active session ids with last-seen times
+
+    Args:
+        path: Snapshot file ("" keeps the registry in memory only)
+        max_sessions: Oldest sessions are dropped beyond this
+        flush_s: Seconds between snapshots while something changed
+    """
+
+    def __init__(
+        self,
+        path: str = ACTIVE_SESSIONS_PATH,
+        max_sessions: int = ACTIVE_SESSIONS_MAX,
+        flush_s: float = ACTIVE_SESSIONS_FLUSH_S
+    ):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.flush_s = flush_s
+        self._seen: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def touch(self, session_id: str) -> None:
+        """Record activity for a session (request path - no I/O)"""
+        with self._lock:
+            self._seen[session_id] = time.time()
+            self._seen.move_to_end(session_id)
+            while len(self._seen) > self.max_sessions:
+                self._seen.popitem(last=False)
+            self._dirty = True
+
+    def recent(self, limit: Optional[int] = None, max_age_s: float = ACTIVE_SESSIONS_MAX_AGE_S) -> List[str]:
+        """Session ids seen within max_age_s, most recent first"""
+        cutoff = time.time() - max_age_s
+        with self._lock:
+            items = list(self._seen.items())
+        ids = [session_id for session_id, seen in reversed(items) if seen >= cutoff]
+        return ids[:limit] if limit else ids
+
+    # ---------- persistence ----------
+    def save(self) -> None:
+        if not self.path:
+            return
+        with self._lock:
+            payload = {"sessions": list(self._seen.items())}
+            self._dirty = False
+        try:
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(payload, f)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            logger.warning("Could not persist active sessions: %s", e)
+
+    def load(self) -> None:
+        """Merge a snapshot; sessions touched since startup keep their newer time"""
+        if not self.path:
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                payload = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, json.JSONDecodeError) as e:
+            logger.warning("Ignoring unreadable active sessions file: %s", e)
+            return
+
+        with self._lock:
+            merged = dict(payload.get("sessions", []))
+            merged.update(self._seen)
+            ordered = sorted(merged.items(), key=lambda item: item[1])[-self.max_sessions:]
+            self._seen = OrderedDict(ordered)
+        logger.info("✅ Loaded %d active sessions", len(ordered))
+
+    # ---------- background flush ----------
+    def start(self) -> None:
+        if not self.path or (self._thread and self._thread.is_alive()):
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="active-sessions", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=5)
+        self.save()
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.flush_s):
+            if self._dirty:
+                self.save()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"sessions": len(self._seen), "path": self.path or None}
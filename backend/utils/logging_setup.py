@@ -0,0 +1,192 @@
+"""
+Logging Setup
+Queue-backed, structured logging kept off the request path
+
+Request threads only build a LogRecord and put it on a bounded in-memory
+queue; a single listener thread formats it and writes to stdout (and
+app.log with LOG_TO_FILE). Records are enqueued with their args intact,
+so %-style messages are only formatted by the listener - call sites use
+logger.info("Stored %s", key), not f-strings.
+
+- LOG_FORMAT=json emits one JSON object per line with the trace id of
+  the request or job that logged it, plus any `extra` fields
+- LOG_SAMPLE sets per-logger 1-in-N sampling for INFO and below, e.g.
+  "memory.json_store=10,memory.retrieve=5"; warnings always pass
+- A full queue drops the record instead of blocking the request;
+  drops are counted in logging_stats()
+"""
+
+import os
+import sys
+import json
+import queue
+import logging
+import itertools
+import logging.handlers
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+# ============================================
+# CONFIGURATION
+# ============================================
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+LOG_FORMAT = os.getenv("LOG_FORMAT", "text").lower()  # "text" or "json"
+LOG_FILE = os.getenv("LOG_FILE", "app.log")
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+LOG_SAMPLE = os.getenv("LOG_SAMPLE", "")
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# Attributes every LogRecord has; anything else came in via `extra`
+_RESERVED = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime", "trace_id"}
+
+_stats = {"dropped": 0, "sampled_out": 0}
+_listener: Optional[logging.handlers.QueueListener] = None
+_queue: Optional[queue.Queue] = None
+_queue_handler: Optional[logging.Handler] = None
+
+
+def _parse_sampling(spec: str) -> Dict[str, int]:
+    rates = {}
+    for item in spec.split(","):
+        if "=" not in item:
+            continue
+        name, every = item.split("=", 1)
+        try:
+            rates[name.strip()] = max(1, int(every))
+        except ValueError:
+            continue
+    return rates
+
+
+# ============================================
+# FILTERS (run on the calling thread - keep cheap)
+# ============================================
+class SamplingFilter(logging.Filter):
+    """
+    Keep 1 in N INFO/DEBUG records per configured logger prefix
+
+    Args:
+        rates: {logger name prefix: N}
+    """
+
+    def __init__(self, rates: Dict[str, int]):
+        super().__init__()
+        # Longest prefix wins
+        self.rates = sorted(rates.items(), key=lambda item: -len(item[0]))
+        self._counters: Dict[str, itertools.count] = {name: itertools.count() for name in rates}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING or not self.rates:
+            return True
+        for prefix, every in self.rates:
+            if record.name == prefix or record.name.startswith(prefix + "."):
+                if next(self._counters[prefix]) % every == 0:
+                    return True
+                _stats["sampled_out"] += 1
+                return False
+        return True
+
+
+class TraceContextFilter(logging.Filter):
+    """Attach the active trace id while still on the logging thread"""
+
+    def __init__(self):
+        super().__init__()
+        from utils.tracing import current_trace_id
+        self._current_trace_id = current_trace_id
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        record.trace_id = self._current_trace_id()
+        return True
+
+
+# ============================================
+# HANDLERS
+# ============================================
+class NonBlockingQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that defers formatting and drops on a full queue"""
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Same-process queue: no pickling, so leave msg/args for the listener
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            _stats["dropped"] += 1
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        payload: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, tz=timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        if getattr(record, "trace_id", None):
+            payload["trace_id"] = record.trace_id
+        for key, value in record.__dict__.items():
+            if key not in _RESERVED and not key.startswith("_"):
+                payload[key] = value
+        if record.exc_info:
+            payload["exc_info"] = self.formatException(record.exc_info)
+        return json.dumps(payload, default=str, ensure_ascii=False)
+
+
+def configure_logging() -> None:
+    """
+    Route the root logger through the background queue
+
+    Safe to call more than once; later calls are no-ops.
+    """
+    global _listener, _queue, _queue_handler
+    if _listener is not None:
+        return
+
+    formatter = JsonFormatter() if LOG_FORMAT == "json" else logging.Formatter(TEXT_FORMAT)
+    outputs = [logging.StreamHandler(sys.stdout)]
+    if os.environ.get("LOG_TO_FILE"):
+        outputs.append(logging.FileHandler(LOG_FILE))
+    for handler in outputs:
+        handler.setFormatter(formatter)
+
+    _queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    _queue_handler = NonBlockingQueueHandler(_queue)
+    _queue_handler.addFilter(SamplingFilter(_parse_sampling(LOG_SAMPLE)))
+    _queue_handler.addFilter(TraceContextFilter())
+
+    root = logging.getLogger()
+    root.setLevel(LOG_LEVEL)
+    for handler in list(root.handlers):
+        root.removeHandler(handler)
+    root.addHandler(_queue_handler)
+
+    _listener = logging.handlers.QueueListener(_queue, *outputs, respect_handler_level=True)
+    _listener.start()
+
+
+def stop_logging() -> None:
+    """Flush queued records, then log synchronously for the rest of shutdown"""
+    global _listener
+    if _listener is None:
+        return
+    root = logging.getLogger()
+    root.removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        root.addHandler(handler)
+    _listener = None
+
+
+def logging_stats() -> Dict[str, Any]:
+    return {
+        **_stats,
+        "queued": _queue.qsize() if _queue is not None else 0,
+        "format": LOG_FORMAT,
+        "sampling": _parse_sampling(LOG_SAMPLE),
+    }
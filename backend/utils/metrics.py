@@ -0,0 +1,277 @@
+"""
+Metrics
+Per-stage latency histograms and counters, rendered in Prometheus text format
+
+Kept dependency-free and cheap: a timed stage costs two perf_counter()
+calls, a bisect into the bucket list and one uncontended lock. Values
+that modules already count (cache hits, LLM calls per priority class)
+are not double-counted on the hot path; collectors read them from the
+existing stats() methods when /metrics is scraped.
+
+Stages (memory_stage_duration_seconds{stage=...}):
+    embed, search, post_process, rank, context, generate, extract, store, reflect
+search includes the query embedding, so embed also shows up inside it.
+
+Set METRICS_ENABLED=false to turn recording into no-ops.
+"""
+
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+import logging
+
+from utils.tracing import span
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() == "true"
+
+# Seconds; covers sub-millisecond in-memory stages up to slow LLM calls
+DEFAULT_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1,
+    0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+)
+
+# (metric name, labels, value)
+Sample = Tuple[str, Dict[str, str], float]
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+# ============================================
+# METRIC TYPES
+# ============================================
+class Counter:
+    """Monotonic counter with optional labels"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = list(self._values.items())
+        return [(f"{self.name}_total", dict(zip(self.labelnames, key)), value) for key, value in items]
+
+
+class Histogram:
+    """Cumulative-bucket histogram with optional labels"""
+
+    kind = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ):
+        self.name = name
+        self.help = help_text
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts (+Inf last), sum, count]
+        self._series: Dict[Tuple[str, ...], list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        if not METRICS_ENABLED:
+            return
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            series[0][index] += 1
+            series[1] += value
+            series[2] += 1
+
+    @contextmanager
+    def time(self, **labels: str) -> Iterator[None]:
+        """Observe the wall time of the with-block (also on exceptions)"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+
+    def samples(self) -> List[Sample]:
+        with self._lock:
+            items = [(key, list(series[0]), series[1], series[2]) for key, series in self._series.items()]
+
+        out: List[Sample] = []
+        for key, counts, total, count in items:
+            labels = dict(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += bucket_count
+                out.append((f"{self.name}_bucket", {**labels, "le": _format_value(bound)}, cumulative))
+            out.append((f"{self.name}_sum", labels, total))
+            out.append((f"{self.name}_count", labels, count))
+        return out
+
+
+# ============================================
+# REGISTRY
+# ============================================
+class Registry:
+    """
+    Owns metrics and scrape-time collectors
+
+    A collector is registered with a name, type and help text and returns
+    (labels, value) pairs read from state kept elsewhere.
+    """
+
+    def __init__(self):
+        self._metrics: List = []
+        self._collectors: List[Tuple[str, str, str, Callable[[], Iterable[Tuple[Dict[str, str], float]]]]] = []
+        self._lock = threading.Lock()
+
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+
+    def counter(self, name: str, help_text: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labelnames))
+
+    def histogram(
+        self,
+        name: str,
+        help_text: str,
+        labelnames: Sequence[str] = (),
+        buckets: Sequence[float] = DEFAULT_BUCKETS
+    ) -> Histogram:
+        return self.register(Histogram(name, help_text, labelnames, buckets))
+
+    def add_collector(
+        self,
+        name: str,
+        kind: str,
+        help_text: str,
+        collect: Callable[[], Iterable[Tuple[Dict[str, str], float]]]
+    ) -> None:
+        """
+        Register values read at scrape time
+
+        Args:
+            name: Metric name (counters must end in _total)
+            kind: "counter" or "gauge"
+            help_text: HELP line
+            collect: Returns (labels, value) pairs
+        """
+        with self._lock:
+            self._collectors.append((name, kind, help_text, collect))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics)
+            collectors = list(self._collectors)
+
+        lines: List[str] = []
+        for metric in metrics:
+            family = metric.name + ("_total" if metric.kind == "counter" else "")
+            lines.append(f"# HELP {family} {metric.help}")
+            lines.append(f"# TYPE {family} {metric.kind}")
+            for name, labels, value in metric.samples():
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        for name, kind, help_text, collect in collectors:
+            try:
+                values = list(collect())
+            except Exception as e:
+                logger.debug(f"Metrics collector {name} failed: {e}")
+                continue
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for labels, value in values:
+                if value is None:
+                    continue
+                lines.append(f"{name}{_format_labels(labels)} {_format_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+# ============================================
+# SHARED METRICS
+# ============================================
+STAGE_SECONDS = registry.histogram(
+    "memory_stage_duration_seconds",
+    "Time spent in each memory pipeline stage",
+    ["stage"]
+)
+CHAT_REQUEST_SECONDS = registry.histogram(
+    "chat_request_duration_seconds",
+    "End-to-end /chat handler time",
+    ["outcome"]
+)
+LLM_REQUEST_SECONDS = registry.histogram(
+    "llm_request_duration_seconds",
+    "Groq call latency after admission, by scheduler priority class",
+    ["priority"]
+)
+LLM_QUEUE_WAIT_SECONDS = registry.histogram(
+    "llm_queue_wait_seconds",
+    "Time LLM calls waited in the scheduler queue, by priority class",
+    ["priority"]
+)
+
+
+@contextmanager
+def timed(stage: str) -> Iterator[None]:
+    """
+    Time a pipeline stage into memory_stage_duration_seconds
+
+    Inside a trace the stage is also recorded as a span.
+
+    Usage:
+        with timed("rank"):
+            ranked = rank_memories(memories, turn)
+    """
+    with span(stage), STAGE_SECONDS.time(stage=stage):
+        yield
+
+
+def observe_stage(stage: str, seconds: float) -> None:
+    """Record a stage duration measured by the caller"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+
+
+def render_metrics() -> str:
+    return registry.render()
@@ -0,0 +1,332 @@
+"""
+Overload Protection for the Background Memory Pipeline
+Load shedding with durable deferral and batched catch-up
+
+When the LLM provider is slow, memory_pipeline tasks pile up behind each
+other. The guard below sheds extraction once the pipeline queue depth or
+extraction latency crosses a threshold. Shed turns are written to a
+durable backlog (pointers into the turn log) and a catch-up worker drains
+them in batches once capacity returns, so no memories are lost.
+
+A failing batch is retried one entry at a time with exponential backoff,
+so a single poison entry cannot hold up the rest. An entry that still
+fails after CATCHUP_MAX_ATTEMPTS is moved to <backlog>.dead (pointers
+into the turn log, replayable with memory.reextract) and skipped.
+"""
+
+import os
+import json
+import threading
+import time
+from typing import Callable, Dict, Any, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+MAX_PENDING_PIPELINES = int(os.getenv("OVERLOAD_MAX_PENDING", "16"))
+MAX_EXTRACTION_LATENCY = float(os.getenv("OVERLOAD_MAX_LATENCY_S", "5.0"))
+LATENCY_EWMA_ALPHA = 0.3
+# Once shedding, only resume below these fractions of the thresholds
+RECOVERY_RATIO = 0.5
+
+DEFERRED_LOG_PATH = os.getenv("DEFERRED_LOG_PATH", "./deferred_backlog.jsonl")
+CATCHUP_BATCH_SIZE = int(os.getenv("CATCHUP_BATCH_SIZE", "8"))
+CATCHUP_INTERVAL_S = float(os.getenv("CATCHUP_INTERVAL_S", "10"))
+CATCHUP_MAX_ATTEMPTS = int(os.getenv("CATCHUP_MAX_ATTEMPTS", "5"))
+CATCHUP_MAX_BACKOFF_S = float(os.getenv("CATCHUP_MAX_BACKOFF_S", "600"))
+# Without fresh samples the latency estimate is stale; probe after this long
+LATENCY_PROBE_AFTER_S = float(os.getenv("OVERLOAD_PROBE_AFTER_S", "30"))
+
+# ============================================
+# OVERLOAD GUARD
+# ============================================
+class OverloadGuard:
+    """
+    Tracks pipeline queue depth and extraction latency
+
+    Uses hysteresis so the pipeline does not flap between shedding and
+    accepting work on every request around the threshold.
+    """
+
+    def __init__(
+        self,
+        max_pending: int = MAX_PENDING_PIPELINES,
+        max_latency: float = MAX_EXTRACTION_LATENCY
+    ):
+        self.max_pending = max_pending
+        self.max_latency = max_latency
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._latency_ewma = 0.0
+        self._last_sample_at = 0.0
+        self._shedding = False
+        self.accepted = 0
+        self.shed = 0
+
+    def try_acquire(self) -> bool:
+        """
+        Reserve a pipeline slot
+
+        Returns:
+            True if extraction should run now, False if it should be deferred
+        """
+        with self._lock:
+            self._update_state()
+            if self._shedding:
+                self.shed += 1
+                return False
+            self._pending += 1
+            self.accepted += 1
+            return True
+
+    def release(self) -> None:
+        """Free a slot reserved with try_acquire"""
+        with self._lock:
+            self._pending = max(0, self._pending - 1)
+
+    def record_latency(self, seconds: float) -> None:
+        """Feed an observed extraction latency into the EWMA"""
+        with self._lock:
+            if self._last_sample_at == 0.0:
+                self._latency_ewma = seconds
+            else:
+                self._latency_ewma = (
+                    LATENCY_EWMA_ALPHA * seconds
+                    + (1 - LATENCY_EWMA_ALPHA) * self._latency_ewma
+                )
+            self._last_sample_at = time.monotonic()
+
+    def has_capacity(self) -> bool:
+        """True when deferred work may be drained"""
+        with self._lock:
+            self._update_state()
+            return not self._shedding
+
+    def _update_state(self) -> None:
+        """Recompute shedding state (caller holds the lock)"""
+        latency_stale = (
+            self._last_sample_at
+            and time.monotonic() - self._last_sample_at > LATENCY_PROBE_AFTER_S
+        )
+        latency = 0.0 if latency_stale else self._latency_ewma
+
+        if self._shedding:
+            if (self._pending <= self.max_pending * RECOVERY_RATIO and
+                    latency <= self.max_latency * RECOVERY_RATIO):
+                self._shedding = False
+                logger.info("✅ Memory pipeline recovered, accepting extraction")
+        elif self._pending >= self.max_pending or latency > self.max_latency:
+            self._shedding = True
+            logger.warning(
+                f"⚠️ Memory pipeline overloaded (pending={self._pending}, "
+                f"latency={latency:.2f}s), deferring extraction"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of guard state for monitoring"""
+        with self._lock:
+            return {
+                "pending": self._pending,
+                "latency_ewma_s": round(self._latency_ewma, 3),
+                "shedding": self._shedding,
+                "accepted": self.accepted,
+                "shed": self.shed,
+            }
+
+# ============================================
+# DURABLE DEFERRED BACKLOG
+# ============================================
+class DeferredBacklog:
+    """
+    Append-only file of deferred (session_id, turn) pointers
+
+    A sidecar cursor file stores the byte offset of the first unprocessed
+    entry, so a restart resumes where the catch-up worker left off.
+    """
+
+    def __init__(self, path: str = DEFERRED_LOG_PATH):
+        self.path = path
+        self.cursor_path = path + ".cursor"
+        self.dead_letter_path = path + ".dead"
+        self._lock = threading.Lock()
+
+    def push(self, session_id: str, turn: int) -> None:
+        """Record a turn whose extraction was deferred"""
+        line = json.dumps({"session_id": session_id, "turn": int(turn), "ts": time.time()}) + "\n"
+        with self._lock:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a", encoding="utf-8") as f:
+                f.write(line)
+
+    def _read_cursor(self) -> int:
+        try:
+            with open(self.cursor_path, "r", encoding="utf-8") as f:
+                return int(f.read().strip() or 0)
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def _write_cursor(self, offset: int) -> None:
+        tmp_path = self.cursor_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(str(offset))
+        os.replace(tmp_path, self.cursor_path)
+
+    def peek(self, limit: int) -> Tuple[List[Dict[str, Any]], int]:
+        """
+        Read up to `limit` unprocessed entries
+
+        Returns:
+            (entries, end_offset) - pass end_offset to commit() when done
+        """
+        with self._lock:
+            if not os.path.exists(self.path):
+                return [], 0
+
+            offset = self._read_cursor()
+            entries = []
+            with open(self.path, "rb") as f:
+                f.seek(offset)
+                while len(entries) < limit:
+                    raw = f.readline()
+                    if not raw or not raw.endswith(b"\n"):
+                        break
+                    offset += len(raw)
+                    try:
+                        entries.append(json.loads(raw))
+                    except json.JSONDecodeError:
+                        logger.warning("Skipping corrupt deferred backlog entry")
+            return entries, offset
+
+    def commit(self, offset: int) -> None:
+        """Mark everything before `offset` as processed"""
+        with self._lock:
+            # Fully drained: truncate instead of growing forever
+            if os.path.exists(self.path) and offset >= os.path.getsize(self.path):
+                open(self.path, "w").close()
+                offset = 0
+            self._write_cursor(offset)
+
+    def dead_letter(self, entries: List[Dict[str, Any]], error: str, attempts: int) -> None:
+        """Record entries given up on after repeated failures"""
+        with self._lock:
+            with open(self.dead_letter_path, "a", encoding="utf-8") as f:
+                for entry in entries:
+                    f.write(json.dumps({**entry, "error": error, "attempts": attempts, "dead_at": time.time()}) + "\n")
+
+    def depth(self) -> int:
+        """Number of unprocessed entries (scans the unread tail)"""
+        with self._lock:
+            if not os.path.exists(self.path):
+                return 0
+            with open(self.path, "rb") as f:
+                f.seek(self._read_cursor())
+                return sum(1 for line in f if line.endswith(b"\n"))
+
+# ============================================
+# CATCH-UP WORKER
+# ============================================
+class CatchUpWorker:
+    """
+    Background thread that drains the deferred backlog in batches
+
+    Args:
+        guard: Overload guard consulted before each batch
+        backlog: Durable deferred backlog
+        process_batch: Callable receiving a list of backlog entries
+        max_attempts: Failures before the head entry is dead-lettered
+    """
+
+    def __init__(
+        self,
+        guard: OverloadGuard,
+        backlog: DeferredBacklog,
+        process_batch: Callable[[List[Dict[str, Any]]], None],
+        batch_size: int = CATCHUP_BATCH_SIZE,
+        interval: float = CATCHUP_INTERVAL_S,
+        max_attempts: int = CATCHUP_MAX_ATTEMPTS
+    ):
+        self.guard = guard
+        self.backlog = backlog
+        self.process_batch = process_batch
+        self.batch_size = batch_size
+        self.interval = interval
+        self.max_attempts = max(1, max_attempts)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Consecutive failures of the head entry / batch
+        self._failures = 0
+        # Entries of the last failed batch still to retry one at a time
+        self._isolating = 0
+        self.drained = 0
+        self.dead_lettered = 0
+
+    def start(self) -> None:
+        """Start the worker thread (idempotent)"""
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="memory-catchup", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        """Signal the worker to exit after its current batch"""
+        self._stop.set()
+
+    def drain_once(self) -> int:
+        """
+        Process one batch if capacity allows
+
+        Returns:
+            Number of entries processed
+        """
+        if not self.guard.has_capacity():
+            return 0
+
+        entries, end_offset = self.backlog.peek(1 if self._isolating else self.batch_size)
+        if not entries:
+            return 0
+
+        try:
+            self.process_batch(entries)
+        except Exception as e:
+            self._failures += 1
+            if len(entries) > 1:
+                self._isolating = len(entries)
+            if len(entries) > 1 or self._failures < self.max_attempts:
+                raise
+            logger.error(
+                "Dead-lettering deferred turn %s (%s) after %d failed attempts: %s",
+                entries[0].get("turn"), entries[0].get("session_id"), self._failures, e
+            )
+            self.backlog.dead_letter(entries, str(e), self._failures)
+            self.backlog.commit(end_offset)
+            self.dead_lettered += len(entries)
+            self._failures = 0
+            self._isolating = max(0, self._isolating - 1)
+            return len(entries)
+
+        self._failures = 0
+        self._isolating = max(0, self._isolating - len(entries))
+        self.backlog.commit(end_offset)
+        self.drained += len(entries)
+        logger.info("♻️ Caught up on %d deferred extractions", len(entries))
+        return len(entries)
+
+    def _retry_delay(self) -> float:
+        """Poll interval, backing off exponentially while batches fail"""
+        if not self._failures:
+            return self.interval
+        return min(self.interval * 2 ** (self._failures - 1), CATCHUP_MAX_BACKOFF_S)
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                # Keep draining back-to-back while there is work and capacity
+                while self.drain_once() and not self._stop.is_set():
+                    pass
+            except Exception as e:
+                logger.error(f"Error in catch-up worker: {e}", exc_info=True)
+            self._stop.wait(self._retry_delay())
@@ -0,0 +1,353 @@
+"""
+Request Profiling
+On-demand profiling of single requests and 1-in-N sampled flame-graph data
+
+On demand: send X-Profile: cprofile|sample (or ?profile=...) with an
+X-Profile-Token header matching PROFILE_ADMIN_TOKEN. The token is only
+read from the header, never the query string, so it stays out of access
+logs. The handler runs
+under the chosen profiler, the result is written to PROFILE_DIR and its
+id returned in X-Profile-Id; fetch it from /debug/profiles/{id}.
+
+- cprofile: deterministic, pstats text plus a .prof file for snakeviz etc.
+  Only one cProfile can run at a time; concurrent requests get sampled.
+- sample: a background thread snapshots the handler thread's stack every
+  PROFILE_SAMPLE_INTERVAL_MS and writes collapsed stacks (flamegraph.pl,
+  speedscope) - low overhead and safe to run concurrently
+
+Aggregate: with PROFILE_SAMPLE_EVERY_N > 0, every Nth request to a
+profiled path is sampled too and its stacks merged into
+aggregate-<timestamp>.collapsed, flushed every PROFILE_FLUSH_EVERY
+sampled requests and on shutdown.
+
+Sync FastAPI handlers run on threadpool workers, which a middleware on
+the event loop cannot profile. The middleware decides and authorizes,
+and the profile_handler decorator on the endpoint runs the profiler
+inside the worker thread.
+"""
+
+import os
+import io
+import sys
+import hmac
+import time
+import uuid
+import pstats
+import cProfile
+import itertools
+import threading
+import contextvars
+from collections import Counter
+from functools import wraps
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import parse_qs
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+PROFILE_ADMIN_TOKEN = os.getenv("PROFILE_ADMIN_TOKEN")  # Unset disables on-demand profiling
+PROFILE_DIR = os.getenv("PROFILE_DIR", "./profiles")
+PROFILE_PATHS = set(p.strip() for p in os.getenv("PROFILE_PATHS", "/chat").split(",") if p.strip())
+PROFILE_SAMPLE_EVERY_N = int(os.getenv("PROFILE_SAMPLE_EVERY_N", "0"))
+PROFILE_SAMPLE_INTERVAL_MS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "5"))
+PROFILE_FLUSH_EVERY = int(os.getenv("PROFILE_FLUSH_EVERY", "50"))
+PROFILE_MAX_DEPTH = 128
+
+MODES = ("cprofile", "sample")
+
+
+class ProfileRequest:
+    __slots__ = ("mode", "profile_id", "aggregate")
+
+    def __init__(self, mode: str, profile_id: Optional[str], aggregate: bool):
+        self.mode = mode
+        self.profile_id = profile_id  # None for aggregate-only samples
+        self.aggregate = aggregate
+
+
+_request_profile: contextvars.ContextVar[Optional[ProfileRequest]] = contextvars.ContextVar(
+    "request_profile", default=None
+)
+
+
+# ============================================
+# STACK SAMPLER
+# ============================================
+def _frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def _collapse(frame) -> str:
+    labels = []
+    while frame is not None and len(labels) < PROFILE_MAX_DEPTH:
+        labels.append(_frame_label(frame))
+        frame = frame.f_back
+    return ";".join(reversed(labels))
+
+
+class StackSampler:
+    """
+    One background thread sampling the stacks of registered threads
+
+    Args:
+        interval_s: Seconds between samples
+    """
+
+    def __init__(self, interval_s: float = PROFILE_SAMPLE_INTERVAL_MS / 1000.0):
+        self.interval_s = interval_s
+        self._targets: Dict[int, Counter] = {}
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.samples_taken = 0
+
+    def register(self, thread_id: int) -> Counter:
+        stacks: Counter = Counter()
+        with self._lock:
+            self._targets[thread_id] = stacks
+            self._ensure_thread()
+        self._wake.set()
+        return stacks
+
+    def unregister(self, thread_id: int) -> None:
+        with self._lock:
+            self._targets.pop(thread_id, None)
+
+    def _ensure_thread(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def _run(self) -> None:
+        while True:
+            with self._lock:
+                targets = dict(self._targets)
+            if not targets:
+                # Idle until a request registers
+                self._wake.wait()
+                self._wake.clear()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, stacks in targets.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    stacks[_collapse(frame)] += 1
+                    self.samples_taken += 1
+            del frames
+            time.sleep(self.interval_s)
+
+
+sampler = StackSampler()
+
+
+# ============================================
+# PROFILE STORAGE
+# ============================================
+_aggregate: Counter = Counter()
+_aggregate_lock = threading.Lock()
+_aggregate_pending = 0
+_cprofile_lock = threading.Lock()
+_profile_stats = {"on_demand": 0, "sampled": 0, "cprofile_busy": 0, "aggregate_files": 0}
+
+
+def _write_collapsed(path: str, stacks: Counter) -> None:
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in stacks.most_common():
+            f.write(f"{stack} {count}\n")
+
+
+def flush_aggregate() -> Optional[str]:
+    """Write merged sampled stacks to a new collapsed-stack file"""
+    global _aggregate_pending
+    with _aggregate_lock:
+        if not _aggregate:
+            return None
+        stacks = _aggregate.copy()
+        _aggregate.clear()
+        _aggregate_pending = 0
+
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    path = os.path.join(PROFILE_DIR, f"aggregate-{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:6]}.collapsed")
+    _write_collapsed(path, stacks)
+    _profile_stats["aggregate_files"] += 1
+    logger.info(f"📈 Wrote aggregate profile {path} ({sum(stacks.values())} samples)")
+    return path
+
+
+def _add_to_aggregate(stacks: Counter) -> None:
+    global _aggregate_pending
+    with _aggregate_lock:
+        _aggregate.update(stacks)
+        _aggregate_pending += 1
+        due = _aggregate_pending >= PROFILE_FLUSH_EVERY
+    if due:
+        flush_aggregate()
+
+
+def _profile_path(profile_id: str, suffix: str) -> str:
+    return os.path.join(PROFILE_DIR, f"{profile_id}{suffix}")
+
+
+def load_profile(profile_id: str) -> Optional[Dict[str, str]]:
+    """
+    Read a persisted on-demand profile
+
+    Returns:
+        {"format": "pstats"|"collapsed", "content": text}, or None
+    """
+    if not profile_id.replace("-", "").isalnum():
+        return None
+    for suffix, fmt in ((".txt", "pstats"), (".collapsed", "collapsed")):
+        path = _profile_path(profile_id, suffix)
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                return {"format": fmt, "content": f.read()}
+    return None
+
+
+def profiling_stats() -> Dict[str, Any]:
+    with _aggregate_lock:
+        pending = _aggregate_pending
+    return {
+        **_profile_stats,
+        "on_demand_enabled": bool(PROFILE_ADMIN_TOKEN),
+        "sample_every_n": PROFILE_SAMPLE_EVERY_N,
+        "aggregate_pending_requests": pending,
+        "samples_taken": sampler.samples_taken,
+    }
+
+
+# ============================================
+# HANDLER DECORATOR
+# ============================================
+def _run_cprofile(request: ProfileRequest, fn: Callable, args, kwargs):
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            profiler.disable()
+    finally:
+        _cprofile_lock.release()
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        profiler.dump_stats(_profile_path(request.profile_id, ".prof"))
+        text = io.StringIO()
+        pstats.Stats(profiler, stream=text).sort_stats("cumulative").print_stats(60)
+        with open(_profile_path(request.profile_id, ".txt"), "w", encoding="utf-8") as f:
+            f.write(text.getvalue())
+
+
+def _run_sampled(request: ProfileRequest, fn: Callable, args, kwargs):
+    thread_id = threading.get_ident()
+    stacks = sampler.register(thread_id)
+    try:
+        return fn(*args, **kwargs)
+    finally:
+        sampler.unregister(thread_id)
+        if request.profile_id:
+            os.makedirs(PROFILE_DIR, exist_ok=True)
+            _write_collapsed(_profile_path(request.profile_id, ".collapsed"), stacks)
+        if request.aggregate:
+            _add_to_aggregate(stacks)
+
+
+def profile_handler(fn: Callable) -> Callable:
+    """
+    Run a sync endpoint under the profiler the middleware selected
+
+    Apply below the route decorator; a no-op for unprofiled requests.
+    """
+    @wraps(fn)
+    def wrapper(*args, **kwargs):
+        request = _request_profile.get()
+        if request is None:
+            return fn(*args, **kwargs)
+
+        if request.mode == "cprofile":
+            if _cprofile_lock.acquire(blocking=False):
+                return _run_cprofile(request, fn, args, kwargs)
+            # cProfile is process-wide on recent Pythons; fall back to sampling
+            _profile_stats["cprofile_busy"] += 1
+        return _run_sampled(request, fn, args, kwargs)
+
+    return wrapper
+
+
+# ============================================
+# ASGI MIDDLEWARE
+# ============================================
+def _header(scope, name: bytes) -> Optional[str]:
+    for key, value in scope.get("headers", []):
+        if key.lower() == name:
+            return value.decode("latin-1")
+    return None
+
+
+def _token_ok(token: Optional[str]) -> bool:
+    return bool(PROFILE_ADMIN_TOKEN) and token is not None and hmac.compare_digest(token, PROFILE_ADMIN_TOKEN)
+
+
+class ProfilingMiddleware:
+    """
+    Selects requests for profiling and reports the profile id
+
+    On-demand requests need a valid admin token; without one the flag is
+    ignored. Aggregate sampling picks every PROFILE_SAMPLE_EVERY_N-th
+    request to PROFILE_PATHS.
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self._counter = itertools.count(1)
+
+    def _select(self, scope) -> Optional[ProfileRequest]:
+        query = parse_qs(scope.get("query_string", b"").decode("latin-1"))
+        mode = _header(scope, b"x-profile") or (query.get("profile") or [None])[0]
+        # Header only: query strings end up in the access log
+        token = _header(scope, b"x-profile-token")
+
+        aggregate = PROFILE_SAMPLE_EVERY_N > 0 and next(self._counter) % PROFILE_SAMPLE_EVERY_N == 0
+
+        if mode:
+            mode = mode.lower()
+            if mode in MODES and _token_ok(token):
+                _profile_stats["on_demand"] += 1
+                profile_id = f"{time.strftime('%Y%m%d-%H%M%S')}-{uuid.uuid4().hex[:8]}"
+                return ProfileRequest(mode, profile_id, aggregate)
+            logger.warning(f"Ignoring profile request for {scope.get('path')}: bad mode or token")
+
+        if aggregate:
+            _profile_stats["sampled"] += 1
+            return ProfileRequest("sample", None, True)
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or scope.get("path") not in PROFILE_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        request = self._select(scope)
+        if request is None:
+            await self.app(scope, receive, send)
+            return
+
+        token = _request_profile.set(request)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start" and request.profile_id:
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", request.profile_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _request_profile.reset(token)
@@ -1,7 +1,14 @@
+from memory.turn_log import last_turn
+
 sessions = {}
 
 def get_turn(session_id):
     if session_id not in sessions:
-        sessions[session_id]=0
+        # Resume numbering from the turn log so turns stay unique across restarts
+        sessions[session_id]=last_turn(session_id)
     sessions[session_id]+=1
     return sessions[session_id]
+
+def preload_turn(session_id):
+    # Read the counter ahead of the session's first request (startup warm-up)
+    sessions.setdefault(session_id, last_turn(session_id))
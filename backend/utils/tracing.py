@@ -0,0 +1,422 @@
+"""
+Request Tracing
+Span trees per /chat request and background job, with slow-trace capture
+
+Every /chat request opens a trace; its background memory_pipeline job
+opens a second trace under the same trace id, so both halves of a turn
+can be found together. Nested spans cover pipeline stages, LLM calls,
+embedding calls and TinyDB operations. Outside a trace, span() is a
+no-op costing one contextvar lookup.
+
+Finished traces:
+- The slowest TRACE_KEEP_SLOWEST are kept in memory for /debug/traces
+- With TRACE_EXPORT_PATH set, traces at least TRACE_EXPORT_MIN_MS long
+  are appended as OTLP/JSON (one ExportTraceServiceRequest per line) by
+  a background writer, so the request path never touches the disk
+"""
+
+import os
+import json
+import time
+import heapq
+import queue
+import secrets
+import itertools
+import threading
+import contextvars
+from contextlib import contextmanager
+from functools import wraps
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+TRACING_ENABLED = os.getenv("TRACING_ENABLED", "true").lower() == "true"
+TRACE_KEEP_SLOWEST = int(os.getenv("TRACE_KEEP_SLOWEST", "50"))
+TRACE_MAX_SPANS = int(os.getenv("TRACE_MAX_SPANS", "256"))
+TRACE_EXPORT_PATH = os.getenv("TRACE_EXPORT_PATH")
+TRACE_EXPORT_MIN_MS = float(os.getenv("TRACE_EXPORT_MIN_MS", "0"))
+SERVICE_NAME = os.getenv("SERVICE_NAME", "memory-chat-backend")
+# Polled endpoints that would only crowd the buffer (/debug/* is always skipped)
+TRACE_EXCLUDE_PATHS = set(
+    p.strip() for p in os.getenv("TRACE_EXCLUDE_PATHS", "/,/ready,/metrics,/pipeline/status").split(",")
+)
+
+# OTLP span kinds
+KIND_INTERNAL = 1
+KIND_SERVER = 2
+KIND_CLIENT = 3
+
+_current_span: contextvars.ContextVar[Optional["Span"]] = contextvars.ContextVar("current_span", default=None)
+
+
+# ============================================
+# SPANS AND TRACES
+# ============================================
+class Span:
+    __slots__ = ("trace", "span_id", "parent_id", "name", "kind", "start_ns", "end_ns", "attributes", "error")
+
+    def __init__(self, trace: "Trace", name: str, parent_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.trace = trace
+        self.span_id = secrets.token_hex(8)
+        self.parent_id = parent_id
+        self.name = name
+        self.kind = kind
+        self.start_ns = time.time_ns()
+        self.end_ns: Optional[int] = None
+        self.attributes = attributes
+        self.error: Optional[str] = None
+
+    def set_attribute(self, key: str, value: Any) -> None:
+        self.attributes[key] = value
+
+    def end(self, error: Optional[BaseException] = None) -> None:
+        if error is not None:
+            self.error = f"{type(error).__name__}: {error}"
+        if self.end_ns is None:
+            self.end_ns = time.time_ns()
+
+    @property
+    def duration_ms(self) -> float:
+        end = self.end_ns if self.end_ns is not None else time.time_ns()
+        return (end - self.start_ns) / 1e6
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "span_id": self.span_id,
+            "parent_id": self.parent_id,
+            "name": self.name,
+            "start_ms": round((self.start_ns - self.trace.root.start_ns) / 1e6, 3),
+            "duration_ms": round(self.duration_ms, 3),
+            "attributes": self.attributes,
+            "error": self.error,
+        }
+
+
+class Trace:
+    """One root span and its descendants; spans may finish on other threads"""
+
+    def __init__(self, name: str, trace_id: Optional[str], kind: int, attributes: Dict[str, Any]):
+        self.trace_id = trace_id or secrets.token_hex(16)
+        self.spans: List[Span] = []
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self.root = Span(self, name, None, kind, attributes)
+        self.spans.append(self.root)
+
+    def add(self, span: Span) -> bool:
+        with self._lock:
+            if len(self.spans) >= TRACE_MAX_SPANS:
+                self.dropped += 1
+                return False
+            self.spans.append(span)
+            return True
+
+    def to_dict(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "trace_id": self.trace_id,
+            "name": self.root.name,
+            "started_at": self.root.start_ns / 1e9,
+            "duration_ms": round(self.root.duration_ms, 3),
+            "attributes": self.root.attributes,
+            "error": self.root.error,
+            "dropped_spans": self.dropped,
+            "spans": [s.to_dict() for s in sorted(spans, key=lambda s: s.start_ns)],
+        }
+
+
+# ============================================
+# SLOW-TRACE BUFFER AND EXPORT
+# ============================================
+class TraceCollector:
+    """
+    Keeps the slowest finished traces and hands traces to the exporter
+
+    Args:
+        keep: Number of slowest traces to retain
+        export_path: OTLP/JSON lines file, or None to disable export
+        export_min_ms: Only export traces at least this long
+    """
+
+    def __init__(self, keep: int = TRACE_KEEP_SLOWEST, export_path: Optional[str] = TRACE_EXPORT_PATH,
+                 export_min_ms: float = TRACE_EXPORT_MIN_MS):
+        self.keep = keep
+        self.export_path = export_path
+        self.export_min_ms = export_min_ms
+        self._slowest: List = []  # min-heap of (duration_ms, seq, Trace)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+        self.finished = 0
+        self._export_queue: "queue.Queue[Trace]" = queue.Queue(maxsize=10000)
+        self._writer: Optional[threading.Thread] = None
+        self.export_dropped = 0
+
+    def finish(self, trace: Trace) -> None:
+        duration = trace.root.duration_ms
+        with self._lock:
+            self.finished += 1
+            entry = (duration, next(self._seq), trace)
+            if len(self._slowest) < self.keep:
+                heapq.heappush(self._slowest, entry)
+            elif self._slowest and duration > self._slowest[0][0]:
+                heapq.heapreplace(self._slowest, entry)
+
+        if self.export_path and duration >= self.export_min_ms:
+            self._ensure_writer()
+            try:
+                self._export_queue.put_nowait(trace)
+            except queue.Full:
+                self.export_dropped += 1
+
+    def slowest(self, limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            traces = [t for _, _, t in sorted(self._slowest, key=lambda e: e[0], reverse=True)]
+        return [t.to_dict() for t in traces[:limit]]
+
+    def get(self, trace_id: str) -> List[Dict[str, Any]]:
+        """All retained traces (request and background) with this id"""
+        with self._lock:
+            traces = [t for _, _, t in self._slowest if t.trace_id == trace_id]
+        return [t.to_dict() for t in sorted(traces, key=lambda t: t.root.start_ns)]
+
+    def clear(self) -> None:
+        with self._lock:
+            self._slowest.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            kept = len(self._slowest)
+            threshold = self._slowest[0][0] if kept >= self.keep and self._slowest else 0.0
+        return {
+            "enabled": TRACING_ENABLED,
+            "finished": self.finished,
+            "kept": kept,
+            "slowest_threshold_ms": round(threshold, 3),
+            "export_path": self.export_path,
+            "export_dropped": self.export_dropped,
+        }
+
+    # ---------- OTLP/JSON export ----------
+    def _ensure_writer(self) -> None:
+        if self._writer and self._writer.is_alive():
+            return
+        with self._lock:
+            if self._writer and self._writer.is_alive():
+                return
+            self._writer = threading.Thread(target=self._write_loop, name="trace-export", daemon=True)
+            self._writer.start()
+
+    def _write_loop(self) -> None:
+        while True:
+            trace = self._export_queue.get()
+            try:
+                with open(self.export_path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(to_otlp(trace)) + "\n")
+                    # Drain whatever else queued up while the file is open
+                    while not self._export_queue.empty():
+                        f.write(json.dumps(to_otlp(self._export_queue.get_nowait())) + "\n")
+            except Exception as e:
+                logger.warning(f"Trace export failed: {e}")
+
+
+def _otlp_value(value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        return {"boolValue": value}
+    if isinstance(value, int):
+        return {"intValue": str(value)}
+    if isinstance(value, float):
+        return {"doubleValue": value}
+    return {"stringValue": str(value)}
+
+
+def _otlp_attributes(attributes: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [{"key": k, "value": _otlp_value(v)} for k, v in attributes.items() if v is not None]
+
+
+def to_otlp(trace: Trace) -> Dict[str, Any]:
+    """One trace as an OTLP/JSON ExportTraceServiceRequest"""
+    with trace._lock:
+        spans = list(trace.spans)
+    return {
+        "resourceSpans": [{
+            "resource": {"attributes": _otlp_attributes({"service.name": SERVICE_NAME})},
+            "scopeSpans": [{
+                "scope": {"name": __name__},
+                "spans": [
+                    {
+                        "traceId": trace.trace_id,
+                        "spanId": s.span_id,
+                        **({"parentSpanId": s.parent_id} if s.parent_id else {}),
+                        "name": s.name,
+                        "kind": s.kind,
+                        "startTimeUnixNano": str(s.start_ns),
+                        "endTimeUnixNano": str(s.end_ns or s.start_ns),
+                        "attributes": _otlp_attributes(s.attributes),
+                        "status": {"code": 2, "message": s.error} if s.error else {"code": 1},
+                    }
+                    for s in spans
+                ],
+            }],
+        }]
+    }
+
+
+collector = TraceCollector()
+
+
+# ============================================
+# PUBLIC API
+# ============================================
+@contextmanager
+def start_trace(name: str, trace_id: Optional[str] = None, kind: int = KIND_SERVER, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Open a trace with `name` as its root span
+
+    Args:
+        name: Root span name (e.g. "POST /chat", "memory_pipeline")
+        trace_id: Reuse an existing trace id (background work of a request)
+        kind: OTLP span kind of the root
+        **attributes: Root span attributes
+
+    Yields:
+        The root span, or None when tracing is disabled
+    """
+    if not TRACING_ENABLED:
+        yield None
+        return
+
+    trace = Trace(name, trace_id, kind, attributes)
+    token = _current_span.set(trace.root)
+    try:
+        yield trace.root
+    except BaseException as e:
+        trace.root.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        _finish(trace)
+
+
+def _finish(trace: Trace) -> None:
+    if trace.root.end_ns is None:
+        trace.root.end_ns = time.time_ns()
+        collector.finish(trace)
+
+
+@contextmanager
+def span(name: str, kind: int = KIND_INTERNAL, **attributes: Any) -> Iterator[Optional[Span]]:
+    """
+    Child span of the current span; a no-op outside a trace
+
+    Yields:
+        The span (for set_attribute), or None when not tracing
+    """
+    parent = _current_span.get()
+    if parent is None:
+        yield None
+        return
+
+    child = Span(parent.trace, name, parent.span_id, kind, attributes)
+    if not parent.trace.add(child):
+        yield None
+        return
+
+    token = _current_span.set(child)
+    try:
+        yield child
+    except BaseException as e:
+        child.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current_span.reset(token)
+        child.end_ns = time.time_ns()
+
+
+def open_span(name: str, kind: int = KIND_INTERNAL, **attributes: Any) -> Optional[Span]:
+    """
+    Child span of the current span that is not made current; the caller
+    calls span.end(). For work that crosses yields or threads (streams).
+    """
+    parent = _current_span.get()
+    if parent is None:
+        return None
+    child = Span(parent.trace, name, parent.span_id, kind, attributes)
+    return child if parent.trace.add(child) else None
+
+
+def traced(name: str, kind: int = KIND_INTERNAL) -> Callable:
+    """Decorator form of span()"""
+    def decorator(fn: Callable) -> Callable:
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_span.get() is None:
+                return fn(*args, **kwargs)
+            with span(name, kind):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def current_trace_id() -> Optional[str]:
+    current = _current_span.get()
+    return current.trace.trace_id if current else None
+
+
+def set_attribute(key: str, value: Any) -> None:
+    """Set an attribute on the current span, if any"""
+    current = _current_span.get()
+    if current is not None:
+        current.attributes[key] = value
+
+
+# ============================================
+# ASGI MIDDLEWARE
+# ============================================
+class TracingMiddleware:
+    """
+    Opens a trace per HTTP request and returns its id in X-Trace-Id
+
+    The root span ends when the last response body chunk is sent.
+    Starlette runs BackgroundTasks after that inside the same call, and
+    they open their own trace under the same id.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        path = scope.get("path", "")
+        if (not TRACING_ENABLED or scope["type"] != "http"
+                or path in TRACE_EXCLUDE_PATHS or path.startswith("/debug/")):
+            await self.app(scope, receive, send)
+            return
+
+        trace = Trace(f"{scope.get('method', 'GET')} {scope.get('path')}", None, KIND_SERVER, {
+            "http.method": scope.get("method"),
+            "http.target": scope.get("path"),
+        })
+        token = _current_span.set(trace.root)
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                trace.root.attributes["http.status_code"] = message["status"]
+                headers = list(message.get("headers", []))
+                headers.append((b"x-trace-id", trace.trace_id.encode()))
+                message = {**message, "headers": headers}
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                _finish(trace)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        except BaseException as e:
+            trace.root.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _current_span.reset(token)
+            _finish(trace)
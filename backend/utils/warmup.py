@@ -0,0 +1,165 @@
+"""
+Startup Warm-up
+Preloads lazily-built state in the background once the server is up
+
+The store, the LLM and embedding clients and the extraction cache are
+all built on first use, so importing main and binding the port stay
+fast. Without a warm-up the first requests pay for that instead.
+
+start() launches a daemon thread and returns at once, so the startup
+hook does not hold up uvicorn binding the port. Steps run in order
+after WARMUP_DELAY_S; a failing step is logged and the rest still run.
+Hot sessions are then warmed WARMUP_CONCURRENCY at a time, most recent
+first.
+
+ready() backs the /ready probe: true once warm-up is done, disabled, or
+has run longer than WARMUP_READY_TIMEOUT_S (a slow warm-up should delay
+traffic, not keep the instance out of rotation).
+"""
+
+import os
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import logging
+
+logger = logging.getLogger(__name__)
+
+# ============================================
+# CONFIGURATION
+# ============================================
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "false").lower() == "true"
+WARMUP_DELAY_S = float(os.getenv("WARMUP_DELAY_S", "0.5"))
+WARMUP_HOT_SESSIONS = int(os.getenv("WARMUP_HOT_SESSIONS", "200"))
+WARMUP_CONCURRENCY = int(os.getenv("WARMUP_CONCURRENCY", "4"))
+WARMUP_READY_TIMEOUT_S = float(os.getenv("WARMUP_READY_TIMEOUT_S", "60"))
+
+
+class WarmUp:
+    """
+    Ordered, best-effort warm-up steps run on a background thread
+
+    Args:
+        delay_s: Wait before the first step, leaving startup to finish
+        concurrency: Sessions warmed in parallel
+        ready_timeout_s: Report ready after this long regardless
+    """
+
+    def __init__(
+        self,
+        delay_s: float = WARMUP_DELAY_S,
+        concurrency: int = WARMUP_CONCURRENCY,
+        ready_timeout_s: float = WARMUP_READY_TIMEOUT_S
+    ):
+        self.delay_s = delay_s
+        self.concurrency = max(1, concurrency)
+        self.ready_timeout_s = ready_timeout_s
+        self._steps: List[Tuple[str, Callable[[], Any]]] = []
+        self._load_sessions: Optional[Callable[[], List[Tuple[str, Any]]]] = None
+        self._warm_session: Optional[Callable[[str, Any], Any]] = None
+        self._thread: Optional[threading.Thread] = None
+        self._started_at: Optional[float] = None
+        self._progress_lock = threading.Lock()
+        self.state = "idle"
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.sessions = {"total": 0, "warmed": 0, "failed": 0}
+        self.total_ms: Optional[float] = None
+
+    def add_step(self, name: str, fn: Callable[[], Any]) -> None:
+        self._steps.append((name, fn))
+
+    def warm_sessions(
+        self,
+        load: Callable[[], List[Tuple[str, Any]]],
+        warm: Callable[[str, Any], Any]
+    ) -> None:
+        """
+        Warm sessions after the steps
+
+        Args:
+            load: Returns (session_id, payload) pairs, most important first
+            warm: Called as warm(session_id, payload) on the worker pool
+        """
+        self._load_sessions = load
+        self._warm_session = warm
+
+    def start(self) -> None:
+        if self._thread and self._thread.is_alive():
+            return
+        self.state = "pending"
+        self._started_at = time.monotonic()
+        self._thread = threading.Thread(target=self.run, name="warmup", daemon=True)
+        self._thread.start()
+
+    def run(self) -> None:
+        if self.delay_s > 0:
+            time.sleep(self.delay_s)
+        self.state = "running"
+        started = time.perf_counter()
+
+        for name, fn in self._steps:
+            step_started = time.perf_counter()
+            try:
+                detail = fn()
+                ok, error = True, None
+            except Exception as e:
+                detail, ok, error = None, False, str(e)
+                logger.warning("Warm-up step %s failed: %s", name, e)
+            self.results[name] = {
+                "ok": ok,
+                "ms": round((time.perf_counter() - step_started) * 1000, 1),
+                **({"detail": detail} if detail is not None else {}),
+                **({"error": error} if error else {}),
+            }
+
+        if self._load_sessions is not None:
+            self._run_sessions()
+
+        self.total_ms = round((time.perf_counter() - started) * 1000, 1)
+        self.state = "done"
+        logger.info("🔥 Warm-up finished in %.0fms", self.total_ms)
+
+    def _run_sessions(self) -> None:
+        try:
+            sessions = self._load_sessions()
+        except Exception as e:
+            logger.warning("Warm-up could not load hot sessions: %s", e)
+            return
+        with self._progress_lock:
+            self.sessions["total"] = len(sessions)
+
+        def warm_one(item: Tuple[str, Any]) -> None:
+            session_id, payload = item
+            try:
+                self._warm_session(session_id, payload)
+                key = "warmed"
+            except Exception as e:
+                logger.debug("Warm-up of session %s failed: %s", session_id, e)
+                key = "failed"
+            with self._progress_lock:
+                self.sessions[key] += 1
+
+        with ThreadPoolExecutor(max_workers=self.concurrency, thread_name_prefix="warmup") as pool:
+            list(pool.map(warm_one, sessions))
+
+    def ready(self) -> bool:
+        if not WARMUP_ENABLED or self.state == "done":
+            return True
+        return self._started_at is not None and time.monotonic() - self._started_at > self.ready_timeout_s
+
+    def stats(self) -> Dict[str, Any]:
+        with self._progress_lock:
+            sessions = dict(self.sessions)
+        done = sessions["warmed"] + sessions["failed"]
+        return {
+            "enabled": WARMUP_ENABLED,
+            "state": self.state,
+            "ready": self.ready(),
+            "total_ms": self.total_ms,
+            "steps": dict(self.results),
+            "sessions": {
+                **sessions,
+                "progress": round(done / sessions["total"], 3) if sessions["total"] else (1.0 if self.state == "done" else 0.0),
+            },
+        }
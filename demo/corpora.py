@@ -0,0 +1,56 @@
+"""
+Shared message corpora for the demo and load-test scripts
+"""
+
+# ---------------------------
+
+# MEMORY EVENTS (10 memories)
+
+# ---------------------------
+
+memory_events = {
+3: "My preferred call time is after 11 AM.",
+11: "I am vegetarian and I don't eat eggs.",
+18: "I live in Surat.",
+27: "I wake up at 9 AM daily.",
+35: "I am preparing for GATE exam.",
+46: "I like dark mode apps.",
+55: "I am allergic to peanuts.",
+63: "I prefer short answers.",
+72: "I usually sleep at 2 AM.",
+85: "I am working on an AI memory chatbot project."
+}
+
+# ---------------------------
+
+# FILLER CONVERSATIONS
+
+# ---------------------------
+
+small_talk = [
+"Tell me a joke",
+"What is gravity?",
+"Explain WiFi",
+"What is 23 * 67?",
+"Give a random fact",
+"Write a poem",
+"Explain machine learning",
+"What is a black hole?",
+"Explain blockchain",
+"How do airplanes fly?"
+]
+
+# ---------------------------
+
+# RECALL QUESTIONS
+
+# ---------------------------
+
+recall_questions = [
+"When should you call me?",
+"Suggest a breakfast for me.",
+"Do I have any allergies?",
+"What am I preparing for?",
+"What project am I working on?",
+"When do I sleep?"
+]
@@ -0,0 +1,359 @@
+"""
+Concurrent open-loop load test for /chat
+
+Unlike the sequential demo scripts, requests are issued on a fixed
+arrival schedule regardless of how fast earlier ones complete, so the
+numbers reflect what the server does under a given offered load.
+
+- N simulated sessions, each with its own memory facts and turn count
+- Message mix drawn from the demo corpora: memory statements, small
+  talk and recall questions
+- Linear ramp-up to the target RPS, then a steady phase
+- /pipeline/status is polled throughout to track background queue lag,
+  and after the load stops until the background pipeline drains
+
+Writes a JSON report with p50/p95/p99 latency, error rates and queue lag.
+/chat answers 200 with a canned fallback reply when generation fails, so
+those replies count as errors (status "fallback"), and the report adds
+the LLM scheduler's error, rate-limit and queue-timeout counts for the run.
+
+Usage:
+    python demo/load_test.py --sessions 50 --rps 10 --ramp 10 --duration 60
+    python demo/load_test.py --base-url http://127.0.0.1:8000 --report report.json
+"""
+
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+from collections import Counter
+from typing import Any, Dict, List, Optional
+
+import httpx
+
+from corpora import memory_events, small_talk, recall_questions
+
+
+# ---------------------------------------------------------
+# MESSAGE MIX
+# ---------------------------------------------------------
+class SimulatedSession:
+    """One user: states its memory facts over time, small-talks, asks recall questions"""
+
+    def __init__(self, session_id: str, rng: random.Random, memory_ratio: float, recall_ratio: float):
+        self.session_id = session_id
+        self.rng = rng
+        self.memory_ratio = memory_ratio
+        self.recall_ratio = recall_ratio
+        self.facts = list(memory_events.values())
+        rng.shuffle(self.facts)
+        self.turns = 0
+
+    def next_message(self) -> Dict[str, str]:
+        self.turns += 1
+        roll = self.rng.random()
+        if roll < self.memory_ratio and self.facts:
+            return {"kind": "memory", "message": self.facts.pop()}
+        if roll < self.memory_ratio + self.recall_ratio:
+            return {"kind": "recall", "message": self.rng.choice(recall_questions)}
+        return {"kind": "small_talk", "message": self.rng.choice(small_talk)}
+
+
+# ---------------------------------------------------------
+# STATS
+# ---------------------------------------------------------
+# Openings of the replies /chat returns when generation fails (llm/generator.py, main.py)
+FALLBACK_REPLY_PREFIXES = (
+    "I apologize, but I'm experiencing technical difficulties",
+    "I apologize, but I encountered an error",
+    "I'm having trouble generating a response",
+    "I processed your request, but couldn't generate",
+    "I'm currently unable to access my language model",
+)
+
+SCHEDULER_COUNTERS = ("errors", "rate_limited", "queue_timeouts")
+
+
+def is_fallback_reply(body: Any) -> bool:
+    reply = body.get("reply") if isinstance(body, dict) else None
+    return isinstance(reply, str) and reply.startswith(FALLBACK_REPLY_PREFIXES)
+
+
+def _scheduler_counters(status: Dict[str, Any]) -> Dict[str, Dict[str, int]]:
+    classes = (status.get("llm_scheduler") or {}).get("classes") or {}
+    return {
+        name: {key: counters.get(key, 0) for key in SCHEDULER_COUNTERS}
+        for name, counters in classes.items()
+    }
+
+
+def scheduler_deltas(before: Optional[Dict[str, Any]], after: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
+    """Per-class scheduler error counters accrued between two status snapshots"""
+    if before is None or after is None:
+        return None
+    start, end = _scheduler_counters(before), _scheduler_counters(after)
+    return {
+        name: {key: value - start.get(name, {}).get(key, 0) for key, value in counters.items()}
+        for name, counters in end.items()
+    }
+
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, int(round(pct / 100 * len(ordered))) - 1))
+    return round(ordered[index], 2)
+
+
+def latency_summary(values: List[float]) -> Dict[str, Any]:
+    return {
+        "count": len(values),
+        "mean_ms": round(sum(values) / len(values), 2) if values else None,
+        "p50_ms": percentile(values, 50),
+        "p95_ms": percentile(values, 95),
+        "p99_ms": percentile(values, 99),
+        "max_ms": round(max(values), 2) if values else None,
+    }
+
+
+def _queue_depth(status: Dict[str, Any]) -> Dict[str, Any]:
+    """Pull the background-lag signals out of a /pipeline/status snapshot"""
+    guard = status.get("guard") or {}
+    scheduler = status.get("llm_scheduler") or {}
+    reflection = status.get("reflection_jobs") or {}
+    return {
+        "pipeline_pending": guard.get("pending", 0),
+        "deferred_backlog": status.get("deferred_backlog", 0),
+        "shedding": guard.get("shedding", False),
+        "llm_waiting": scheduler.get("waiting", 0),
+        "reflection_pending": reflection.get("pending", 0),
+    }
+
+
+def _is_drained(depth: Dict[str, Any]) -> bool:
+    return not (depth["pipeline_pending"] or depth["deferred_backlog"] or depth["llm_waiting"])
+
+
+# ---------------------------------------------------------
+# LOAD GENERATION
+# ---------------------------------------------------------
+async def _send(client: httpx.AsyncClient, url: str, session: SimulatedSession,
+                phase: str, results: List[Dict[str, Any]], timeout: float) -> None:
+    item = session.next_message()
+    started = time.perf_counter()
+    record = {"phase": phase, "kind": item["kind"]}
+    try:
+        response = await client.post(
+            url,
+            json={"session_id": session.session_id, "message": item["message"]},
+            timeout=timeout
+        )
+        record["status"] = response.status_code
+        if response.status_code == 200 and is_fallback_reply(response.json()):
+            record["status"] = "fallback"
+    except ValueError:
+        record["status"] = "error:invalid_json"
+    except httpx.TimeoutException:
+        record["status"] = "timeout"
+    except httpx.HTTPError as e:
+        record["status"] = f"error:{type(e).__name__}"
+    record["latency_ms"] = (time.perf_counter() - started) * 1000
+    results.append(record)
+
+
+async def _poll_status(client: httpx.AsyncClient, url: str, samples: List[Dict[str, Any]],
+                       stop: asyncio.Event, started: float, interval: float) -> None:
+    while not stop.is_set():
+        try:
+            response = await client.get(url, timeout=5)
+            if response.status_code == 200:
+                samples.append({"t": round(time.perf_counter() - started, 2), **_queue_depth(response.json())})
+        except httpx.HTTPError:
+            pass
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+
+async def _get_status(client: httpx.AsyncClient, url: str) -> Optional[Dict[str, Any]]:
+    try:
+        response = await client.get(url, timeout=5)
+        if response.status_code == 200:
+            return response.json()
+    except (httpx.HTTPError, ValueError):
+        pass
+    return None
+
+
+async def run_load(args: argparse.Namespace) -> Dict[str, Any]:
+    rng = random.Random(args.seed)
+    run_id = f"load_{int(time.time())}"
+    sessions = [
+        SimulatedSession(f"{run_id}_{i}", random.Random(rng.random()), args.memory_ratio, args.recall_ratio)
+        for i in range(args.sessions)
+    ]
+    chat_url = args.base_url.rstrip("/") + "/chat"
+    status_url = args.base_url.rstrip("/") + "/pipeline/status"
+
+    results: List[Dict[str, Any]] = []
+    status_samples: List[Dict[str, Any]] = []
+    in_flight = set()
+    dropped = 0
+
+    limits = httpx.Limits(max_connections=args.max_in_flight, max_keepalive_connections=args.max_in_flight)
+    async with httpx.AsyncClient(limits=limits) as client:
+        status_before = await _get_status(client, status_url)
+        started = time.perf_counter()
+        stop_polling = asyncio.Event()
+        poller = asyncio.create_task(
+            _poll_status(client, status_url, status_samples, stop_polling, started, args.poll_interval)
+        )
+
+        total = args.ramp + args.duration
+        next_arrival = 0.0
+        while next_arrival < total:
+            # Open loop: sleep until the scheduled arrival, never for a response
+            delay = started + next_arrival - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+
+            phase = "ramp" if next_arrival < args.ramp else "steady"
+            if len(in_flight) >= args.max_in_flight:
+                dropped += 1
+            else:
+                task = asyncio.create_task(
+                    _send(client, chat_url, rng.choice(sessions), phase, results, args.timeout)
+                )
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+
+            # Linear ramp from ~0 to the target rate, then constant
+            rate = args.rps if next_arrival >= args.ramp else max(args.rps * next_arrival / args.ramp, args.rps * 0.05)
+            gap = 1.0 / rate
+            next_arrival += rng.expovariate(1.0 / gap) if args.poisson else gap
+
+        load_elapsed = time.perf_counter() - started
+        if in_flight:
+            await asyncio.gather(*in_flight, return_exceptions=True)
+
+        # Background queue lag: how long until the pipeline has caught up
+        drain_started = time.perf_counter()
+        drained_after = None
+        while time.perf_counter() - drain_started < args.drain_timeout:
+            try:
+                response = await client.get(status_url, timeout=5)
+                if response.status_code == 200 and _is_drained(_queue_depth(response.json())):
+                    drained_after = round(time.perf_counter() - drain_started, 2)
+                    break
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(args.poll_interval)
+
+        stop_polling.set()
+        await poller
+        status_after = await _get_status(client, status_url)
+
+    return build_report(
+        args, results, status_samples, dropped, load_elapsed, drained_after,
+        scheduler_deltas(status_before, status_after)
+    )
+
+
+# ---------------------------------------------------------
+# REPORT
+# ---------------------------------------------------------
+def build_report(args: argparse.Namespace, results: List[Dict[str, Any]], status_samples: List[Dict[str, Any]],
+                 dropped: int, load_elapsed: float, drained_after: Optional[float],
+                 llm_errors: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    steady = [r for r in results if r["phase"] == "steady"]
+    ok = [r["latency_ms"] for r in steady if r["status"] == 200]
+    statuses = Counter(str(r["status"]) for r in results)
+    errors = sum(1 for r in results if r["status"] != 200)
+
+    by_kind = {}
+    for kind in ("memory", "small_talk", "recall"):
+        by_kind[kind] = latency_summary([r["latency_ms"] for r in steady if r["kind"] == kind and r["status"] == 200])
+
+    def series_max(key: str) -> Any:
+        return max((s[key] for s in status_samples), default=None)
+
+    return {
+        "config": {
+            "base_url": args.base_url,
+            "sessions": args.sessions,
+            "target_rps": args.rps,
+            "ramp_s": args.ramp,
+            "duration_s": args.duration,
+            "arrivals": "poisson" if args.poisson else "uniform",
+            "memory_ratio": args.memory_ratio,
+            "recall_ratio": args.recall_ratio,
+            "seed": args.seed,
+        },
+        "requests": {
+            "sent": len(results),
+            "dropped_client_side": dropped,
+            "achieved_rps_steady": round(len(steady) / args.duration, 2) if args.duration else None,
+            "load_elapsed_s": round(load_elapsed, 2),
+        },
+        "latency_steady": latency_summary(ok),
+        "latency_steady_by_kind": by_kind,
+        "errors": {
+            "count": errors,
+            "rate": round(errors / len(results), 4) if results else 0.0,
+            "by_status": dict(statuses),
+            "fallback_replies": statuses.get("fallback", 0),
+            "llm_scheduler": llm_errors,
+        },
+        "background": {
+            "samples": len(status_samples),
+            "max_pipeline_pending": series_max("pipeline_pending"),
+            "max_deferred_backlog": series_max("deferred_backlog"),
+            "max_llm_waiting": series_max("llm_waiting"),
+            "max_reflection_pending": series_max("reflection_pending"),
+            "shedding_samples": sum(1 for s in status_samples if s["shedding"]),
+            "drained_after_s": drained_after,
+            "series": status_samples if args.include_series else None,
+        },
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Open-loop concurrent load test for /chat")
+    parser.add_argument("--base-url", default="http://127.0.0.1:8000")
+    parser.add_argument("--sessions", type=int, default=20, help="Concurrent simulated sessions")
+    parser.add_argument("--rps", type=float, default=5.0, help="Target requests per second (steady phase)")
+    parser.add_argument("--ramp", type=float, default=10.0, help="Ramp-up seconds")
+    parser.add_argument("--duration", type=float, default=60.0, help="Steady-phase seconds")
+    parser.add_argument("--poisson", action="store_true", help="Poisson arrivals instead of evenly spaced")
+    parser.add_argument("--memory-ratio", type=float, default=0.15, help="Share of messages stating a memory")
+    parser.add_argument("--recall-ratio", type=float, default=0.10, help="Share of recall questions")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout (s)")
+    parser.add_argument("--max-in-flight", type=int, default=500, help="Client-side cap; arrivals beyond it are dropped")
+    parser.add_argument("--poll-interval", type=float, default=1.0, help="/pipeline/status polling interval (s)")
+    parser.add_argument("--drain-timeout", type=float, default=120.0, help="Max wait for the background pipeline to drain")
+    parser.add_argument("--include-series", action="store_true", help="Include the raw queue-depth time series")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--report", help="Write the JSON report here (default: stdout)")
+    args = parser.parse_args()
+
+    if args.rps <= 0 or args.sessions <= 0:
+        parser.error("--rps and --sessions must be positive")
+    args.ramp = max(args.ramp, 0.0)
+
+    report = asyncio.run(run_load(args))
+    output = json.dumps(report, indent=2)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            f.write(output)
+        print(f"Report written to {args.report}", file=sys.stderr)
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
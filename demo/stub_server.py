@@ -0,0 +1,325 @@
+"""
+Local stand-in for the Groq and HuggingFace APIs
+
+Lets the real backend pipeline run (and be load-tested) offline, without
+API keys. Implements:
+
+- POST /openai/v1/chat/completions   Groq / OpenAI chat completions (+ SSE streaming)
+- POST /v1/chat/completions          same, for plain OpenAI clients
+- POST /pipeline/feature-extraction/{model}   HF Inference API embeddings
+- POST /models/{model}                         same, newer HF URL shape
+- GET  /stats                                  request counters
+
+Requests are recognised by their system prompt: single and batched
+memory extraction get scripted JSON (rule-based by default, overridable
+with --script), reflection gets a JSON list, anything else gets a
+generated chat reply. Latency, error and 429 behaviour are configurable.
+
+Usage:
+    python demo/stub_server.py --port 9000 --latency-dist lognormal --latency-ms 400
+
+    # then start the backend against it
+    GROQ_API_KEY=stub GROQ_BASE_URL=http://127.0.0.1:9000 \\
+    HF_TOKEN=stub HF_API_URL=http://127.0.0.1:9000/pipeline/feature-extraction/all-MiniLM-L6-v2 \\
+    uvicorn main:app --app-dir backend
+"""
+
+import os
+import sys
+import json
+import time
+import uuid
+import random
+import asyncio
+import argparse
+from collections import Counter, deque
+from typing import Any, Dict, List, Optional
+
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, StreamingResponse
+import uvicorn
+
+# Reuse the backend's offline extractor and hashing embedder
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "backend")
+sys.path.insert(0, os.path.abspath(BACKEND_DIR))
+
+from llm.stub_llm import stub_extract_memory  # noqa: E402
+from llm.extraction_cache import normalize_message  # noqa: E402
+from memory.embeddings import HashingProvider  # noqa: E402
+
+
+# ---------------------------------------------------------
+# BEHAVIOUR CONFIG
+# ---------------------------------------------------------
+class LatencyModel:
+    """Samples delays in seconds from a named distribution"""
+
+    def __init__(self, dist: str, ms: float, sigma: float = 0.5):
+        self.dist = dist
+        self.ms = ms
+        self.sigma = sigma
+
+    def sample(self) -> float:
+        if self.ms <= 0:
+            return 0.0
+        if self.dist == "fixed":
+            ms = self.ms
+        elif self.dist == "uniform":
+            ms = random.uniform(0.5 * self.ms, 1.5 * self.ms)
+        elif self.dist == "exponential":
+            ms = random.expovariate(1.0 / self.ms)
+        else:  # lognormal, ms is the median
+            ms = random.lognormvariate(0.0, self.sigma) * self.ms
+        return ms / 1000.0
+
+
+class Behaviour:
+    def __init__(self, args: argparse.Namespace):
+        self.chat_latency = LatencyModel(args.latency_dist, args.latency_ms, args.latency_sigma)
+        self.embed_latency = LatencyModel(args.latency_dist, args.embed_latency_ms, args.latency_sigma)
+        self.token_interval = args.token_interval_ms / 1000.0
+        self.reply_tokens = args.reply_tokens
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.rpm = args.rpm
+        self.retry_after = args.retry_after
+        self.script: Dict[str, Any] = {}
+        if args.script:
+            with open(args.script, "r", encoding="utf-8") as f:
+                self.script = {normalize_message(k): v for k, v in json.load(f).items()}
+
+
+stats = Counter()
+_recent_requests: deque = deque()
+embedder = HashingProvider()
+
+app = FastAPI(title="LLM/Embedding stub")
+
+
+# ---------------------------------------------------------
+# FAILURE INJECTION
+# ---------------------------------------------------------
+def _error(status: int, message: str, kind: str, headers: Optional[Dict[str, str]] = None) -> JSONResponse:
+    return JSONResponse(
+        status_code=status,
+        content={"error": {"message": message, "type": kind, "code": kind}},
+        headers=headers
+    )
+
+
+def _injected_failure() -> Optional[JSONResponse]:
+    """429 from the RPM window or random injection, or a random 5xx"""
+    now = time.monotonic()
+    if behaviour.rpm > 0:
+        while _recent_requests and now - _recent_requests[0] > 60:
+            _recent_requests.popleft()
+        if len(_recent_requests) >= behaviour.rpm:
+            stats["rate_limited"] += 1
+            wait = max(0.1, 60 - (now - _recent_requests[0]))
+            return _error(429, "Rate limit reached (requests per minute)", "rate_limit_exceeded",
+                          {"retry-after": f"{wait:.2f}"})
+        _recent_requests.append(now)
+
+    roll = random.random()
+    if roll < behaviour.rate_limit_rate:
+        stats["rate_limited"] += 1
+        return _error(429, "Rate limit reached (injected)", "rate_limit_exceeded",
+                      {"retry-after": str(behaviour.retry_after)})
+    if roll < behaviour.rate_limit_rate + behaviour.error_rate:
+        stats["errors"] += 1
+        return _error(503, "Service unavailable (injected)", "service_unavailable")
+    return None
+
+
+# ---------------------------------------------------------
+# SCRIPTED CONTENT
+# ---------------------------------------------------------
+def _extract(message: str) -> Optional[Dict[str, Any]]:
+    key = normalize_message(message)
+    if key in behaviour.script:
+        return behaviour.script[key]
+    return stub_extract_memory(message)
+
+
+def _classify(messages: List[Dict[str, Any]]) -> str:
+    system = next((m.get("content", "") for m in messages if m.get("role") == "system"), "")
+    if "## BATCH MODE" in system:
+        return "batch_extraction"
+    if "memory extraction system" in system:
+        return "extraction"
+    if "reflection engine" in system:
+        return "reflection"
+    return "generation"
+
+
+def _content_for(kind: str, messages: List[Dict[str, Any]]) -> str:
+    user = next((m.get("content", "") for m in reversed(messages) if m.get("role") == "user"), "")
+
+    if kind == "extraction":
+        return json.dumps(_extract(user))
+
+    if kind == "batch_extraction":
+        try:
+            items = json.loads(user)
+        except json.JSONDecodeError:
+            items = []
+        return json.dumps([
+            {"id": item.get("id", i), "memory": _extract(item.get("message", ""))}
+            for i, item in enumerate(items)
+        ])
+
+    if kind == "reflection":
+        return json.dumps([
+            "The user values practical, concrete help.",
+            "The user plans ahead and cares about routines.",
+            "The user prefers concise communication.",
+        ])
+
+    # Generation: echo the question and pad to the configured length
+    words = f"Stub reply to: {user}".split()
+    filler = "This is a placeholder answer generated locally for load testing.".split()
+    while len(words) < behaviour.reply_tokens:
+        words.extend(filler)
+    return " ".join(words[:max(behaviour.reply_tokens, 1)])
+
+
+def _usage(messages: List[Dict[str, Any]], content: str) -> Dict[str, int]:
+    prompt = sum(len(str(m.get("content", "")).split()) for m in messages)
+    completion = len(content.split())
+    return {"prompt_tokens": prompt, "completion_tokens": completion, "total_tokens": prompt + completion}
+
+
+# ---------------------------------------------------------
+# CHAT COMPLETIONS
+# ---------------------------------------------------------
+@app.post("/openai/v1/chat/completions")
+@app.post("/v1/chat/completions")
+async def chat_completions(request: Request):
+    body = await request.json()
+    messages = body.get("messages", [])
+    model = body.get("model", "stub-model")
+    kind = _classify(messages)
+    stats[f"chat.{kind}"] += 1
+
+    failure = _injected_failure()
+    if failure is not None:
+        return failure
+
+    content = _content_for(kind, messages)
+    completion_id = f"chatcmpl-{uuid.uuid4().hex[:24]}"
+    created = int(time.time())
+
+    if not body.get("stream"):
+        await asyncio.sleep(behaviour.chat_latency.sample())
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": content},
+                "finish_reason": "stop",
+            }],
+            "usage": _usage(messages, content),
+        }
+
+    async def events():
+        # Time to first token, then one token per interval
+        await asyncio.sleep(behaviour.chat_latency.sample())
+        pieces = content.split(" ")
+        for i, piece in enumerate(pieces):
+            chunk = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{
+                    "index": 0,
+                    "delta": {"role": "assistant", "content": piece if i == 0 else " " + piece},
+                    "finish_reason": None,
+                }],
+            }
+            yield f"data: {json.dumps(chunk)}\n\n"
+            if behaviour.token_interval:
+                await asyncio.sleep(behaviour.token_interval)
+        final = {
+            "id": completion_id,
+            "object": "chat.completion.chunk",
+            "created": created,
+            "model": model,
+            "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}],
+        }
+        yield f"data: {json.dumps(final)}\n\n"
+        yield "data: [DONE]\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream")
+
+
+# ---------------------------------------------------------
+# FEATURE EXTRACTION (EMBEDDINGS)
+# ---------------------------------------------------------
+@app.post("/pipeline/feature-extraction/{model:path}")
+@app.post("/models/{model:path}")
+async def feature_extraction(model: str, request: Request):
+    body = await request.json()
+    inputs = body.get("inputs", [])
+    single = isinstance(inputs, str)
+    texts = [inputs] if single else list(inputs)
+    stats["embeddings.requests"] += 1
+    stats["embeddings.texts"] += len(texts)
+
+    failure = _injected_failure()
+    if failure is not None:
+        return failure
+
+    await asyncio.sleep(behaviour.embed_latency.sample())
+    vectors = embedder.embed(texts).tolist()
+    return vectors[0] if single else vectors
+
+
+@app.get("/stats")
+def get_stats():
+    return dict(stats)
+
+
+# ---------------------------------------------------------
+# CLI
+# ---------------------------------------------------------
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description="Local Groq/HF stand-in for offline load tests")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9000)
+    parser.add_argument("--latency-dist", choices=["fixed", "uniform", "exponential", "lognormal"], default="lognormal")
+    parser.add_argument("--latency-ms", type=float, default=300, help="Chat latency / time to first token (median for lognormal)")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="Lognormal shape (higher = heavier tail)")
+    parser.add_argument("--embed-latency-ms", type=float, default=50)
+    parser.add_argument("--token-interval-ms", type=float, default=10, help="Delay between streamed tokens")
+    parser.add_argument("--reply-tokens", type=int, default=60, help="Words per generated reply")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="Probability of a 503")
+    parser.add_argument("--rate-limit-rate", type=float, default=0.0, help="Probability of an injected 429")
+    parser.add_argument("--rpm", type=int, default=0, help="Enforce a requests-per-minute limit (0 = off)")
+    parser.add_argument("--retry-after", type=float, default=1.0, help="Retry-After seconds on injected 429s")
+    parser.add_argument("--script", help="JSON file mapping user messages to extraction results (or null)")
+    parser.add_argument("--seed", type=int, help="Random seed for reproducible runs")
+    return parser
+
+
+# Defaults, so `uvicorn stub_server:app` works without the CLI
+behaviour = Behaviour(build_parser().parse_args([]))
+
+
+def main():
+    global behaviour
+
+    args = build_parser().parse_args()
+
+    if args.seed is not None:
+        random.seed(args.seed)
+    behaviour = Behaviour(args)
+
+    uvicorn.run(app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()